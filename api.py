@@ -9,32 +9,75 @@ import json
 import datetime
 import logging
 import hashlib
+import signal
+import hmac
+import time
 import uuid
 from argparse import ArgumentParser
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import BaseHTTPRequestHandler
 
 from store import Store
+from backends import BACKENDS
+from cache import LRUCache
+from logger import setup_logging, log_request_line, log_slow_request
+from servers import make_server, PreforkSupervisor, DEFAULT_BACKLOG, \
+    DEFAULT_KEEPALIVE_TIMEOUT, DEFAULT_KEEPALIVE_REQUESTS
 from api_requests import ClientsInterestsRequest, OnlineScoreRequest, MethodRequest
-from scoring import get_score, get_interests
-from custom_erros import ValidationError
+from scoring import get_score, get_score_many, get_interests_many
+from custom_erros import ValidationError, StoreUnavailableError
+from breaker import deadline
+from metrics import CONTENT_TYPE, INTERESTS_BATCH, REGISTRY, observe_request
+from timings import Phase, finish_timings, server_timing, start_timings
+from profiler import PROFILER, DEFAULT_RATE, DEFAULT_INTERVAL, DEFAULT_KEEP
 from constants import SALT, ADMIN_SALT, OK, BAD_REQUEST, FORBIDDEN, \
     NOT_FOUND, INVALID_REQUEST, INTERNAL_ERROR, ERRORS
 
+MAX_BATCH_SIZE = 1000
+AUTH_CACHE_SIZE = 10000
+DEFAULT_REQUEST_DEADLINE = 2
+BATCH_METHODS = ('online_score', 'clients_interests')
+
+
+# ожидаемые дайджесты пользователей по (account, login)
+USER_DIGESTS = LRUCache(maxsize=AUTH_CACHE_SIZE, ttl=float('inf'))
+# дайджест администратора и момент, до которого он действителен
+_admin_digest = (0, None)
+
+
+def get_admin_digest():
+    """Дайджест администратора, пересчитывается при смене часа"""
+    global _admin_digest
+    valid_until, digest = _admin_digest
+    if time.time() >= valid_until:
+        now = datetime.datetime.now()
+        digest = hashlib.sha512((now.strftime("%Y%m%d%H") + ADMIN_SALT).encode('utf-8')).hexdigest()
+        next_hour = now.replace(minute=0, second=0, microsecond=0) + datetime.timedelta(hours=1)
+        _admin_digest = (next_hour.timestamp(), digest)
+    return digest
+
+
+def get_user_digest(account, login):
+    """Дайджест пользователя из кэша или вычисленный заново"""
+    key = (account, login)
+    digest = USER_DIGESTS.get(key)
+    if digest is None:
+        digest = hashlib.sha512((account + login + SALT).encode('utf-8')).hexdigest()
+        USER_DIGESTS.set(key, digest)
+    return digest
+
 
 def check_auth(request):
     """Проверка авторизации"""
-    logging.info('Trying authorization as "%s"', request.login)
+    logging.debug('Trying authorization as "%s"', request.login)
     if request.is_admin:
-        digest = hashlib.sha512(
-            (datetime.datetime.now().strftime("%Y%m%d%H") + ADMIN_SALT).encode(
-                'utf-8')).hexdigest()
+        digest = get_admin_digest()
     else:
-        digest = hashlib.sha512((request.account + request.login + SALT).encode(
-            'utf-8')).hexdigest()
-    if digest == request.token:
-        logging.info('Authorization success')
+        digest = get_user_digest(request.account, request.login)
+    token = request.token or ''
+    if hmac.compare_digest(digest.encode('utf-8'), token.encode('utf-8')):
+        logging.debug('Authorization success')
         return True
-    logging.info('Authorization failed, expected "%s",\n but "%s" received', digest, request.token)
+    logging.debug('Authorization failed for "%s"', request.login)
     return False
 
 
@@ -42,8 +85,11 @@ def authorization(func):
     """Проверка авторизации перед выполнением func"""
     def wrapper(request, ctx, store):
         response, code = ERRORS.get(FORBIDDEN), FORBIDDEN
-        if check_auth(request):
-            response, code = func(request, ctx, store)
+        with Phase('auth'):
+            authorized = check_auth(request)
+        if authorized:
+            with Phase('handler'):
+                response, code = func(request, ctx, store)
         return response, code
 
     return wrapper
@@ -51,16 +97,20 @@ def authorization(func):
 
 def method_handler(request, ctx, store):
     """Обработчик имеющихся методов"""
+    if isinstance(request.get('body'), list):
+        with Phase('handler'):
+            return batch_method_handler(request.get('body'), ctx, store)
     try:
         req = MethodRequest()
-        req.validate(request.get('body'))
-        logging.info('Requested method value: "%s"', req.method)
+        with Phase('validate'):
+            req.validate(request.get('body'))
+        logging.debug('Requested method value: "%s"', req.method)
         if req.method == 'online_score':
             response, code = online_score_handler(req, ctx, store)
         elif req.method == 'clients_interests':
             response, code = clients_interests_handler(req, ctx, store)
         else:
-            logging.info('Unavailable method value')
+            logging.debug('Unavailable method value')
             response, code = ERRORS.get(INVALID_REQUEST), INVALID_REQUEST
         return response, code
     except ValidationError:
@@ -72,7 +122,8 @@ def online_score_handler(req, ctx, store):
     """Обработчик для online_score"""
     arguments = req.arguments
     online_score = OnlineScoreRequest()
-    online_score.validate(arguments)
+    with Phase('validate'):
+        online_score.validate(arguments)
     ctx['has'] = [key for key, val in arguments.items() if val is not None]
     if req.is_admin:
         score = int(ADMIN_SALT)
@@ -82,7 +133,7 @@ def online_score_handler(req, ctx, store):
                           online_score.gender, online_score.first_name,
                           online_score.last_name)
     response = {'score': score}
-    logging.info('Score: %s', score)
+    logging.debug('Score: %s', score)
     return response, OK
 
 
@@ -90,20 +141,157 @@ def online_score_handler(req, ctx, store):
 def clients_interests_handler(req, ctx, store):
     """Обработчик для clients_interests"""
     clients_interests = ClientsInterestsRequest()
-    clients_interests.validate(req.arguments)
+    with Phase('validate'):
+        clients_interests.validate(req.arguments)
     ctx['nclients'] = len(clients_interests.client_ids)
-    interests = {_id: get_interests(store, _id) for _id in
-                 clients_interests.client_ids}
-    logging.info('Client interest: %s', interests)
+    INTERESTS_BATCH.observe(len(clients_interests.client_ids))
+    interests = get_interests_many(store, clients_interests.client_ids)
+    logging.debug('Client interest: %s', interests)
     return interests, OK
 
 
+def profile_handler(request, ctx, store):
+    """Включение и выключение профилирования запросов, доступно только администратору
+
+    arguments: enabled - true/false, rate - профилируется один запрос из rate.
+    """
+    try:
+        req = MethodRequest()
+        req.validate(request.get('body'))
+    except ValidationError:
+        return ERRORS.get(INVALID_REQUEST), INVALID_REQUEST
+    if not req.is_admin or not check_auth(req):
+        return ERRORS.get(FORBIDDEN), FORBIDDEN
+    enabled, rate = req.arguments.get('enabled'), req.arguments.get('rate')
+    if enabled is not None and not isinstance(enabled, bool) or \
+            rate is not None and (not isinstance(rate, int) or isinstance(rate, bool) or rate < 1):
+        return 'enabled must be a boolean, rate a positive integer', INVALID_REQUEST
+    return PROFILER.configure(enabled=enabled, rate=rate), OK
+
+
+def metrics_handler(request, ctx, store):
+    """Метрики процесса в текстовом формате Prometheus"""
+    return REGISTRY.expose(), OK
+
+
+def request_method(request):
+    """Метод запроса для меток метрик, неизвестные методы учитываются вместе"""
+    if isinstance(request, list):
+        return 'batch'
+    method = request.get('method') if isinstance(request, dict) else None
+    return method if method in BATCH_METHODS else 'unknown'
+
+
+def build_response(response, code):
+    """Тело ответа для кода code"""
+    if code not in ERRORS:
+        return {"response": response, "code": code}
+    return {"error": response or ERRORS.get(code, "Unknown Error"), "code": code}
+
+
+def batch_method_handler(requests, ctx, store):
+    """Обработчик массива запросов к методам
+
+    Авторизация проверяется один раз для каждой тройки account, login, token,
+    обращения к хранилищу для всех запросов массива группируются.
+    """
+    if len(requests) > MAX_BATCH_SIZE:
+        return f'Batch size must not exceed {MAX_BATCH_SIZE}', INVALID_REQUEST
+    ctx['batch_size'] = len(requests)
+    results = [None] * len(requests)
+    authorized = {}
+    scores, interests = [], []
+    for i, body in enumerate(requests):
+        try:
+            if not isinstance(body, dict):
+                raise ValidationError('Batch item must be an object')
+            req = MethodRequest()
+            with Phase('validate'):
+                req.validate(body)
+            if req.method not in BATCH_METHODS:
+                raise ValidationError(f'Unavailable method value "{req.method}"')
+            # пустые arguments и account поля пропускают, элементу пакета они нужны
+            if req.arguments is None:
+                raise ValidationError('Arguments must be an object')
+            if req.account is None and not req.is_admin:
+                raise ValidationError('Account is required')
+            auth_key = (req.account, req.login, req.token)
+            if auth_key not in authorized:
+                with Phase('auth'):
+                    authorized[auth_key] = check_auth(req)
+            if not authorized[auth_key]:
+                results[i] = build_response(None, FORBIDDEN)
+            elif req.method == 'online_score':
+                online_score = OnlineScoreRequest()
+                with Phase('validate'):
+                    online_score.validate(req.arguments)
+                if req.is_admin:
+                    results[i] = build_response({'score': int(ADMIN_SALT)}, OK)
+                else:
+                    scores.append((i, online_score))
+            else:
+                clients_interests = ClientsInterestsRequest()
+                with Phase('validate'):
+                    clients_interests.validate(req.arguments)
+                INTERESTS_BATCH.observe(len(clients_interests.client_ids))
+                interests.append((i, clients_interests))
+        except ValidationError as e:
+            logging.debug('Batch item %s is invalid: %s', i, e)
+            results[i] = build_response(None, INVALID_REQUEST)
+
+    if scores:
+        values = get_score_many(store, [
+            (r.phone, r.email, r.birthday, r.gender, r.first_name, r.last_name)
+            for _, r in scores])
+        for (i, _), score in zip(scores, values):
+            results[i] = build_response({'score': score}, OK)
+    if interests:
+        found = get_interests_many(store, [cid for _, r in interests for cid in r.client_ids])
+        for i, r in interests:
+            results[i] = build_response({cid: found[cid] for cid in r.client_ids}, OK)
+    return results, OK
+
+
 class MainHTTPHandler(BaseHTTPRequestHandler):
     """Главный обработчик запросов"""
     router = {
-        "method": method_handler
+        "method": method_handler,
+        "metrics": metrics_handler,
+        "profile": profile_handler,
     }
+    # маршруты, отвечающие на GET текстом, а не json
+    text_routes = ("metrics",)
     store = Store()
+    protocol_version = "HTTP/1.1"
+    # заголовки и тело ответа уходят отдельными пакетами, без TCP_NODELAY второй ждет ACK клиента
+    disable_nagle_algorithm = True
+    # время простоя соединения до закрытия, в секундах
+    timeout = DEFAULT_KEEPALIVE_TIMEOUT
+    max_keepalive_requests = DEFAULT_KEEPALIVE_REQUESTS
+    # бюджет времени на обращения к хранилищу за один запрос, в секундах
+    request_deadline = DEFAULT_REQUEST_DEADLINE
+    # время фаз запроса в заголовке Server-Timing
+    timing_header = False
+    # запросы дольше порога в секундах пишутся в лог с разбивкой по фазам, None - отключено
+    slow_request_threshold = None
+
+    def setup(self):
+        super().setup()
+        self.requests_handled = 0
+
+    def handle(self):
+        """Обработка запросов соединения, ожидание следующего учитывается сервером как простой"""
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection:
+            with self.server.idle(self.connection):
+                try:
+                    ready = self.rfile.peek(1)
+                except OSError:
+                    ready = b''
+            if not ready:
+                break
+            self.handle_one_request()
 
     @staticmethod
     def get_request_id(headers):
@@ -111,59 +299,183 @@ class MainHTTPHandler(BaseHTTPRequestHandler):
         return headers.get('HTTP_X_REQUEST_ID', uuid.uuid4().hex)
 
     def do_POST(self):
-        """Обработка POST запросов"""
+        """Обработка POST запросов, часть запросов выполняется под профилировщиком"""
+        PROFILER.call(self.handle_post)
+
+    def handle_post(self):
+        start = time.monotonic()
+        timings = start_timings()
         response, code = {}, OK
-        context = {"request_id": self.get_request_id(self.headers)}
-        logging.info('New request context: %s', context)
+        context = {"request_id": self.get_request_id(self.headers), "path": self.path}
         request = None
         try:
-            data_string = self.rfile.read(int(self.headers['Content-Length']))
-            request = json.loads(data_string)
-            logging.info('Received request: %s', request)
+            with Phase('read'):
+                data_string = self.rfile.read(int(self.headers['Content-Length']))
+            with Phase('json'):
+                request = json.loads(data_string)
+            logging.debug('Received request: %s', request)
         except Exception as e:
             code = BAD_REQUEST
-            logging.info(e)
+            # тело могло быть прочитано не полностью, соединение не переиспользуем
+            self.close_connection = True
+            logging.debug(e)
 
         if request:
             path = self.path.strip("/")
-            if path in self.router:
-                logging.info('Requested path: %s', path)
+            if path in self.router and path not in self.text_routes:
+                logging.debug('Requested path: %s', path)
                 try:
-                    response, code = self.router[path](
-                        {"body": request, "headers": self.headers}, context,
-                        self.store)
+                    with deadline(self.request_deadline):
+                        response, code = self.router[path](
+                            {"body": request, "headers": self.headers}, context,
+                            self.store)
+                except StoreUnavailableError as e:
+                    logging.info("Store unavailable: %s", e)
+                    code = INTERNAL_ERROR
                 except Exception as e:
                     logging.exception("Unexpected error: %s", e)
                     code = INTERNAL_ERROR
             else:
-                logging.info('%s is not valid path', path)
+                logging.debug('%s is not valid path', path)
                 code = NOT_FOUND
 
+        r = build_response(response, code)
+        context['code'] = code
+        if 'error' in r:
+            context['error'] = r['error']
+        with Phase('serialize'):
+            body = json.dumps(r).encode('utf-8')
+        headers = {"Server-Timing": server_timing(timings)} if self.timing_header else None
+        with Phase('write'):
+            self.send_body(code, body, headers=headers)
+        duration = time.monotonic() - start
+        context['duration_ms'] = round(duration * 1000, 3)
+        context['timings'] = finish_timings(timings)
+        log_request_line(context, request, r.get('response'))
+        if self.slow_request_threshold and duration >= self.slow_request_threshold:
+            log_slow_request(context, request)
+        observe_request(request_method(request), code, duration)
+
+    def do_GET(self):
+        """Обработка GET запросов к текстовым маршрутам"""
+        path = self.path.split("?", 1)[0].strip("/")
+        if path not in self.text_routes:
+            self.send_body(NOT_FOUND, json.dumps(build_response(None, NOT_FOUND)).encode('utf-8'))
+            return
+        response, code = self.router[path]({"body": None, "headers": self.headers}, {},
+                                           self.store)
+        self.send_body(code, response.encode('utf-8'), CONTENT_TYPE)
+
+    def send_body(self, code, body, content_type="application/json", headers=None):
         self.send_response(code)
-        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_keepalive_headers()
         self.end_headers()
-        if code not in ERRORS:
-            r = {"response": response, "code": code}
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """Строка доступа BaseHTTPRequestHandler, запрос уже описан в log_request_line"""
+        logging.debug(format, *args)
+
+    def send_keepalive_headers(self):
+        """Заголовки Connection/Keep-Alive с учетом лимита запросов на соединение
+
+        Соединение остается открытым, только если сервер это разрешает: однопоточный
+        сервер не разрешает, пул потоков - пока простаивающие соединения не заняли свою долю.
+        """
+        self.requests_handled += 1
+        keepalive_allowed = getattr(self.server, 'keepalive_allowed', None)
+        if self.close_connection or self.requests_handled >= self.max_keepalive_requests or \
+                keepalive_allowed is None or not keepalive_allowed():
+            self.send_header("Connection", "close")
         else:
-            r = {"error": response or ERRORS.get(code, "Unknown Error"),
-                 "code": code}
-        context.update(r)
-        logging.info(context)
-        self.wfile.write(json.dumps(r).encode('utf-8'))
+            self.send_header("Keep-Alive", f"timeout={int(self.timeout)}, "
+                                           f"max={self.max_keepalive_requests - self.requests_handled}")
+
+
+# параметры хранилища и пула соединений из аргументов командной строки
+POOL_OPTIONS = {}
+STORE_OPTIONS = {}
+
+
+def init_worker():
+    """Отдельный пул соединений с хранилищем для каждого процесса"""
+    if hasattr(signal, 'SIGUSR2'):
+        signal.signal(signal.SIGUSR2, PROFILER.toggle)
+    MainHTTPHandler.store = Store(pool_options=POOL_OPTIONS, **STORE_OPTIONS)
+    MainHTTPHandler.store.prewarm()
 
 
 if __name__ == "__main__":
     AP = ArgumentParser()
     AP.add_argument("-p", "--port", dest='port', action="store", type=int, default=8080)
     AP.add_argument("-l", "--log", dest='log', action="store", default=None)
+    AP.add_argument("-w", "--workers", dest='workers', action="store", type=int, default=1)
+    AP.add_argument("-b", "--backlog", dest='backlog', action="store", type=int,
+                    default=DEFAULT_BACKLOG)
+    AP.add_argument("--processes", dest='processes', action="store", type=int, default=1,
+                    help="number of worker processes, 0 - one per CPU core")
+    AP.add_argument("--keepalive-timeout", dest='keepalive_timeout', action="store", type=float,
+                    default=DEFAULT_KEEPALIVE_TIMEOUT)
+    AP.add_argument("--keepalive-requests", dest='keepalive_requests', action="store", type=int,
+                    default=DEFAULT_KEEPALIVE_REQUESTS)
+    AP.add_argument("--log-sample", dest='log_sample', action="store", type=float, default=1.0,
+                    help="share of requests logged with request and response payloads")
+    AP.add_argument("--timing-header", dest='timing_header', action="store_true",
+                    help="return request phase timings in the Server-Timing header")
+    AP.add_argument("--slow-request", dest='slow_request', action="store", type=float,
+                    help="seconds after which a request is logged with its phase timings")
+    AP.add_argument("--profile", dest='profile', action="store_true",
+                    help="profile requests from the start, SIGUSR2 toggles profiling")
+    AP.add_argument("--profile-rate", dest='profile_rate', action="store", type=int,
+                    default=DEFAULT_RATE, help="profile one of N requests")
+    AP.add_argument("--profile-dir", dest='profile_dir', action="store", default='profiles')
+    AP.add_argument("--profile-interval", dest='profile_interval', action="store", type=float,
+                    default=DEFAULT_INTERVAL, help="seconds aggregated into one pstats file")
+    AP.add_argument("--profile-keep", dest='profile_keep', action="store", type=int,
+                    default=DEFAULT_KEEP, help="number of pstats files kept per process")
+    AP.add_argument("--store-backend", dest='backend', action="store", choices=sorted(BACKENDS),
+                    help="store backend, by default from settings.ini")
+    AP.add_argument("--redis-max-connections", dest='max_connections', action="store", type=int,
+                    help="redis connection pool size, by default from settings.ini")
+    AP.add_argument("--redis-pool-timeout", dest='pool_timeout', action="store", type=float,
+                    help="seconds to wait for a free redis connection")
+    AP.add_argument("--redis-connect-timeout", dest='connect_timeout', action="store", type=float)
+    AP.add_argument("--redis-health-check-interval", dest='health_check_interval', action="store",
+                    type=int)
+    AP.add_argument("--redis-prewarm", dest='prewarm', action="store", type=int,
+                    help="number of redis connections opened at startup")
+    AP.add_argument("--deadline", dest='deadline', action="store", type=float,
+                    default=DEFAULT_REQUEST_DEADLINE,
+                    help="seconds a request may spend waiting for redis, 0 - unlimited")
     opts = AP.parse_args()
-    logging.basicConfig(filename=opts.log, level=logging.INFO,
-                        format='[%(asctime)s] %(levelname).1s %(message)s',
-                        datefmt='%Y.%m.%d %H:%M:%S')
-    server = HTTPServer(("localhost", opts.port), MainHTTPHandler)
-    logging.info("Starting server at %s", opts.port)
-    try:
-        server.serve_forever()
-    except KeyboardInterrupt:
-        pass
-    server.server_close()
+    POOL_OPTIONS.update({name: getattr(opts, name) for name in (
+        'max_connections', 'pool_timeout', 'connect_timeout', 'health_check_interval', 'prewarm')
+        if getattr(opts, name) is not None})
+    if opts.backend:
+        STORE_OPTIONS['backend'] = opts.backend
+    MainHTTPHandler.timeout = opts.keepalive_timeout
+    MainHTTPHandler.request_deadline = opts.deadline
+    MainHTTPHandler.timing_header = opts.timing_header
+    MainHTTPHandler.slow_request_threshold = opts.slow_request
+    MainHTTPHandler.max_keepalive_requests = opts.keepalive_requests
+    setup_logging(opts.log, sample_rate=opts.log_sample)
+    PROFILER.directory = opts.profile_dir
+    PROFILER.interval = opts.profile_interval
+    PROFILER.keep = opts.profile_keep
+    PROFILER.configure(enabled=opts.profile, rate=opts.profile_rate)
+    server = make_server(("localhost", opts.port), MainHTTPHandler,
+                         workers=opts.workers, backlog=opts.backlog)
+    logging.info("Starting server at %s with %s workers", opts.port, opts.workers)
+    if opts.processes != 1:
+        PreforkSupervisor(server, opts.processes, init_worker=init_worker).run()
+    else:
+        init_worker()
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        server.server_close()
@@ -6,26 +6,45 @@ from constants import ADMIN_LOGIN
 from custom_erros import ValidationError
 
 
-class ApiRequest:
+class ApiRequestMeta(type):
+    """Сборка схемы полей запроса один раз при создании класса
 
-    def __init__(self):
-        self.fields = [field for field, value in self.__class__.__dict__.items()
-                       if isinstance(value, Field)]
+    Значения полей хранятся в слотах '_<имя поля>', схема - кортеж
+    (имя, поле, слот) с учетом полей базовых классов.
+    """
+
+    def __new__(mcs, name, bases, namespace):
+        own = [(key, value) for key, value in namespace.items() if isinstance(value, Field)]
+        namespace['__slots__'] = tuple('_' + key for key, _ in own)
+        cls = super().__new__(mcs, name, bases, namespace)
+        schema = {}
+        for base in reversed(cls.__mro__[1:]):
+            for item in getattr(base, '_schema', ()):
+                schema[item[0]] = item
+        for key, field in own:
+            field.slot = cls.__dict__['_' + key]
+            schema[key] = (key, field, field.slot)
+        cls._schema = tuple(schema.values())
+        cls.fields = tuple(schema)
+        return cls
+
+
+class ApiRequest(metaclass=ApiRequestMeta):
 
     def validate(self, kwargs):
-        logging.debug('Available %s fields: %s', self.__class__.__name__, self.fields)
-        logging.debug('Received %s fields: %s', self.__class__.__name__, list(kwargs.keys()))
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug('Available %s fields: %s', self.__class__.__name__, self.fields)
+            logging.debug('Received %s fields: %s', self.__class__.__name__, list(kwargs.keys()))
 
         errors = []
-        for field in self.fields:
-            value = kwargs[field] if field in kwargs else None
+        for name, field, slot in self._schema:
             try:
-                setattr(self, field, value)
+                slot.__set__(self, field.clean(kwargs.get(name)))
             except ValidationError as e:
-                errors.append(e)
+                errors.append(f'{name}: {e}')
                 logging.error(e)
         if errors:
-            raise ValidationError("Fields validate error")
+            raise ValidationError("Fields validate error: " + '; '.join(errors))
 
 
 class ClientsInterestsRequest(ApiRequest):
@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Scoring API на asyncio
+"""
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from argparse import ArgumentParser
+from http import HTTPStatus
+
+from store import AsyncStore
+from backends import BACKENDS
+from logger import setup_logging, log_request_line, log_slow_request
+from api import check_auth, build_response, metrics_handler, request_method, \
+    DEFAULT_REQUEST_DEADLINE
+from api_requests import ClientsInterestsRequest, OnlineScoreRequest, MethodRequest
+from scoring import get_score_async, get_interests_many_async
+from custom_erros import ValidationError, StoreUnavailableError
+from breaker import deadline
+from metrics import CONTENT_TYPE, INTERESTS_BATCH, observe_request
+from timings import Phase, finish_timings, start_timings
+from servers import DEFAULT_BACKLOG, DEFAULT_KEEPALIVE_TIMEOUT, DEFAULT_KEEPALIVE_REQUESTS
+from constants import ADMIN_SALT, OK, BAD_REQUEST, FORBIDDEN, NOT_FOUND, \
+    INVALID_REQUEST, INTERNAL_ERROR, ERRORS
+
+MAX_HEADERS = 100
+
+
+async def online_score_handler(req, ctx, store):
+    """Обработчик для online_score"""
+    arguments = req.arguments
+    online_score = OnlineScoreRequest()
+    with Phase('validate'):
+        online_score.validate(arguments)
+    ctx['has'] = [key for key, val in arguments.items() if val is not None]
+    if req.is_admin:
+        score = int(ADMIN_SALT)
+    else:
+        score = await get_score_async(store, online_score.phone, online_score.email,
+                                      online_score.birthday,
+                                      online_score.gender, online_score.first_name,
+                                      online_score.last_name)
+    response = {'score': score}
+    logging.debug('Score: %s', score)
+    return response, OK
+
+
+async def clients_interests_handler(req, ctx, store):
+    """Обработчик для clients_interests"""
+    clients_interests = ClientsInterestsRequest()
+    with Phase('validate'):
+        clients_interests.validate(req.arguments)
+    ctx['nclients'] = len(clients_interests.client_ids)
+    INTERESTS_BATCH.observe(len(clients_interests.client_ids))
+    interests = await get_interests_many_async(store, clients_interests.client_ids)
+    logging.debug('Client interest: %s', interests)
+    return interests, OK
+
+
+HANDLERS = {
+    'online_score': online_score_handler,
+    'clients_interests': clients_interests_handler,
+}
+
+
+async def method_handler(request, ctx, store):
+    """Обработчик имеющихся методов, пакеты запросов обслуживает только api.py"""
+    if not isinstance(request.get('body'), dict):
+        return 'Batch requests are not supported', INVALID_REQUEST
+    try:
+        req = MethodRequest()
+        with Phase('validate'):
+            req.validate(request.get('body'))
+        logging.debug('Requested method value: "%s"', req.method)
+        handler = HANDLERS.get(req.method)
+        if handler is None:
+            logging.debug('Unavailable method value')
+            return ERRORS.get(INVALID_REQUEST), INVALID_REQUEST
+        with Phase('auth'):
+            authorized = check_auth(req)
+        if not authorized:
+            return ERRORS.get(FORBIDDEN), FORBIDDEN
+        with Phase('handler'):
+            return await handler(req, ctx, store)
+    except ValidationError:
+        return ERRORS.get(INVALID_REQUEST), INVALID_REQUEST
+
+
+class AsyncHTTPServer:
+    """HTTP сервер на потоках asyncio с тем же роутером, что и MainHTTPHandler"""
+    router = {
+        "method": method_handler
+    }
+
+    def __init__(self, store=None, keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT,
+                 max_keepalive_requests=DEFAULT_KEEPALIVE_REQUESTS,
+                 request_deadline=DEFAULT_REQUEST_DEADLINE, slow_request_threshold=None):
+        self.store = store or AsyncStore()
+        self.slow_request_threshold = slow_request_threshold
+        self.request_deadline = request_deadline
+        self.keepalive_timeout = keepalive_timeout
+        self.max_keepalive_requests = max_keepalive_requests
+
+    @staticmethod
+    def get_request_id(headers):
+        """Получение id запроса или генерация нового"""
+        return headers.get('x-request-id') or uuid.uuid4().hex
+
+    async def read_request(self, reader):
+        """Чтение стартовой строки, заголовков и тела запроса"""
+        line = await reader.readline()
+        if not line:
+            return None
+        command, path, version = line.decode('latin-1').split()
+        headers = {}
+        for _ in range(MAX_HEADERS):
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        else:
+            raise ValueError('Too many headers')
+        length = int(headers.get('content-length', 0))
+        body = await reader.readexactly(length) if length else b''
+        return command, path, version, headers, body
+
+    async def process(self, path, headers, body):
+        """Обработка POST запроса, возвращает код и тело ответа"""
+        start = time.monotonic()
+        timings = start_timings()
+        response, code = {}, OK
+        context = {"request_id": self.get_request_id(headers), "path": path}
+        request = None
+        try:
+            with Phase('json'):
+                request = json.loads(body)
+            logging.debug('Received request: %s', request)
+        except Exception as e:
+            code = BAD_REQUEST
+            logging.debug(e)
+
+        if request:
+            path = path.strip("/")
+            if path in self.router:
+                logging.debug('Requested path: %s', path)
+                try:
+                    with deadline(self.request_deadline):
+                        response, code = await self.router[path](
+                            {"body": request, "headers": headers}, context, self.store)
+                except StoreUnavailableError as e:
+                    logging.info("Store unavailable: %s", e)
+                    code = INTERNAL_ERROR
+                except Exception as e:
+                    logging.exception("Unexpected error: %s", e)
+                    code = INTERNAL_ERROR
+            else:
+                logging.debug('%s is not valid path', path)
+                code = NOT_FOUND
+
+        r = build_response(response, code)
+        context['code'] = code
+        if 'error' in r:
+            context['error'] = r['error']
+        duration = time.monotonic() - start
+        context['duration_ms'] = round(duration * 1000, 3)
+        context['timings'] = finish_timings(timings)
+        log_request_line(context, request, r.get('response'))
+        if self.slow_request_threshold and duration >= self.slow_request_threshold:
+            log_slow_request(context, request)
+        observe_request(request_method(request), code, duration)
+        return code, r
+
+    @classmethod
+    async def write_response(cls, writer, code, r, keep_alive=False):
+        await cls.write_body(writer, code, json.dumps(r).encode('utf-8'), keep_alive)
+
+    @staticmethod
+    async def write_body(writer, code, body, keep_alive=False, content_type='application/json'):
+        head = (f'HTTP/1.1 {code} {HTTPStatus(code).phrase}\r\n'
+                f'Content-Type: {content_type}\r\n'
+                f'Content-Length: {len(body)}\r\n'
+                f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n')
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    async def handle_connection(self, reader, writer):
+        """Обработка соединения, в том числе нескольких запросов по keep-alive"""
+        requests_handled = 0
+        try:
+            while True:
+                try:
+                    parsed = await asyncio.wait_for(self.read_request(reader),
+                                                    self.keepalive_timeout)
+                except asyncio.TimeoutError:
+                    return
+                except (ValueError, asyncio.IncompleteReadError) as e:
+                    logging.info('Malformed request: %s', e)
+                    await self.write_response(writer, BAD_REQUEST,
+                                              build_response(None, BAD_REQUEST))
+                    return
+                if parsed is None:
+                    return
+                command, path, version, headers, body = parsed
+                requests_handled += 1
+                connection = headers.get('connection', '').lower()
+                keep_alive = (requests_handled < self.max_keepalive_requests and
+                              (connection == 'keep-alive' or
+                               version == 'HTTP/1.1' and connection != 'close'))
+                if command == 'GET' and path.split('?', 1)[0].strip('/') == 'metrics':
+                    response, code = metrics_handler(None, {}, self.store)
+                    await self.write_body(writer, code, response.encode('utf-8'), keep_alive,
+                                          CONTENT_TYPE)
+                    if not keep_alive:
+                        return
+                    continue
+                if command != 'POST':
+                    code = HTTPStatus.NOT_IMPLEMENTED
+                    await self.write_response(writer, code, {"error": code.phrase, "code": code})
+                    return
+                code, r = await self.process(path, headers, body)
+                await self.write_response(writer, code, r, keep_alive)
+                if not keep_alive:
+                    return
+        except ConnectionError as e:
+            logging.info('Connection lost: %s', e)
+        finally:
+            writer.close()
+
+    async def serve(self, host, port, backlog=DEFAULT_BACKLOG):
+        server = await asyncio.start_server(self.handle_connection, host, port,
+                                            backlog=backlog)
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == "__main__":
+    AP = ArgumentParser()
+    AP.add_argument("-p", "--port", dest='port', action="store", type=int, default=8080)
+    AP.add_argument("-l", "--log", dest='log', action="store", default=None)
+    AP.add_argument("-b", "--backlog", dest='backlog', action="store", type=int,
+                    default=DEFAULT_BACKLOG)
+    AP.add_argument("--keepalive-timeout", dest='keepalive_timeout', action="store", type=float,
+                    default=DEFAULT_KEEPALIVE_TIMEOUT)
+    AP.add_argument("--keepalive-requests", dest='keepalive_requests', action="store", type=int,
+                    default=DEFAULT_KEEPALIVE_REQUESTS)
+    AP.add_argument("--log-sample", dest='log_sample', action="store", type=float, default=1.0,
+                    help="share of requests logged with request and response payloads")
+    AP.add_argument("--deadline", dest='deadline', action="store", type=float,
+                    default=DEFAULT_REQUEST_DEADLINE,
+                    help="seconds a request may spend waiting for redis, 0 - unlimited")
+    AP.add_argument("--slow-request", dest='slow_request', action="store", type=float,
+                    help="seconds after which a request is logged with its phase timings")
+    AP.add_argument("--store-backend", dest='backend', action="store", choices=sorted(BACKENDS),
+                    help="store backend, by default from settings.ini")
+    opts = AP.parse_args()
+    setup_logging(opts.log, sample_rate=opts.log_sample)
+    logging.info("Starting asyncio server at %s", opts.port)
+    try:
+        api = AsyncHTTPServer(store=AsyncStore(backend=opts.backend),
+                              keepalive_timeout=opts.keepalive_timeout,
+                              max_keepalive_requests=opts.keepalive_requests,
+                              request_deadline=opts.deadline,
+                              slow_request_threshold=opts.slow_request)
+        asyncio.run(api.serve("localhost", opts.port, opts.backlog))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,417 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from fnmatch import fnmatchcase
+from time import monotonic
+import redis
+from redis.backoff import NoBackoff
+from redis.retry import Retry
+from breaker import CircuitBreaker
+from custom_erros import StoreUnavailableError
+from hashring import HashRing, DEFAULT_VNODES
+from replicas import ReplicaSet, DEFAULT_MAX_LAG
+
+# число ключей в одной команде MGET
+MGET_CHUNK_SIZE = 500
+# потоков на узел для запросов к нескольким узлам, если размер пула соединений не задан
+DEFAULT_SHARD_THREADS = 8
+# интервал в секундах между удалениями просроченных ключей из памяти
+PURGE_INTERVAL = 60
+# ошибки соединения с узлом, которые размыкают автомат
+NODE_ERRORS = (redis.ConnectionError, redis.TimeoutError)
+# сообщение BlockingConnectionPool, если за POOL_TIMEOUT не освободилось ни одно соединение
+POOL_EXHAUSTED = 'No connection available.'
+
+
+def pool_exhausted(error):
+    """Все соединения пула заняты: это перегрузка процесса, а не отказ redis"""
+    return isinstance(error, redis.ConnectionError) and str(error) == POOL_EXHAUSTED
+
+
+def record_error(breaker, error):
+    """Учет ошибки операции: автомат размыкают только отказы соединения с хранилищем"""
+    if breaker is None:
+        return
+    if isinstance(error, NODE_ERRORS) and not pool_exhausted(error):
+        breaker.record_failure()
+    else:
+        breaker.release()
+
+
+def parse_nodes(nodes):
+    """Список узлов redis из строки 'host:port,host:port' или списка пар (host, port)"""
+    if isinstance(nodes, str):
+        nodes = [node.strip() for node in nodes.split(',') if node.strip()]
+    result = []
+    for node in nodes:
+        if isinstance(node, str):
+            host, _, port = node.rpartition(':')
+            node = (host, int(port))
+        result.append((node[0], int(node[1])))
+    return result
+
+
+def parse_replicas(replicas, nodes):
+    """Реплики по первичным узлам из строки 'replica@primary,...'
+
+    Если узел один, первичный узел у реплики можно не указывать.
+    """
+    if isinstance(replicas, dict):
+        return {name: parse_nodes(items) for name, items in replicas.items()}
+    result = {}
+    for item in (replicas or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        replica, _, primary = item.partition('@')
+        if not primary:
+            if len(nodes) != 1:
+                raise ValueError(f'Primary node is required for replica {replica}')
+            primary = '%s:%s' % nodes[0]
+        result.setdefault(primary, []).extend(parse_nodes([replica]))
+    return result
+
+
+def make_pool(pool_class, retry_class, host, port, socket_timeout, max_connections, pool_timeout,
+              connect_timeout, keepalive, health_check_interval, **kwargs):
+    """Блокирующий пул соединений: при исчерпании пула команда ждет pool_timeout секунд
+
+    Повторы внутри redis клиента отключены, ими управляет retry.
+    """
+    return pool_class(host=host, port=port, socket_timeout=socket_timeout,
+                      retry=retry_class(NoBackoff(), 0),
+                      socket_connect_timeout=connect_timeout, socket_keepalive=keepalive,
+                      health_check_interval=health_check_interval,
+                      max_connections=max_connections, timeout=pool_timeout,
+                      decode_responses=True)
+
+
+class Backend:
+    """Хранилище ключ-значение под Store
+
+    Значения возвращаются строками, как их возвращает redis с
+    decode_responses, отсутствующие и просроченные ключи - None.
+    """
+    # у каждого узла свой автомат отключения, общий автомат Store не нужен
+    node_breakers = False
+
+    def ping(self):
+        raise NotImplementedError
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def get_many(self, keys):
+        raise NotImplementedError
+
+    def set(self, name, value, ex=None):
+        raise NotImplementedError
+
+    def set_many(self, mapping, ex=None):
+        raise NotImplementedError
+
+    def set_nx(self, name, value, ex):
+        """Запись, только если ключа нет, ex в секундах, True - значение записано"""
+        raise NotImplementedError
+
+    def scan(self, match='*', count=1000):
+        """Итератор по ключам, подходящим под шаблон match, count - размер порции"""
+        raise NotImplementedError
+
+    def prewarm(self, count=None):
+        return 0
+
+    def disconnect(self):
+        pass
+
+
+class RedisBackend(Backend):
+    """Хранилище на redis
+
+    Ключи распределяются по узлам консистентным хешированием, команды с
+    несколькими ключами разбиваются по узлам и выполняются параллельно.
+    Чтения узла распределяются по его репликам, записи идут на первичный узел.
+    redis клиент берет отдельное соединение из своего пула на каждую команду.
+    Отказы узла размыкают только его автомат, ключи остальных узлов доступны.
+    """
+    node_breakers = True
+
+    def __init__(self, nodes, replicas=None, socket_timeout=None, pool_options=None,
+                 vnodes=DEFAULT_VNODES, max_replica_lag=DEFAULT_MAX_LAG, breaker_options=None):
+        self.pool_options = pool_options
+        self.breaker_options = breaker_options or {}
+        self.socket_timeout = socket_timeout
+        self.max_replica_lag = max_replica_lag
+        nodes = parse_nodes(nodes)
+        replicas = parse_replicas(replicas, nodes)
+        self._shards = {}
+        self.ring = HashRing(vnodes=vnodes)
+        self._executor = None
+        for host, port in nodes:
+            self._add_shard(host, port, replicas.get(f'{host}:{port}', ()))
+        self._resize_executor()
+
+    def _make_client(self, host, port):
+        return redis.Redis(connection_pool=make_pool(
+            redis.BlockingConnectionPool, Retry, host, port, self.socket_timeout,
+            **self.pool_options))
+
+    def add_node(self, host, port, replicas=()):
+        """Добавление узла, на него переходит около 1/N ключей
+
+        Перенос данных не выполняется: перешедшие ключи кэша будут
+        вычислены заново, постоянные данные нужно перенести отдельно.
+        """
+        if self._add_shard(host, port, replicas):
+            self._resize_executor()
+
+    def _add_shard(self, host, port, replicas=()):
+        name = f'{host}:{port}'
+        if name in self._shards:
+            return False
+        self._shards[name] = ReplicaSet(
+            name, self._make_client(host, port),
+            [(f'{r_host}:{r_port}', self._make_client(r_host, r_port)) for r_host, r_port in replicas],
+            max_lag=self.max_replica_lag, breaker=CircuitBreaker(**self.breaker_options))
+        self.ring.add_node(name)
+        return True
+
+    def _resize_executor(self):
+        """Пул потоков для запросов к нескольким узлам, общий для всех потоков сервера
+
+        На узле одновременно выполняется не больше max_connections команд
+        (размер пула соединений), столько же потоков выделяется на узел.
+        Прежний пул завершается после выполнения уже поставленных задач.
+        """
+        previous = self._executor
+        if len(self._shards) > 1:
+            per_shard = (self.pool_options or {}).get('max_connections') or DEFAULT_SHARD_THREADS
+            self._executor = ThreadPoolExecutor(max_workers=len(self._shards) * per_shard,
+                                                thread_name_prefix='store-shard')
+        else:
+            self._executor = None
+        if previous is not None:
+            previous.shutdown(wait=False)
+
+    def _shard(self, key):
+        return self._shards[self.ring.get_node(key)]
+
+    def _client(self, key):
+        """Клиент первичного узла для ключа"""
+        return self._shard(key).primary
+
+    @staticmethod
+    def _guarded(shard, func, *args):
+        """Вызов func(шард, *args) через автомат шарда"""
+        breaker = shard.breaker
+        if not breaker.allow():
+            raise StoreUnavailableError(f'Circuit breaker is open for node {shard.name}')
+        try:
+            result = func(shard, *args)
+        except Exception as e:
+            record_error(breaker, e)
+            raise
+        breaker.record_success()
+        return result
+
+    def _all_clients(self):
+        return [client for shard in self._shards.values() for client in shard.clients]
+
+    def _map_shards(self, func, keys):
+        """Вызов func(шард, ключи шарда) для каждого шарда, список пар (индексы ключей, результат)"""
+        groups = self.ring.split(keys)
+        if len(groups) == 1:
+            node, indexes = groups.popitem()
+            return [(indexes, self._guarded(self._shards[node], func, keys))]
+        futures = [(indexes, self._submit(self._guarded, self._shards[node], func,
+                                          [keys[i] for i in indexes]))
+                   for node, indexes in groups.items()]
+        return [(indexes, future.result()) for indexes, future in futures]
+
+    def _submit(self, func, *args):
+        executor = self._executor
+        try:
+            return executor.submit(func, *args)
+        except RuntimeError:
+            # пул заменен add_node между чтением и постановкой задачи
+            return self._executor.submit(func, *args)
+
+    def ping(self):
+        return all(client.ping() for client in self._all_clients())
+
+    def prewarm(self, count=None):
+        """Открытие count соединений пула каждого узла заранее, возвращает число открытых"""
+        count = self.pool_options['prewarm'] if count is None else count
+        opened = 0
+        for client in self._all_clients():
+            pool = client.connection_pool
+            connections = []
+            try:
+                for _ in range(min(count, self.pool_options['max_connections'])):
+                    connections.append(pool.get_connection())
+            except Exception as e:
+                logging.info('Connection pool prewarm failed for %s: %s',
+                             pool.connection_kwargs.get('host'), e)
+            finally:
+                for connection in connections:
+                    pool.release(connection)
+            opened += len(connections)
+        if opened:
+            logging.info('Connection pools prewarmed with %s connections', opened)
+        return opened
+
+    def get(self, key):
+        return self._guarded(self._shard(key),
+                             lambda shard: shard.read(lambda client: client.get(key)))
+
+    @staticmethod
+    def _mget_node(shard, keys):
+        def mget(client):
+            pipe = client.pipeline(transaction=False)
+            for i in range(0, len(keys), MGET_CHUNK_SIZE):
+                pipe.mget(keys[i:i + MGET_CHUNK_SIZE])
+            return [value for chunk in pipe.execute() for value in chunk]
+        return shard.read(mget)
+
+    def get_many(self, keys):
+        """Значения нескольких ключей, по одному пайплайну на узел"""
+        if not keys:
+            return []
+        values = [None] * len(keys)
+        for indexes, found in self._map_shards(self._mget_node, keys):
+            for i, value in zip(indexes, found):
+                values[i] = value
+        return values
+
+    def set(self, name, value, ex=None):
+        return self._guarded(self._shard(name),
+                             lambda shard: shard.write(lambda client: client.set(name, value, ex)))
+
+    def set_many(self, mapping, ex=None):
+        """Запись нескольких значений, по одному пайплайну на узел"""
+        def set_node(shard, names):
+            def write(client):
+                pipe = client.pipeline(transaction=False)
+                for name in names:
+                    pipe.set(name, mapping[name], ex)
+                return all(pipe.execute())
+            return shard.write(write)
+        return all(result for _, result in self._map_shards(set_node, list(mapping)))
+
+    def set_nx(self, name, value, ex):
+        return bool(self._guarded(self._shard(name), lambda shard: shard.write(
+            lambda client: client.set(name, value, px=max(1, int(ex * 1000)), nx=True))))
+
+    def scan(self, match='*', count=1000):
+        """SCAN по первичным узлам всех шардов, ключ может повториться при перехешировании redis"""
+        for shard in self._shards.values():
+            yield from shard.primary.scan_iter(match=match, count=count)
+
+    def disconnect(self):
+        for shard in self._shards.values():
+            shard.close()
+        for client in self._all_clients():
+            client.connection_pool.disconnect()
+
+
+def encode(value):
+    """Значение в том виде, в каком его вернет redis"""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise TypeError(f'Invalid value type {type(value).__name__}')
+    return repr(value)
+
+
+class MemoryBackend(Backend):
+    """Хранилище в памяти процесса со временем жизни ключей
+
+    Подходит для тестов, нагрузочных замеров и одиночного сервера:
+    данные не разделяются между процессами и теряются при перезапуске.
+    Просроченные ключи удаляются при чтении и периодически при записи.
+    """
+
+    def __init__(self, purge_interval=PURGE_INTERVAL):
+        self.purge_interval = purge_interval
+        self._data = {}
+        self._lock = threading.Lock()
+        self._purged_at = monotonic()
+
+    def __len__(self):
+        return len(self._data)
+
+    def ping(self):
+        return True
+
+    def _get(self, key, now):
+        item = self._data.get(str(key))
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at <= now:
+            with self._lock:
+                # ключ мог быть перезаписан другим потоком
+                if self._data.get(str(key)) is item:
+                    del self._data[str(key)]
+            return None
+        return value
+
+    def get(self, key):
+        return self._get(key, monotonic())
+
+    def get_many(self, keys):
+        now = monotonic()
+        return [self._get(key, now) for key in keys]
+
+    def _purge(self, now):
+        """Удаление просроченных ключей, вызывается под блокировкой"""
+        self._purged_at = now
+        expired = [key for key, (_, expires_at) in self._data.items()
+                   if expires_at is not None and expires_at <= now]
+        for key in expired:
+            del self._data[key]
+
+    def set_many(self, mapping, ex=None):
+        if isinstance(ex, timedelta):
+            ex = ex.total_seconds()
+        items = [(str(name), encode(value)) for name, value in mapping.items()]
+        now = monotonic()
+        expires_at = now + ex if ex else None
+        with self._lock:
+            for name, value in items:
+                self._data[name] = (value, expires_at)
+            if now - self._purged_at >= self.purge_interval:
+                self._purge(now)
+        return True
+
+    def set(self, name, value, ex=None):
+        return self.set_many({name: value}, ex)
+
+    def set_nx(self, name, value, ex):
+        name, value = str(name), encode(value)
+        now = monotonic()
+        with self._lock:
+            item = self._data.get(name)
+            if item is not None and (item[1] is None or item[1] > now):
+                return False
+            self._data[name] = (value, now + ex)
+        return True
+
+    def scan(self, match='*', count=1000):
+        with self._lock:
+            items = list(self._data.items())
+        now = monotonic()
+        for name, (_, expires_at) in items:
+            if (expires_at is None or expires_at > now) and fnmatchcase(name, match):
+                yield name
+
+
+# реализации хранилища, выбираемые параметром BACKEND в settings.ini
+BACKENDS = {
+    'redis': RedisBackend,
+    'memory': MemoryBackend,
+}
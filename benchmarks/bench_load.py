@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Нагрузочный бенчмарк API с перцентилями задержек
+
+Запуск из корня репозитория, сервер с хранилищем в памяти в том же процессе:
+    python -m benchmarks.bench_load --concurrency 16 --requests 20000
+
+Сравнение с сохраненным результатом, код возврата 1 при регрессии:
+    python -m benchmarks.bench_load --output baseline.json
+    python -m benchmarks.bench_load --baseline baseline.json
+
+Внешний сервер, например запущенный с --processes:
+    python -m benchmarks.bench_load --url http://localhost:8080
+"""
+
+import asyncio
+import datetime
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+from argparse import ArgumentParser
+from http.client import HTTPConnection
+from urllib.parse import urlsplit
+
+import constants
+
+# доли методов в нагрузке по умолчанию
+DEFAULT_MIX = 'user_score=5,admin_score=1,interests=4'
+# допустимое ухудшение пропускной способности и задержек относительно базового результата
+DEFAULT_TOLERANCE = 0.1
+PERCENTILES = (50, 95, 99)
+ACCOUNT = 'horns&hoofs'
+USER_LOGIN = 'h&f'
+
+
+def user_token(account, login):
+    return hashlib.sha512((account + login + constants.SALT).encode('utf-8')).hexdigest()
+
+
+def admin_token():
+    return hashlib.sha512((datetime.datetime.now().strftime("%Y%m%d%H") +
+                           constants.ADMIN_SALT).encode('utf-8')).hexdigest()
+
+
+def parse_mix(mix):
+    """Доли методов из строки 'метод=вес,...'"""
+    result = {}
+    for item in mix.split(','):
+        name, _, weight = item.strip().partition('=')
+        if name not in BUILDERS:
+            raise ValueError(f'Unknown request kind {name}')
+        result[name] = float(weight or 1)
+    return result
+
+
+def parse_range(value):
+    """Диапазон 'a-b' или одно число"""
+    low, _, high = value.partition('-')
+    return int(low), int(high or low)
+
+
+def user_score(rnd, ids_range, tokens):
+    return {"account": ACCOUNT, "login": USER_LOGIN, "method": "online_score",
+            "token": tokens['user'],
+            "arguments": {"phone": "7%010d" % rnd.randrange(10 ** 10),
+                          "email": "user%s@otus.ru" % rnd.randrange(1000),
+                          "first_name": "a", "last_name": "b",
+                          "birthday": "%02d.%02d.%d" % (rnd.randint(1, 28), rnd.randint(1, 12),
+                                                        rnd.randint(1960, 2010)),
+                          "gender": rnd.randint(0, 2)}}
+
+
+def admin_score(rnd, ids_range, tokens):
+    return {"account": ACCOUNT, "login": constants.ADMIN_LOGIN, "method": "online_score",
+            "token": tokens['admin'],
+            "arguments": {"phone": "79175002040", "email": "stupnikov@otus.ru"}}
+
+
+def interests(rnd, ids_range, tokens):
+    return {"account": ACCOUNT, "login": USER_LOGIN, "method": "clients_interests",
+            "token": tokens['user'],
+            "arguments": {"client_ids": [rnd.randint(1, 1000)
+                                         for _ in range(rnd.randint(*ids_range))],
+                          "date": "20.07.2017"}}
+
+
+BUILDERS = {
+    'user_score': user_score,
+    'admin_score': admin_score,
+    'interests': interests,
+}
+
+
+def make_requests(count, mix, ids_range, seed=0):
+    """Заранее подготовленные тела запросов, чтобы не тратить время клиента на json"""
+    rnd = random.Random(seed)
+    tokens = {'user': user_token(ACCOUNT, USER_LOGIN), 'admin': admin_token()}
+    kinds = rnd.choices(list(mix), weights=list(mix.values()), k=count)
+    return [(kind, json.dumps(BUILDERS[kind](rnd, ids_range, tokens)).encode('utf-8'))
+            for kind in kinds]
+
+
+def percentile(values, p):
+    """Перцентиль по методу ближайшего ранга для отсортированного списка"""
+    if not values:
+        return 0
+    rank = max(1, -(-len(values) * p // 100))
+    return values[int(rank) - 1]
+
+
+def summarize(samples, elapsed):
+    """Пропускная способность, перцентили задержек в мс и доля ошибок"""
+    latencies = sorted(latency for _, latency, _ in samples)
+    errors = sum(1 for _, _, ok in samples if not ok)
+    result = {
+        'requests': len(samples),
+        'errors': errors,
+        'error_rate': errors / len(samples) if samples else 0,
+        'duration_s': round(elapsed, 3),
+        'throughput_rps': round(len(samples) / elapsed, 1) if elapsed else 0,
+        'latency_ms': {f'p{p}': round(percentile(latencies, p) * 1000, 3) for p in PERCENTILES},
+    }
+    result['latency_ms']['max'] = round(latencies[-1] * 1000, 3) if latencies else 0
+    return result
+
+
+def run_client(host, port, path, requests, samples):
+    """Последовательная отправка запросов по одному keep-alive соединению"""
+    connection = HTTPConnection(host, port, timeout=30)
+    try:
+        for kind, body in requests:
+            start = time.perf_counter()
+            try:
+                connection.request("POST", path, body, {"Content-Type": "application/json"})
+                r = connection.getresponse()
+                ok = r.status == 200 and json.loads(r.read()).get('code') == constants.OK
+            except Exception:
+                ok = False
+                connection.close()
+            samples.append((kind, time.perf_counter() - start, ok))
+    finally:
+        connection.close()
+
+
+def run_load(host, port, requests, concurrency, path='/method/'):
+    """Нагрузка в concurrency потоков, результат по всем запросам и по видам запросов"""
+    parts = [requests[i::concurrency] for i in range(concurrency)]
+    samples = [[] for _ in parts]
+    threads = [threading.Thread(target=run_client, args=(host, port, path, part, part_samples))
+               for part, part_samples in zip(parts, samples)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    samples = [sample for part_samples in samples for sample in part_samples]
+    result = summarize(samples, elapsed)
+    result['by_kind'] = {
+        kind: summarize([sample for sample in samples if sample[0] == kind], elapsed)
+        for kind in sorted({sample[0] for sample in samples})}
+    return result
+
+
+def compare(result, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Список регрессий относительно базового результата"""
+    regressions = []
+    if result['throughput_rps'] < baseline['throughput_rps'] * (1 - tolerance):
+        regressions.append('throughput_rps: %s < %s' % (result['throughput_rps'],
+                                                        baseline['throughput_rps']))
+    for name, value in result['latency_ms'].items():
+        base = baseline['latency_ms'].get(name)
+        if name != 'max' and base and value > base * (1 + tolerance):
+            regressions.append('latency_ms.%s: %s > %s' % (name, value, base))
+    if result['error_rate'] > baseline['error_rate'] + tolerance / 10:
+        regressions.append('error_rate: %s > %s' % (result['error_rate'], baseline['error_rate']))
+    return regressions
+
+
+def start_threads_server(workers, backend):
+    """MainHTTPHandler в фоновом потоке на свободном порту"""
+    from api import MainHTTPHandler
+    from servers import make_server
+    from store import Store
+
+    class Handler(MainHTTPHandler):
+        store = Store(backend=backend)
+
+    Handler.store.create_interests()
+    server = make_server(('localhost', 0), Handler, workers=workers)
+    t = threading.Thread(target=server.serve_forever, daemon=True)
+    t.start()
+
+    def stop():
+        server.shutdown()
+        server.server_close()
+    return server.server_address[1], stop
+
+
+def start_async_server(backend):
+    """AsyncHTTPServer в фоновом потоке на свободном порту"""
+    from async_api import AsyncHTTPServer
+    from store import AsyncStore
+
+    store = AsyncStore(backend=backend)
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(store.create_interests())
+    server = loop.run_until_complete(
+        asyncio.start_server(AsyncHTTPServer(store).handle_connection, 'localhost', 0))
+    t = threading.Thread(target=loop.run_forever, daemon=True)
+    t.start()
+
+    async def shutdown():
+        # клиенты уже закрыли соединения, задачи соединений завершаются до остановки цикла
+        server.close()
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        if tasks:
+            await asyncio.wait(tasks, timeout=1)
+        await store.disconnect()
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(shutdown(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        t.join()
+        loop.close()
+    return server.sockets[0].getsockname()[1], stop
+
+
+def main(argv=None):
+    AP = ArgumentParser(description='Load generator for the scoring API')
+    AP.add_argument("--url", dest='url', action="store", default=None,
+                    help="external server, by default a server is started in-process")
+    AP.add_argument("--server", dest='server', action="store", choices=('threads', 'async'),
+                    default='threads', help="in-process server mode")
+    AP.add_argument("-w", "--workers", dest='workers', action="store", type=int, default=16)
+    AP.add_argument("--store-backend", dest='backend', action="store", default='memory',
+                    help="store backend of the in-process server")
+    AP.add_argument("-c", "--concurrency", dest='concurrency', action="store", type=int,
+                    default=8)
+    AP.add_argument("-n", "--requests", dest='requests', action="store", type=int, default=10000)
+    AP.add_argument("--warmup", dest='warmup', action="store", type=int, default=200)
+    AP.add_argument("--mix", dest='mix', action="store", default=DEFAULT_MIX,
+                    help="request kinds and weights: user_score, admin_score, interests")
+    AP.add_argument("--client-ids", dest='client_ids', action="store", default='1-10',
+                    help="number of client_ids in clients_interests, 'a-b' or 'n'")
+    AP.add_argument("--seed", dest='seed', action="store", type=int, default=0)
+    AP.add_argument("-o", "--output", dest='output', action="store", default=None,
+                    help="file to save the JSON report, e.g. as a new baseline")
+    AP.add_argument("--baseline", dest='baseline', action="store", default=None)
+    AP.add_argument("--tolerance", dest='tolerance', action="store", type=float,
+                    default=DEFAULT_TOLERANCE)
+    opts = AP.parse_args(argv)
+
+    mix = parse_mix(opts.mix)
+    ids_range = parse_range(opts.client_ids)
+    stop = None
+    if opts.url:
+        url = urlsplit(opts.url)
+        host, port = url.hostname, url.port or 80
+    elif opts.server == 'async':
+        host, (port, stop) = 'localhost', start_async_server(opts.backend)
+    else:
+        host, (port, stop) = 'localhost', start_threads_server(opts.workers, opts.backend)
+    try:
+        if opts.warmup:
+            run_load(host, port, make_requests(opts.warmup, mix, ids_range, opts.seed + 1),
+                     opts.concurrency)
+        result = run_load(host, port, make_requests(opts.requests, mix, ids_range, opts.seed),
+                          opts.concurrency)
+    finally:
+        if stop is not None:
+            stop()
+    result['config'] = {'url': opts.url, 'server': None if opts.url else opts.server,
+                        'workers': opts.workers, 'backend': opts.backend,
+                        'concurrency': opts.concurrency, 'mix': mix, 'client_ids': ids_range}
+
+    regressions = []
+    if opts.baseline:
+        with open(opts.baseline) as f:
+            regressions = compare(result, json.load(f), opts.tolerance)
+        result['regressions'] = regressions
+    report = json.dumps(result, indent=2)
+    if opts.output:
+        with open(opts.output, 'w') as f:
+            f.write(report)
+    print(report)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
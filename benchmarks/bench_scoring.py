@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Бенчмарк пакетного скоринга score_batch против get_score по одной строке
+
+Запуск из корня репозитория, хранилище в памяти:
+    python -m benchmarks.bench_scoring --rows 1000000
+
+get_score выполняется для первых --compare строк, результаты сравниваются
+с score_batch для тех же строк.
+"""
+
+import datetime
+import random
+import time
+from argparse import ArgumentParser
+
+import scoring
+from scoring import get_score, score_batch
+from store import Store
+
+
+def make_columns(rows, seed=0):
+    """Колонки phone, email, birthday, gender, first_name, last_name с пропусками"""
+    rnd = random.Random(seed)
+    start = datetime.date(1950, 1, 1)
+    columns = ([], [], [], [], [], [])
+    for i in range(rows):
+        birthday = start + datetime.timedelta(days=rnd.randrange(20000))
+        row = (str(79000000000 + i) if rnd.random() < 0.9 else None,
+               f'user{i}@example.com' if rnd.random() < 0.7 else None,
+               birthday.strftime('%d.%m.%Y') if rnd.random() < 0.8 else None,
+               rnd.choice((0, 1, 2)) if rnd.random() < 0.8 else None,
+               f'first{i % 1000}' if rnd.random() < 0.6 else None,
+               f'last{i % 5000}' if rnd.random() < 0.6 else None)
+        for column, value in zip(columns, row):
+            column.append(value)
+    return columns
+
+
+def make_store():
+    return Store(backend='memory', l1_size=0, write_behind_size=0)
+
+
+def measure(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def report(name, rows, seconds):
+    print(f'{name:<24} {rows:>9} rows {seconds:8.3f} s {rows / seconds:12.0f} rows/s')
+
+
+if __name__ == "__main__":
+    AP = ArgumentParser()
+    AP.add_argument("-n", "--rows", dest='rows', action="store", type=int, default=1000000)
+    AP.add_argument("--compare", dest='compare', action="store", type=int, default=100000,
+                    help="число строк для get_score и проверки совпадения результатов")
+    AP.add_argument("--seed", dest='seed', action="store", type=int, default=0)
+    opts = AP.parse_args()
+    # досрочное обновление случайно, для повторяемых результатов отключено
+    scoring.EARLY_REFRESH = 0
+
+    columns = make_columns(opts.rows, opts.seed)
+    print(f'engine: {"numpy " + scoring.np.__version__ if scoring.np else "pure python"}')
+
+    compare = min(opts.compare, opts.rows)
+    store = make_store()
+    expected, seconds = measure(lambda: [get_score(store, *row)
+                                         for row in zip(*(c[:compare] for c in columns))])
+    report('get_score, cold cache', compare, seconds)
+    _, seconds = measure(lambda: [get_score(store, *row)
+                                  for row in zip(*(c[:compare] for c in columns))])
+    report('get_score, warm cache', compare, seconds)
+
+    store = make_store()
+    scores, seconds = measure(lambda: score_batch(store, *columns, write_behind=False))
+    report('score_batch, cold cache', opts.rows, seconds)
+    _, seconds = measure(lambda: score_batch(store, *columns, write_behind=False))
+    report('score_batch, warm cache', opts.rows, seconds)
+
+    if scores[:compare] != expected:
+        raise SystemExit('score_batch results differ from get_score')
+    print(f'results match get_score for {compare} rows')
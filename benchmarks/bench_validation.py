@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Микробенчмарк валидации запросов
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_validation
+"""
+
+import timeit
+from argparse import ArgumentParser
+
+from api_requests import OnlineScoreRequest, MethodRequest
+
+ARGUMENTS = {"phone": "79175002040", "email": "stupnikov@otus.ru", "gender": 1,
+             "birthday": "01.01.2000", "first_name": "a", "last_name": "b"}
+METHOD = {"account": "horns&hoofs", "login": "h&f", "method": "online_score",
+          "token": "0" * 128, "arguments": ARGUMENTS}
+
+
+def validate_online_score():
+    OnlineScoreRequest().validate(ARGUMENTS)
+
+
+def validate_method():
+    MethodRequest().validate(METHOD)
+
+
+def measure(func, number, repeat):
+    """Лучшее время одного вызова func в микросекундах"""
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1e6
+
+
+if __name__ == "__main__":
+    AP = ArgumentParser()
+    AP.add_argument("-n", "--number", dest='number', action="store", type=int, default=20000)
+    AP.add_argument("-r", "--repeat", dest='repeat', action="store", type=int, default=5)
+    opts = AP.parse_args()
+    for name, func in (('OnlineScoreRequest', validate_online_score),
+                       ('MethodRequest', validate_method)):
+        print(f'{name}: {measure(func, opts.number, opts.repeat):.2f} us per request')
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import monotonic
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+# момент (по monotonic), после которого запрос не должен ждать хранилище
+_deadline = ContextVar('deadline', default=None)
+
+
+@contextmanager
+def deadline(seconds):
+    """Бюджет времени на обращения к хранилищу в пределах одного запроса"""
+    token = _deadline.set(monotonic() + seconds if seconds else None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def time_left():
+    """Остаток бюджета текущего запроса в секундах или None, если бюджета нет"""
+    until = _deadline.get()
+    return None if until is None else until - monotonic()
+
+
+class CircuitBreaker:
+    """Автомат closed - open - half-open для обращений к хранилищу
+
+    После failure_threshold ошибок подряд обращения отклоняются сразу
+    в течение reset_timeout секунд, затем пропускается одна пробная
+    операция: успех закрывает автомат, ошибка снова открывает его.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=5):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self._probe = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Можно ли выполнить операцию сейчас"""
+        if self.state == CLOSED:
+            return True
+        with self._lock:
+            if self.state == OPEN and monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._probe = False
+            if self.state == HALF_OPEN and not self._probe:
+                self._probe = True
+                return True
+            return False
+
+    def record_success(self):
+        if self.state == CLOSED and not self.failures:
+            return
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._probe = False
+
+    def release(self):
+        """Операция завершилась без результата: пробную операцию можно выполнить снова"""
+        if self.state == CLOSED:
+            return
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probe = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = monotonic()
+                self._probe = False
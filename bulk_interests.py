@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Загрузка интересов клиентов в хранилище и выгрузка из него
+
+Формат файла - JSONL, одна запись на клиента:
+    {"client_id": 1, "interests": ["cars", "pets"]}
+
+Запуск:
+    python bulk_interests.py load interests.jsonl --batch-size 5000 --threads 4
+    python bulk_interests.py export --output interests.jsonl
+"""
+
+import json
+import logging
+import sys
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+
+from backends import BACKENDS
+from bulk_score import DEFAULT_PROGRESS_INTERVAL, Progress, chunked, ordered_map, read_jsonl
+from logger import setup_logging
+from scoring import decode_interests
+from store import Store
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_THREADS = 4
+KEY_PREFIX = 'i:'
+
+
+def parse_interests(record):
+    """Ключ и значение хранилища из строки JSONL, ValueError для некорректной записи"""
+    record = json.loads(record)
+    if not isinstance(record, dict):
+        raise ValueError('Record must be an object')
+    client_id, interests = record.get('client_id'), record.get('interests')
+    if isinstance(client_id, bool) or not isinstance(client_id, (int, str)) or \
+            not str(client_id).isdigit():
+        raise ValueError(f'Invalid client_id {client_id!r}')
+    if isinstance(interests, list):
+        interests = json.dumps(interests, ensure_ascii=False)
+    elif not isinstance(interests, str):
+        raise ValueError(f'Invalid interests {interests!r}')
+    return f'{KEY_PREFIX}{client_id}', interests
+
+
+def write_batch(store, batch, ttl=None):
+    """Запись порции строк одним пайплайном на узел, возвращает число строк и ошибок"""
+    mapping, errors = {}, 0
+    for line_no, record in batch:
+        try:
+            name, value = parse_interests(record)
+        except ValueError as e:
+            errors += 1
+            logging.warning('Line %s skipped: %s', line_no, e)
+            continue
+        mapping[name] = value
+    if mapping and not store.set_many(mapping, ttl or None):
+        # пайплайн не сообщает, какие команды не выполнены: ошибкой считается вся порция
+        errors += len(mapping)
+        logging.warning('Lines %s-%s: store write failed', batch[0][0], batch[-1][0])
+    return len(batch), errors
+
+
+def load(store, records, batch_size=DEFAULT_BATCH_SIZE, ttl=None, threads=DEFAULT_THREADS,
+         progress_interval=DEFAULT_PROGRESS_INTERVAL):
+    """Загрузка строк (номер строки, запись) порциями в threads потоков
+
+    Пока один поток ждет ответа redis на пайплайн, остальные отправляют свои.
+    """
+    progress = Progress(progress_interval, ('Loading', 'Loaded'))
+    with ThreadPoolExecutor(threads, thread_name_prefix='interests-load') as executor:
+        batches = chunked(records, batch_size)
+        for count, errors in ordered_map(executor, lambda batch: write_batch(store, batch, ttl),
+                                         batches, threads * 2):
+            progress.update(count, errors)
+    progress.report(done=True)
+    return progress
+
+
+def export(store, output, match=KEY_PREFIX + '*', batch_size=DEFAULT_BATCH_SIZE,
+           progress_interval=DEFAULT_PROGRESS_INTERVAL):
+    """Выгрузка ключей по шаблону SCAN, значения читаются порциями одним запросом"""
+    progress = Progress(progress_interval, ('Exporting', 'Exported'))
+    for keys in chunked(store.scan(match, batch_size), batch_size):
+        lines = []
+        for key, value in zip(keys, store.get_many(keys)):
+            # ключ мог истечь между SCAN и чтением
+            if value is None:
+                continue
+            client_id = key[len(KEY_PREFIX):] if key.startswith(KEY_PREFIX) else key
+            lines.append(json.dumps({
+                'client_id': int(client_id) if client_id.isdigit() else client_id,
+                'interests': decode_interests(value)}, ensure_ascii=False) + '\n')
+        output.write(''.join(lines))
+        progress.update(len(lines), 0)
+    output.flush()
+    progress.report(done=True)
+    return progress
+
+
+if __name__ == "__main__":
+    AP = ArgumentParser()
+    AP.add_argument("command", choices=('load', 'export'))
+    AP.add_argument("path", nargs='?', default='-',
+                    help="JSONL file to load from or export to, - for stdin/stdout")
+    AP.add_argument("-o", "--output", dest='output', action="store",
+                    help="export file, same as path")
+    AP.add_argument("--batch-size", dest='batch_size', action="store", type=int,
+                    default=DEFAULT_BATCH_SIZE, help="keys per pipeline or SCAN/MGET batch")
+    AP.add_argument("--ttl", dest='ttl', action="store", type=int, default=0,
+                    help="seconds loaded keys live, 0 - without expiry")
+    AP.add_argument("--threads", dest='threads', action="store", type=int,
+                    default=DEFAULT_THREADS, help="pipelines sent concurrently on load")
+    AP.add_argument("--match", dest='match', action="store", default=KEY_PREFIX + '*',
+                    help="key pattern for export")
+    AP.add_argument("--progress", dest='progress', action="store", type=float,
+                    default=DEFAULT_PROGRESS_INTERVAL, help="seconds between progress reports")
+    AP.add_argument("--store-backend", dest='backend', action="store", choices=sorted(BACKENDS),
+                    help="store backend, by default from settings.ini")
+    AP.add_argument("-l", "--log", dest='log', action="store", default=None)
+    opts = AP.parse_args()
+    setup_logging(opts.log)
+    store = Store(backend=opts.backend, l1_size=0, write_behind_size=0)
+    path = opts.output or opts.path
+    try:
+        if opts.command == 'load':
+            source = sys.stdin if path == '-' else open(path, encoding='utf-8')
+            with source:
+                load(store, read_jsonl(source), opts.batch_size, opts.ttl, opts.threads,
+                     opts.progress)
+        else:
+            target = sys.stdout if path == '-' else open(path, 'w', encoding='utf-8')
+            with target:
+                export(store, target, opts.match, opts.batch_size, opts.progress)
+    except KeyboardInterrupt:
+        sys.exit(1)
+    finally:
+        store.disconnect()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Пакетный скоринг записей из файла JSONL или CSV без HTTP сервера
+
+Каждая запись - аргументы online_score. Результаты выводятся в JSONL
+в порядке входных записей:
+    {"line": 1, "score": 3.0}
+    {"line": 2, "error": "Fields validate error: ..."}
+
+Запуск:
+    python bulk_score.py records.jsonl --output scores.jsonl --processes 4
+    cat records.csv | python bulk_score.py --format csv
+"""
+
+import csv
+import json
+import logging
+import os
+import sys
+import time
+from argparse import ArgumentParser
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from api_requests import OnlineScoreRequest
+from backends import BACKENDS
+from custom_erros import ValidationError
+from logger import setup_logging
+from scoring import score_batch
+from store import Store
+
+DEFAULT_CHUNK_SIZE = 1000
+# интервал в секундах между сообщениями о прогрессе
+DEFAULT_PROGRESS_INTERVAL = 5
+# число порций в обработке на один процесс: ограничивает память при упорядоченном выводе
+CHUNKS_PER_PROCESS = 2
+SCORE_FIELDS = ('phone', 'email', 'birthday', 'gender', 'first_name', 'last_name')
+
+# хранилище процесса, создается в init_worker
+_store = None
+
+
+def read_jsonl(stream):
+    """Номера и строки непустых строк файла, разбор выполняется в процессах пула"""
+    for line_no, line in enumerate(stream, start=1):
+        if line.strip():
+            yield line_no, line
+
+
+def read_csv(stream):
+    """Номера строк и записи CSV с заголовком, пустые значения - отсутствующие поля"""
+    reader = csv.DictReader(stream)
+    for row in reader:
+        record = {name: value for name, value in row.items() if name and value}
+        # в CSV все значения строки, gender в запросе - число
+        gender = record.get('gender')
+        if isinstance(gender, str) and gender.isdigit():
+            record['gender'] = int(gender)
+        yield reader.line_num, record
+
+
+READERS = {'jsonl': read_jsonl, 'csv': read_csv}
+
+
+def init_worker(store_options=None):
+    """Хранилище процесса: соединения с redis не переживают fork"""
+    global _store
+    _store = Store(**dict(store_options or {}, l1_size=0, write_behind_size=0))
+
+
+def parse_record(record):
+    """Аргументы скоринга из записи, ValidationError для некорректной записи"""
+    if isinstance(record, str):
+        try:
+            record = json.loads(record)
+        except ValueError as e:
+            raise ValidationError(f'Invalid JSON: {e}')
+    if not isinstance(record, dict):
+        raise ValidationError('Record must be an object')
+    request = OnlineScoreRequest()
+    request.validate(record)
+    return [getattr(request, name) for name in SCORE_FIELDS]
+
+
+def score_chunk(chunk):
+    """Скоринг порции записей, возвращает строки результата и число ошибок
+
+    Записи проверяются по правилам online_score, корректные оцениваются
+    одним вызовом score_batch.
+    """
+    results, rows = [], []
+    # ошибки полей попадают в результат, в лог они не пишутся
+    logging.disable(logging.ERROR)
+    try:
+        for line_no, record in chunk:
+            try:
+                rows.append(parse_record(record))
+                results.append({'line': line_no})
+            except ValidationError as e:
+                results.append({'line': line_no, 'error': e.message})
+    finally:
+        logging.disable(logging.NOTSET)
+    scores = iter(score_batch(_store, *map(list, zip(*rows)), write_behind=False)
+                  if rows else ())
+    for result in results:
+        if 'error' not in result:
+            result['score'] = next(scores)
+    errors = len(results) - len(rows)
+    return ''.join(json.dumps(result) + '\n' for result in results), len(results), errors
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def ordered_map(executor, func, iterable, window):
+    """Результаты func в порядке входа, в обработке не больше window элементов"""
+    pending = deque()
+    for item in iterable:
+        pending.append(executor.submit(func, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+class Progress:
+    """Периодическое сообщение о числе обработанных записей и скорости"""
+
+    def __init__(self, interval=DEFAULT_PROGRESS_INTERVAL, action=('Scoring', 'Scored')):
+        self.interval = interval
+        self.action = action
+        self.records = 0
+        self.errors = 0
+        self.started_at = self.reported_at = time.monotonic()
+
+    def update(self, records, errors):
+        self.records += records
+        self.errors += errors
+        if self.interval and time.monotonic() - self.reported_at >= self.interval:
+            self.report()
+
+    def report(self, done=False):
+        now = time.monotonic()
+        self.reported_at = now
+        elapsed = now - self.started_at
+        logging.info('%s %s records, %s errors, %.0f records/s, %.1f s',
+                     self.action[done], self.records, self.errors,
+                     self.records / elapsed if elapsed else 0, elapsed)
+
+
+def run(records, output, processes=1, chunk_size=DEFAULT_CHUNK_SIZE, store_options=None,
+        progress_interval=DEFAULT_PROGRESS_INTERVAL):
+    """Скоринг записей (номер строки, запись) с записью результатов в output по порядку"""
+    progress = Progress(progress_interval)
+    chunks = chunked(records, chunk_size)
+    if processes == 1:
+        init_worker(store_options)
+        results = map(score_chunk, chunks)
+        executor = None
+    else:
+        processes = processes or os.cpu_count()
+        executor = ProcessPoolExecutor(processes, initializer=init_worker,
+                                       initargs=(store_options,))
+        results = ordered_map(executor, score_chunk, chunks, processes * CHUNKS_PER_PROCESS)
+    try:
+        for lines, count, errors in results:
+            output.write(lines)
+            progress.update(count, errors)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    output.flush()
+    progress.report(done=True)
+    return progress
+
+
+def detect_format(path):
+    return 'csv' if path and path.lower().endswith('.csv') else 'jsonl'
+
+
+if __name__ == "__main__":
+    AP = ArgumentParser()
+    AP.add_argument("input", nargs='?', default='-', help="JSONL or CSV file, - for stdin")
+    AP.add_argument("-o", "--output", dest='output', action="store", default='-')
+    AP.add_argument("-f", "--format", dest='format', action="store", choices=sorted(READERS),
+                    help="input format, by default by file extension")
+    AP.add_argument("--processes", dest='processes', action="store", type=int, default=0,
+                    help="number of worker processes, 0 - one per CPU core")
+    AP.add_argument("--chunk-size", dest='chunk_size', action="store", type=int,
+                    default=DEFAULT_CHUNK_SIZE, help="records scored by a worker at a time")
+    AP.add_argument("--progress", dest='progress', action="store", type=float,
+                    default=DEFAULT_PROGRESS_INTERVAL, help="seconds between progress reports")
+    AP.add_argument("--store-backend", dest='backend', action="store", choices=sorted(BACKENDS),
+                    help="store backend, by default from settings.ini")
+    AP.add_argument("-l", "--log", dest='log', action="store", default=None)
+    opts = AP.parse_args()
+    setup_logging(opts.log)
+    fmt = opts.format or detect_format(opts.input)
+    source = sys.stdin if opts.input == '-' else open(opts.input, newline='', encoding='utf-8')
+    target = sys.stdout if opts.output == '-' else open(opts.output, 'w', encoding='utf-8')
+    try:
+        run(READERS[fmt](source), target, opts.processes, opts.chunk_size,
+            {'backend': opts.backend} if opts.backend else None, opts.progress)
+    except KeyboardInterrupt:
+        sys.exit(1)
+    finally:
+        for stream in (source, target):
+            if stream not in (sys.stdin, sys.stdout):
+                stream.close()
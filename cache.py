@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import sys
+import threading
+from collections import OrderedDict
+from time import monotonic
+
+
+class LRUCache:
+    """Потокобезопасный LRU кэш с временем жизни записей
+
+    Размер ограничен числом записей maxsize и приблизительным объемом
+    памяти max_bytes, при переполнении вытесняются давно не использованные
+    записи.
+    """
+
+    def __init__(self, maxsize=10000, ttl=300, max_bytes=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _sizeof(key, value):
+        return sys.getsizeof(key) + sys.getsizeof(value)
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            expires_at, value, size = item
+            if expires_at <= monotonic():
+                del self._data[key]
+                self.nbytes -= size
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        size = self._sizeof(key, value)
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[2]
+            self._data[key] = (monotonic() + ttl, value, size)
+            self.nbytes += size
+            while self._data and (len(self._data) > self.maxsize or
+                                  self.max_bytes and self.nbytes > self.max_bytes):
+                _, (_, _, evicted_size) = self._data.popitem(last=False)
+                self.nbytes -= evicted_size
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is not None:
+                self.nbytes -= item[2]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """Счетчики попаданий, промахов и вытеснений"""
+        return {
+            'size': len(self._data),
+            'bytes': self.nbytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
@@ -6,3 +6,10 @@ class ValidationError(ValueError):
     def __init__(self, message):
         self.message = message
         super().__init__(self.message)
+
+
+class StoreUnavailableError(Exception):
+    """Хранилище недоступно: автомат разомкнут или исчерпан бюджет времени запроса"""
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import datetime
+from functools import lru_cache
 from custom_erros import ValidationError
 
 UNKNOWN = 0
@@ -11,6 +12,23 @@ GENDERS = {
     FEMALE: "female",
 }
 
+DATE_FORMAT = '%d.%m.%Y'
+# число последних разобранных дат, которые хранятся в памяти
+DATE_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def parse_date(value):
+    """Разбор даты в формате DD.MM.YYYY
+
+    Строки фиксированной длины разбираются срезами, остальные (например
+    без ведущих нулей) через strptime.
+    """
+    if (len(value) == 10 and value[2] == '.' and value[5] == '.' and
+            value[:2].isdigit() and value[3:5].isdigit() and value[6:].isdigit()):
+        return datetime.date(int(value[6:]), int(value[3:5]), int(value[:2]))
+    return datetime.datetime.strptime(value, DATE_FORMAT).date()
+
 
 class Field:
     _type = None
@@ -19,27 +37,33 @@ class Field:
         self.required = required
         self.nullable = nullable
         self._name = None
+        # дескриптор слота, в котором хранится значение, задается ApiRequestMeta
+        self.slot = None
 
     def __get__(self, instance, owner):
-        return instance.__dict__[self._name]
+        if instance is None:
+            return self
+        return self.slot.__get__(instance, owner)
 
     def __set_name__(self, owner, name):
         self._name = '_' + name
 
     def __set__(self, owner, value):
+        self.slot.__set__(owner, self.clean(value))
+
+    def clean(self, value):
+        """Проверка значения, возвращает значение для записи в запрос"""
         if value is None and (self.required or not self.nullable):
             raise ValidationError(
                 f'{self.__class__.__name__} is required and not nullable')
         if (value is None or value == '') and self.nullable:
-            owner.__dict__[self._name] = None
-        else:
-            if isinstance(value, self._type):
-                self.validate(value)
-                owner.__dict__[self._name] = value
-            else:
-                raise ValidationError(
-                    f'{self.__class__.__name__} must be {self._type}, '
-                    f'but {type(value).__name__} received')
+            return None
+        if not isinstance(value, self._type):
+            raise ValidationError(
+                f'{self.__class__.__name__} must be {self._type}, '
+                f'but {type(value).__name__} received')
+        self.validate(value)
+        return value
 
     def validate(self, value):
         return True
@@ -78,10 +102,15 @@ class PhoneField(Field):
 
 
 class DateField(CharField):
+    """Дата в формате DD.MM.YYYY, в запрос записывается datetime.date"""
+
+    def clean(self, value):
+        value = super().clean(value)
+        return None if value is None else parse_date(value)
 
     def validate(self, value):
         try:
-            datetime.datetime.strptime(value, '%d.%m.%Y')
+            parse_date(value)
         except Exception as e:
             raise ValidationError("DateField is incorrect")
         return True
@@ -91,8 +120,7 @@ class BirthDayField(DateField):
 
     def validate(self, value):
         super().validate(value)
-        value = str(value)
-        birthday_year = datetime.datetime.strptime(value, '%d.%m.%Y').year
+        birthday_year = parse_date(str(value)).year
         now_year = datetime.datetime.now().year
         if (now_year - birthday_year) > 70:
             raise ValidationError('More than 70 yeas have been since date of birth')
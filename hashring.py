@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import hashlib
+from bisect import bisect, insort
+
+# число виртуальных узлов на один физический
+DEFAULT_VNODES = 160
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(value.encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    """Кольцо консистентного хеширования
+
+    Каждый узел занимает vnodes точек на кольце, ключ принадлежит первому
+    узлу по часовой стрелке. При добавлении узла на него переходит около
+    1/N ключей, остальные остаются на прежних узлах.
+    """
+
+    def __init__(self, nodes=(), vnodes=DEFAULT_VNODES):
+        self.vnodes = vnodes
+        self.nodes = []
+        self._points = []
+        self._owners = {}
+        for node in nodes:
+            self.add_node(node)
+
+    def add_node(self, node):
+        if node in self.nodes:
+            return
+        self.nodes.append(node)
+        for i in range(self.vnodes):
+            point = _hash(f'{node}#{i}')
+            # совпадение точек разных узлов практически невозможно, первая остается за своим узлом
+            if point not in self._owners:
+                self._owners[point] = node
+                insort(self._points, point)
+
+    def remove_node(self, node):
+        if node not in self.nodes:
+            return
+        self.nodes.remove(node)
+        self._points = [point for point in self._points if self._owners[point] != node]
+        self._owners = {point: self._owners[point] for point in self._points}
+
+    def get_node(self, key):
+        """Узел, которому принадлежит ключ"""
+        if not self._points:
+            raise LookupError('Hash ring is empty')
+        if len(self.nodes) == 1:
+            return self.nodes[0]
+        i = bisect(self._points, _hash(str(key)))
+        return self._owners[self._points[i % len(self._points)]]
+
+    def split(self, keys):
+        """Группировка ключей по узлам: {узел: [индексы ключей]}"""
+        groups = {}
+        for i, key in enumerate(keys):
+            groups.setdefault(self.get_node(key), []).append(i)
+        return groups
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_FORMAT = '[%(asctime)s] %(levelname).1s %(message)s'
+LOG_DATE_FORMAT = '%Y.%m.%d %H:%M:%S'
+# максимальное число записей, ожидающих записи в файл
+LOG_QUEUE_SIZE = 10000
+
+# доля запросов, для которых в лог попадают тела запроса и ответа
+payload_sample_rate = 1.0
+_config = None
+_listener = None
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Передача записей в очередь без форматирования в потоке запроса
+
+    При переполнении очереди записи отбрасываются, обработчик запроса
+    не ждет фоновую запись в файл.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        if record.exc_info:
+            return super().prepare(record)
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RequestLine:
+    """Структурированная строка лога запроса, json строится только при записи"""
+    __slots__ = ('context', 'request', 'response')
+
+    def __init__(self, context, request=None, response=None):
+        self.context = context
+        self.request = request
+        self.response = response
+
+    def __str__(self):
+        line = dict(self.context)
+        if self.request is not None:
+            line['request'] = mask_token(self.request)
+        if self.response is not None:
+            line['response'] = self.response
+        return json.dumps(line, ensure_ascii=False, default=str)
+
+
+def mask_token(request):
+    """Копия запроса без токена авторизации"""
+    if isinstance(request, list):
+        return [mask_token(item) for item in request]
+    if isinstance(request, dict) and 'token' in request:
+        return dict(request, token='***')
+    return request
+
+
+def log_request_line(context, request=None, response=None):
+    """Одна строка лога на запрос, тела запроса и ответа пишутся выборочно"""
+    if not logging.root.isEnabledFor(logging.INFO):
+        return
+    if payload_sample_rate < 1 and random.random() >= payload_sample_rate:
+        request = response = None
+    logging.info('%s', RequestLine(context, request, response))
+
+
+def log_slow_request(context, request=None):
+    """Разбивка времени медленного запроса вместе с телом запроса без учета выборки"""
+    logging.warning('Slow request %s', RequestLine(context, request))
+
+
+def setup_logging(filename=None, level=logging.INFO, sample_rate=1.0):
+    """Логирование через очередь, запись в файл выполняет фоновый поток"""
+    global payload_sample_rate, _config, _listener
+    payload_sample_rate = sample_rate
+    if _config is None:
+        atexit.register(stop_logging)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=_restart_in_child)
+    _config = (filename, level)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    stop_logging()
+
+    target = logging.FileHandler(filename) if filename else logging.StreamHandler()
+    target.setFormatter(logging.Formatter(LOG_FORMAT, LOG_DATE_FORMAT))
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    root.addHandler(DroppingQueueHandler(log_queue))
+    root.setLevel(level)
+    _listener = QueueListener(log_queue, target)
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    """Запись оставшихся в очереди записей и остановка фонового потока"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def _restart_in_child():
+    """Фоновый поток не переживает fork, в дочернем процессе он создается заново"""
+    global _listener
+    if _config is None:
+        return
+    # поток родителя в дочернем процессе не существует, останавливать нечего
+    _listener = None
+    setup_logging(*_config, sample_rate=payload_sample_rate)
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+import threading
+from bisect import bisect_left
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5)
+STORE_BUCKETS = (.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1)
+BATCH_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join(f'{name}="{_escape(value)}"' for name, value in pairs)
+
+
+def _number(value):
+    return '+Inf' if value == float('inf') else str(value)
+
+
+class Registry:
+    """Набор метрик, выводимых на /metrics"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+
+    def expose(self):
+        """Метрики в текстовом формате Prometheus"""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    """Метрика с отдельными значениями для каждого потока
+
+    Поток пишет только в свою копию без блокировок, копии суммируются
+    при чтении. Блокировка берется один раз при первой записи потока.
+    """
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    def _collect(self):
+        """Копии значений всех потоков, dict.copy атомарен относительно записи"""
+        with self._lock:
+            shards = list(self._shards)
+        return [shard.copy() for shard in shards]
+
+    def samples(self):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, *labels, amount=1):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def values(self):
+        """Суммы по наборам меток"""
+        total = {}
+        for shard in self._collect():
+            for labels, value in shard.items():
+                total[labels] = total.get(labels, 0) + value
+        return total
+
+    def samples(self):
+        for labels, value in sorted(self.values().items()):
+            yield f'{self.name}{_labels(self.labelnames, labels)} {_number(value)}'
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS,
+                 registry=REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        shard = self._shard()
+        item = shard.get(labels)
+        if item is None:
+            # число попаданий в каждый интервал, последний - выше всех границ, затем сумма
+            item = shard[labels] = [0] * (len(self.buckets) + 2)
+        item[bisect_left(self.buckets, value)] += 1
+        item[-1] += value
+
+    def values(self):
+        """Попадания в интервалы и сумма по наборам меток"""
+        total = {}
+        for shard in self._collect():
+            for labels, item in shard.items():
+                current = total.setdefault(labels, [0] * len(item))
+                for i, value in enumerate(list(item)):
+                    current[i] += value
+        return total
+
+    def samples(self):
+        for labels, item in sorted(self.values().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), item[:-1]):
+                cumulative += count
+                le = (('le', _number(bound)),)
+                yield f'{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.labelnames, labels)} {item[-1]!r}'
+            yield f'{self.name}_count{_labels(self.labelnames, labels)} {cumulative}'
+
+
+class Gauge(Metric):
+    """Значение, вычисляемое функцией при чтении метрик"""
+    type = 'gauge'
+
+    def __init__(self, name, documentation, func=None, registry=REGISTRY):
+        super().__init__(name, documentation, registry=registry)
+        self.func = func
+
+    def set_function(self, func):
+        self.func = func
+
+    def samples(self):
+        if self.func is not None:
+            yield f'{self.name} {_number(self.func())}'
+
+
+REQUESTS = Counter('api_requests_total', 'Requests by API method and response code',
+                   ('method', 'code'))
+REQUEST_LATENCY = Histogram('api_request_duration_seconds', 'Request processing time',
+                            ('method',))
+PHASE_LATENCY = Histogram('api_request_phase_seconds', 'Request processing time by phase',
+                          ('phase',), buckets=STORE_BUCKETS)
+STORE_LATENCY = Histogram('store_operation_duration_seconds',
+                          'Time spent in the store backend per operation', ('operation',),
+                          buckets=STORE_BUCKETS)
+STORE_RETRIES = Counter('store_retries_total',
+                        'Store operations retried after a connection error', ('operation',))
+SCORE_CACHE = Counter('score_cache_total', 'get_score cache lookups by result', ('result',))
+WRITE_BEHIND_DEPTH = Gauge('store_write_behind_depth',
+                           'Cache writes waiting in the write-behind queue')
+WRITE_BEHIND_DROPPED = Counter('store_write_behind_dropped_total',
+                               'Cache writes dropped because the write-behind queue was full')
+L1_CACHE_ENTRIES = Gauge('store_l1_cache_entries', 'Entries in the in-process store caches')
+L1_CACHE_BYTES = Gauge('store_l1_cache_bytes',
+                       'Approximate memory used by the in-process store caches')
+L1_CACHE_HITS = Gauge('store_l1_cache_hits', 'In-process store cache hits since start')
+L1_CACHE_MISSES = Gauge('store_l1_cache_misses', 'In-process store cache misses since start')
+L1_CACHE_EVICTIONS = Gauge('store_l1_cache_evictions',
+                           'In-process store cache entries evicted by size since start')
+INTERESTS_BATCH = Histogram('clients_interests_batch_size',
+                            'Number of client_ids in a clients_interests request',
+                            buckets=BATCH_BUCKETS)
+
+
+def observe_request(method, code, seconds):
+    """Учет запроса к методу API с кодом ответа code"""
+    REQUESTS.inc(method, str(code))
+    REQUEST_LATENCY.observe(seconds, method)
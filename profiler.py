@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+import cProfile
+import logging
+import os
+import pstats
+import threading
+import time
+from itertools import count
+
+# профилируется один запрос из DEFAULT_RATE
+DEFAULT_RATE = 100
+# период в секундах, за который профили запросов собираются в один файл
+DEFAULT_INTERVAL = 60
+# число хранимых файлов профиля
+DEFAULT_KEEP = 10
+
+
+class SamplingProfiler:
+    """Профилирование cProfile одного запроса из rate на работающем сервере
+
+    Профили выбранных запросов суммируются и раз в interval секунд
+    записываются в файл pstats в directory, хранятся последние keep файлов.
+    Одновременно профилируется не больше одного запроса, остальные
+    выполняются без профилировщика.
+    """
+
+    def __init__(self, directory='profiles', rate=DEFAULT_RATE, interval=DEFAULT_INTERVAL,
+                 keep=DEFAULT_KEEP):
+        self.directory = directory
+        self.rate = rate
+        self.interval = interval
+        self.keep = keep
+        self.enabled = False
+        self.sampled = 0
+        self._counter = count()
+        self._busy = threading.Lock()
+        self._stats = None
+        self._dumps = 0
+        self._started_at = time.monotonic()
+
+    def configure(self, enabled=None, rate=None):
+        """Включение, выключение и смена частоты, при выключении накопленное записывается"""
+        if rate is not None:
+            self.rate = max(1, int(rate))
+        if enabled is not None and enabled != self.enabled:
+            self.enabled = enabled
+            logging.info('Profiler %s, 1 of %s requests', 'enabled' if enabled else 'disabled',
+                         self.rate)
+            if not enabled:
+                self.dump()
+        return self.state()
+
+    def toggle(self, *args):
+        """Обработчик сигнала: переключение профилирования
+
+        Выполняется в отдельном потоке: прерванный сигналом поток может
+        держать блокировку очереди логов или профилировщика.
+        """
+        threading.Thread(target=self.configure, kwargs={'enabled': not self.enabled},
+                         daemon=True).start()
+
+    def state(self):
+        """Состояние профилировщика процесса pid"""
+        return {'enabled': self.enabled, 'rate': self.rate, 'sampled': self.sampled,
+                'directory': self.directory, 'pid': os.getpid()}
+
+    def call(self, func, *args, **kwargs):
+        """Вызов func, каждый rate-й вызов выполняется под cProfile"""
+        if not self.enabled or next(self._counter) % self.rate:
+            return func(*args, **kwargs)
+        # cProfile не допускает несколько активных профилировщиков одновременно
+        if not self._busy.acquire(blocking=False):
+            return func(*args, **kwargs)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.disable()
+                self._add(profile)
+        finally:
+            self._busy.release()
+
+    def _add(self, profile):
+        """Суммирование профиля запроса, вызывается под _busy"""
+        self.sampled += 1
+        if self._stats is None:
+            self._stats = pstats.Stats(profile)
+        else:
+            self._stats.add(profile)
+        if not self.enabled or time.monotonic() - self._started_at >= self.interval:
+            self._dump()
+
+    def dump(self):
+        """Запись накопленного профиля в файл, возвращает путь к файлу или None
+
+        Если сейчас профилируется запрос, запись выполнит он сам по завершении:
+        обработчик сигнала может прервать тот же поток, ожидание привело бы
+        к взаимной блокировке.
+        """
+        if not self._busy.acquire(blocking=False):
+            return None
+        try:
+            return self._dump()
+        finally:
+            self._busy.release()
+
+    def _dump(self):
+        stats, self._stats = self._stats, None
+        self._started_at = time.monotonic()
+        if stats is None:
+            return None
+        self._dumps += 1
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, 'profile-%s-%s-%04d.pstats' % (
+            os.getpid(), time.strftime('%Y%m%d%H%M%S'), self._dumps % 10000))
+        stats.dump_stats(path)
+        logging.info('Profile written to %s', path)
+        self._rotate()
+        return path
+
+    def _rotate(self):
+        """Удаление старых файлов процесса сверх keep"""
+        prefix = 'profile-%s-' % os.getpid()
+        files = sorted(name for name in os.listdir(self.directory)
+                       if name.startswith(prefix) and name.endswith('.pstats'))
+        for name in files[:-self.keep] if self.keep else []:
+            os.remove(os.path.join(self.directory, name))
+
+
+PROFILER = SamplingProfiler()
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+import logging
+import socket
+import threading
+from time import monotonic
+import redis
+from breaker import CircuitBreaker
+
+# ошибки реплики, после которых чтение повторяется на первичном узле
+REPLICA_ERRORS = (redis.ConnectionError, redis.TimeoutError)
+# максимальное отставание реплики в секундах
+DEFAULT_MAX_LAG = 5
+# интервал проверки состояния репликации
+DEFAULT_CHECK_INTERVAL = 5
+# время, на которое реплика исключается после ошибки
+DEFAULT_COOLDOWN = 5
+
+
+def replica_links(info):
+    """Реплики из INFO replication первичного узла по (ip, port)
+
+    lag - секунды с последнего подтверждения смещения репликой, реплика
+    подтверждает его каждую секунду независимо от потока записей.
+    """
+    return {(value.get('ip'), int(value.get('port', 0))): value
+            for key, value in info.items()
+            if key.startswith('slave') and isinstance(value, dict)}
+
+
+class Replica:
+    """Реплика с учетом выполняемых запросов и состояния"""
+
+    def __init__(self, name, client):
+        self.name = name
+        self.client = client
+        self.outstanding = 0
+        self.down_until = 0
+        host, _, port = name.rpartition(':')
+        self.host, self.port = host, int(port) if port.isdigit() else 0
+
+    def mark_down(self, cooldown):
+        self.down_until = monotonic() + cooldown
+
+    def addresses(self):
+        """Адреса, под которыми реплику может показать первичный узел"""
+        addresses = {(self.host, self.port)}
+        try:
+            addresses.add((socket.gethostbyname(self.host), self.port))
+        except OSError:
+            pass
+        return addresses
+
+
+class ReplicaSet:
+    """Первичный узел шарда и его реплики
+
+    Чтения распределяются по репликам с наименьшим числом выполняемых
+    запросов, записи идут на первичный узел. Отстающие и недоступные
+    реплики исключаются, при их отсутствии чтение идет с первичного узла.
+    Отставание проверяет фоновый поток, запросы его не ждут.
+    breaker - автомат отключения шарда.
+    """
+
+    def __init__(self, name, primary, replicas=(), max_lag=DEFAULT_MAX_LAG,
+                 check_interval=DEFAULT_CHECK_INTERVAL, cooldown=DEFAULT_COOLDOWN, breaker=None):
+        self.name = name
+        self.breaker = breaker or CircuitBreaker()
+        self.primary = primary
+        self.replicas = [Replica(replica_name, client) for replica_name, client in replicas]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._checker = None
+
+    @property
+    def clients(self):
+        return [self.primary] + [replica.client for replica in self.replicas]
+
+    def check(self):
+        """Проверка отставания реплик по INFO replication первичного узла"""
+        try:
+            links = replica_links(self.primary.info('replication'))
+        except REPLICA_ERRORS as e:
+            # без первичного узла отставание неизвестно, реплики исключаются только по ошибкам чтения
+            logging.info('Replication state of %s is unavailable: %s', self.name, e)
+            return
+        for replica in self.replicas:
+            link = next((links[address] for address in replica.addresses() if address in links),
+                        None)
+            lag = link.get('lag', -1) if link else -1
+            if link is None or link.get('state') != 'online' or lag < 0 or lag > self.max_lag:
+                logging.info('Replica %s lags behind primary %s', replica.name, self.name)
+                replica.mark_down(self.cooldown)
+
+    def _run_checks(self):
+        while not self._stopped.is_set():
+            try:
+                self.check()
+            except Exception:
+                logging.exception('Replica check failed for %s', self.name)
+            self._stopped.wait(self.check_interval)
+
+    def _ensure_checker(self):
+        """Запуск потока проверки, в том числе после fork, где поток не сохраняется"""
+        checker = self._checker
+        if checker is not None and checker.is_alive() or self._stopped.is_set():
+            return
+        with self._lock:
+            if self._checker is checker:
+                self._checker = threading.Thread(target=self._run_checks, daemon=True,
+                                                 name=f'replica-check-{self.name}')
+                self._checker.start()
+
+    def close(self):
+        """Остановка потока проверки"""
+        self._stopped.set()
+        checker = self._checker
+        if checker is not None and checker is not threading.current_thread():
+            checker.join()
+
+    def pick(self):
+        """Реплика с наименьшим числом выполняемых запросов или None"""
+        if not self.replicas:
+            return None
+        self._ensure_checker()
+        now = monotonic()
+        with self._lock:
+            healthy = [replica for replica in self.replicas if replica.down_until <= now]
+            if not healthy:
+                return None
+            replica = min(healthy, key=lambda item: item.outstanding)
+            replica.outstanding += 1
+            return replica
+
+    def read(self, func):
+        """Чтение func(клиент) с реплики, при ее ошибке - с первичного узла"""
+        replica = self.pick()
+        if replica is None:
+            return func(self.primary)
+        try:
+            return func(replica.client)
+        except REPLICA_ERRORS as e:
+            logging.info('Read from replica %s failed: %s', replica.name, e)
+            replica.mark_down(self.cooldown)
+            return func(self.primary)
+        finally:
+            with self._lock:
+                replica.outstanding -= 1
+
+    def write(self, func):
+        """Запись func(клиент) на первичный узел"""
+        return func(self.primary)
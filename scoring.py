@@ -1,25 +1,66 @@
-import datetime
 import hashlib
+import json
 import logging
+import math
+import random
+import time
+from functools import lru_cache
+from fields import parse_date
+from metrics import SCORE_CACHE
+from singleflight import SingleFlight
+from store import EARLY_REFRESH, SCORE_LOCK_TTL
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
-def get_score(store, phone, email, birthday=None, gender=None, first_name=None, last_name=None):
+SCORE_TTL = 60 * 60
+# время в секундах, которое процесс без блокировки ждет значение, вычисляемое другим процессом
+SCORE_LOCK_WAIT = 0.05
+SCORE_LOCK_POLL = 0.005
+
+# одновременные промахи по одному ключу вычисляются и записываются один раз
+SCORE_FLIGHTS = SingleFlight()
+
+
+@lru_cache(maxsize=65536)
+def _birthday_part(birthday):
+    """Дата рождения в ключе кэша, различных дат немного - результат кэшируется
+
+    Пустая строка - отсутствующая дата: в строковой колонке numpy нет None.
+    """
+    if not birthday:
+        return ""
+    if isinstance(birthday, str):
+        birthday = parse_date(birthday)
+    return birthday.strftime("%Y%m%d")
+
+
+def get_score_key(phone, birthday=None, first_name=None, last_name=None):
+    """Ключ кэша для скоринга, birthday - datetime.date или строка DD.MM.YYYY"""
     key_parts = [
         first_name or "",
         last_name or "",
         str(phone) if phone else "",
-        datetime.datetime.strptime(birthday, '%d.%m.%Y').date().strftime("%Y%m%d")
-        if birthday is not None else "",
+        _birthday_part(birthday),
         ]
-    key = "uid:" + hashlib.md5("".join(key_parts).encode('utf-8')).hexdigest()
-    logging.info('Key: %s', key)
-    # try get from cache,
-    # fallback to heavy calculation in case of cache miss
-    score = store.cache_get(key) or 0
-    if score:
-        logging.info('The value from cache found, will be returned')
-        return score
-    logging.info('Getting value in cache failed, calculating...')
+    return "uid:" + hashlib.md5("".join(key_parts).encode('utf-8')).hexdigest()
+
+
+def get_score_keys(phone, birthday=None, first_name=None, last_name=None):
+    """get_score_key для колонок значений, отсутствующая колонка - None"""
+    n = len(phone)
+    md5 = hashlib.md5
+    return ["uid:" + md5(((first or "") + (last or "") + (str(ph) if ph else "") +
+                          _birthday_part(bd)).encode('utf-8')).hexdigest()
+            for ph, bd, first, last in zip(phone, _column(birthday, n), _column(first_name, n),
+                                           _column(last_name, n))]
+
+
+def calc_score(phone, email, birthday=None, gender=None, first_name=None, last_name=None):
+    """Вычисление скоринга без обращения к кэшу"""
+    score = 0
     if phone:
         score += 1.5
     if email:
@@ -28,11 +69,223 @@ def get_score(store, phone, email, birthday=None, gender=None, first_name=None,
         score += 1.5
     if first_name and last_name:
         score += 0.5
-    # cache for 60 minutes
-    store.cache_set(key, score, 60 * 60)
     return score
 
 
+def _column(values, n):
+    return [None] * n if values is None else values
+
+
+def _present(values, n):
+    """Маска непустых значений колонки numpy"""
+    if values is None:
+        return np.zeros(n, dtype=bool)
+    if isinstance(values, np.ndarray) and values.dtype.kind in 'US':
+        return np.char.str_len(values) > 0
+    if isinstance(values, np.ndarray) and values.dtype.kind in 'biuf':
+        return values != 0
+    return np.fromiter(map(bool, values), dtype=bool, count=n)
+
+
+def _not_none(values, n):
+    """Маска значений колонки numpy, отличных от None"""
+    if values is None:
+        return np.zeros(n, dtype=bool)
+    if isinstance(values, np.ndarray) and values.dtype.kind != 'O':
+        return np.ones(n, dtype=bool)
+    return np.fromiter((value is not None for value in values), dtype=bool, count=n)
+
+
+def calc_scores(phone, email, birthday=None, gender=None, first_name=None, last_name=None):
+    """calc_score для колонок значений (списков или массивов numpy)
+
+    С numpy скоринг вычисляется по маскам заполненных полей, без numpy
+    вызывается calc_score для каждой строки. Отсутствующая колонка - None.
+    """
+    n = len(phone)
+    if np is None:
+        return list(map(calc_score, phone, _column(email, n), _column(birthday, n),
+                        _column(gender, n), _column(first_name, n), _column(last_name, n)))
+    scores = (1.5 * _present(phone, n) + 1.5 * _present(email, n) +
+              1.5 * (_present(birthday, n) & _not_none(gender, n)) +
+              0.5 * (_present(first_name, n) & _present(last_name, n)))
+    return scores.tolist()
+
+
+def encode_score(score, ttl=SCORE_TTL):
+    """Значение кэша: скоринг и unix время истечения"""
+    return '%r|%d' % (score, time.time() + ttl)
+
+
+def decode_score(value):
+    """Скоринг и время истечения из значения кэша, у значений без срока время None"""
+    if not value:
+        return 0, None
+    if not isinstance(value, str):
+        return value, None
+    score, _, expires_at = value.partition('|')
+    try:
+        return float(score), float(expires_at) if expires_at else None
+    except ValueError:
+        logging.info('Invalid cached score %r', value)
+        return 0, None
+
+
+def should_refresh(expires_at, window=None):
+    """Вероятностное обновление до истечения: exp(-остаток / window)
+
+    Популярный ключ обновляет один из первых запросов в окне, и ключ
+    не истекает одновременно для всех запросов.
+    """
+    window = EARLY_REFRESH if window is None else window
+    if not window or expires_at is None:
+        return False
+    return time.time() - window * math.log(1 - random.random()) >= expires_at
+
+
+def wait_score(store, key, timeout=SCORE_LOCK_WAIT):
+    """Ожидание скоринга, который вычисляет и записывает процесс с блокировкой"""
+    until = time.monotonic() + timeout
+    while True:
+        score, _ = decode_score(store.cache_get(key))
+        if score or time.monotonic() >= until:
+            return score
+        time.sleep(SCORE_LOCK_POLL)
+
+
+def refresh_score(store, key, arguments, cached=0):
+    """Вычисление и запись скоринга
+
+    При включенной блокировке вычисляет и пишет только получивший ее процесс.
+    Остальные при досрочном обновлении возвращают текущее значение cached,
+    при промахе ждут значение победителя и только по истечении ожидания
+    вычисляют скоринг сами, без записи.
+    """
+    if SCORE_LOCK_TTL and not store.try_lock('lock:' + key, SCORE_LOCK_TTL):
+        score = cached or wait_score(store, key)
+        return score if score else calc_score(*arguments)
+    score = calc_score(*arguments)
+    store.cache_set(key, encode_score(score), SCORE_TTL)
+    return score
+
+
+def get_score(store, phone, email, birthday=None, gender=None, first_name=None, last_name=None):
+    key = get_score_key(phone, birthday, first_name, last_name)
+    logging.debug('Key: %s', key)
+    # try get from cache,
+    # fallback to heavy calculation in case of cache miss
+    score, expires_at = decode_score(store.cache_get(key))
+    if score:
+        if not should_refresh(expires_at):
+            SCORE_CACHE.inc('hit')
+            logging.debug('The value from cache found, will be returned')
+            return score
+        SCORE_CACHE.inc('refresh')
+        logging.debug('The value from cache expires soon, refreshing...')
+    else:
+        SCORE_CACHE.inc('miss')
+        logging.debug('Getting value in cache failed, calculating...')
+    return SCORE_FLIGHTS.do(key, refresh_score, store, key,
+                            (phone, email, birthday, gender, first_name, last_name), score)
+
+
+def get_score_many(store, arguments):
+    """Скоринг для списка кортежей аргументов get_score"""
+    if not arguments:
+        return []
+    return score_batch(store, *map(list, zip(*arguments)))
+
+
+def score_batch(store, phone, email, birthday=None, gender=None, first_name=None,
+                last_name=None, write_behind=True):
+    """Скоринг для колонок значений, результат совпадает с get_score для каждой строки
+
+    Ключи вычисляются пакетом, кэш читается одним запросом, промахи
+    записываются одним пайплайном на узел. Промахи не объединяются
+    с одновременными вызовами get_score и блокировкой между процессами
+    не защищаются: блокировка и ожидание по каждому ключу лишили бы пакет
+    единственного обращения к кэшу. write_behind=False - запись
+    без очереди отложенной записи, для пакетов больше ее размера.
+    """
+    keys = get_score_keys(phone, birthday, first_name, last_name)
+    scores = calc_scores(phone, email, birthday, gender, first_name, last_name)
+    # время истечения одно для всех записей пакета
+    expires_at = '|%d' % (time.time() + SCORE_TTL)
+    misses, pending, missed, refreshed = {}, {}, 0, 0
+    for i, (key, value) in enumerate(zip(keys, store.cache_get_many(keys))):
+        score, cached_expires_at = decode_score(value)
+        if score and should_refresh(cached_expires_at):
+            refreshed += 1
+            score = 0
+        if not score and key in pending:
+            # строка с тем же ключом выше в пакете: get_score прочитал бы ее значение из кэша
+            score = pending[key]
+        if score:
+            scores[i] = score
+        else:
+            # calc_score возвращает int 0 для строки без заполненных полей
+            score = scores[i] = scores[i] or 0
+            pending[key] = score
+            misses[key] = repr(score) + expires_at
+            missed += 1
+    SCORE_CACHE.inc('hit', amount=len(scores) - missed)
+    SCORE_CACHE.inc('miss', amount=missed - refreshed)
+    SCORE_CACHE.inc('refresh', amount=refreshed)
+    if misses:
+        store.cache_set_many(misses, SCORE_TTL, write_behind=write_behind)
+    return scores
+
+
+def decode_interests(value):
+    """Интересы из значения хранилища: списки хранятся в виде json, строки - как есть"""
+    if not value:
+        return []
+    if value.startswith('['):
+        try:
+            return json.loads(value)
+        except ValueError:
+            pass
+    return value
+
+
 def get_interests(store, cid):
-    r = store.get("i:%s" % cid)
-    return r if r else []
+    return decode_interests(store.get("i:%s" % cid))
+
+
+def get_interests_many(store, cids):
+    """Интересы нескольких клиентов одним запросом, повторяющиеся id запрашиваются один раз"""
+    unique = list(dict.fromkeys(cids))
+    values = store.get_many(["i:%s" % cid for cid in unique])
+    return {cid: decode_interests(r) for cid, r in zip(unique, values)}
+
+
+async def get_score_async(store, phone, email, birthday=None, gender=None, first_name=None,
+                          last_name=None):
+    """get_score для асинхронного хранилища"""
+    key = get_score_key(phone, birthday, first_name, last_name)
+    logging.debug('Key: %s', key)
+    score, expires_at = decode_score(await store.cache_get(key))
+    if score:
+        if not should_refresh(expires_at):
+            SCORE_CACHE.inc('hit')
+            logging.debug('The value from cache found, will be returned')
+            return score
+        SCORE_CACHE.inc('refresh')
+    else:
+        SCORE_CACHE.inc('miss')
+    logging.debug('Getting value in cache failed, calculating...')
+    score = calc_score(phone, email, birthday, gender, first_name, last_name)
+    await store.cache_set(key, encode_score(score), SCORE_TTL)
+    return score
+
+
+async def get_interests_async(store, cid):
+    """get_interests для асинхронного хранилища"""
+    return decode_interests(await store.get("i:%s" % cid))
+
+
+async def get_interests_many_async(store, cids):
+    """get_interests_many для асинхронного хранилища"""
+    unique = list(dict.fromkeys(cids))
+    values = await store.get_many(["i:%s" % cid for cid in unique])
+    return {cid: decode_interests(r) for cid, r in zip(unique, values)}
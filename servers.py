@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from http.server import HTTPServer
+
+DEFAULT_WORKERS = 16
+DEFAULT_BACKLOG = 128
+DEFAULT_KEEPALIVE_TIMEOUT = 5
+DEFAULT_KEEPALIVE_REQUESTS = 100
+# доля потоков пула, которую могут занимать простаивающие keep-alive соединения
+DEFAULT_KEEPALIVE_SHARE = 0.5
+
+
+class ThreadPoolHTTPServer(HTTPServer):
+    """HTTP сервер, обрабатывающий запросы в ограниченном пуле потоков
+
+    Если все потоки заняты, цикл accept ждет освобождения одного из них,
+    а новые соединения копятся в очереди сокета длиной backlog.
+    Простаивающие keep-alive соединения занимают не больше keepalive_share
+    потоков и закрываются, когда свободных потоков не осталось.
+    """
+
+    def __init__(self, server_address, handler_class, workers=DEFAULT_WORKERS,
+                 backlog=DEFAULT_BACKLOG, bind_and_activate=True,
+                 keepalive_share=DEFAULT_KEEPALIVE_SHARE):
+        self.request_queue_size = backlog
+        self.workers = workers
+        self.max_idle = int(workers * keepalive_share)
+        self._idle = set()
+        self._idle_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(workers)
+        self._executor = ThreadPoolExecutor(max_workers=workers,
+                                            thread_name_prefix='api-worker')
+        super().__init__(server_address, handler_class, bind_and_activate)
+
+    def process_request(self, request, client_address):
+        """Передача соединения свободному потоку пула"""
+        if not self._slots.acquire(blocking=False):
+            self.close_idle()
+            self._slots.acquire()
+        try:
+            self._executor.submit(self._process_request, request, client_address)
+        except RuntimeError:
+            logging.info('Worker pool is shut down, dropping connection')
+            self._slots.release()
+            self.shutdown_request(request)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def keepalive_allowed(self):
+        """Можно ли оставить соединение открытым после ответа"""
+        with self._idle_lock:
+            return len(self._idle) < self.max_idle
+
+    @contextmanager
+    def idle(self, connection):
+        """Ожидание следующего запроса по keep-alive соединению"""
+        with self._idle_lock:
+            self._idle.add(connection)
+        try:
+            yield
+        finally:
+            with self._idle_lock:
+                self._idle.discard(connection)
+
+    def close_idle(self):
+        """Закрытие простаивающих соединений, чтобы освободить их потоки"""
+        with self._idle_lock:
+            connections, self._idle = self._idle, set()
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def server_close(self):
+        super().server_close()
+        self.close_idle()
+        self._executor.shutdown(wait=True)
+
+
+def make_server(address, handler_class, workers=1, backlog=DEFAULT_BACKLOG):
+    """Создание однопоточного сервера или сервера с пулом потоков
+
+    Однопоточный сервер закрывает соединение после каждого ответа: ожидающее
+    keep-alive соединение заблокировало бы всех остальных клиентов.
+    """
+    if workers > 1:
+        return ThreadPoolHTTPServer(address, handler_class, workers=workers,
+                                    backlog=backlog)
+    server = HTTPServer(address, handler_class, bind_and_activate=False)
+    server.request_queue_size = backlog
+    try:
+        server.server_bind()
+        server.server_activate()
+    except Exception:
+        server.server_close()
+        raise
+    return server
+
+
+class PreforkSupervisor:
+    """Запуск и перезапуск дочерних процессов, обслуживающих общий сокет
+
+    Сокет создается в родительском процессе до fork и наследуется всеми
+    дочерними процессами, каждый из них принимает соединения сам.
+    """
+    restart_delay = 1
+    # сигналы, которые родительский процесс передает всем дочерним
+    forward_signals = (signal.SIGUSR2,) if hasattr(signal, 'SIGUSR2') else ()
+
+    def __init__(self, server, processes, init_worker=None):
+        if not hasattr(os, 'fork'):
+            raise RuntimeError('Prefork mode is not supported on this platform')
+        self.server = server
+        self.processes = processes or os.cpu_count() or 1
+        self.init_worker = init_worker
+        self.children = {}
+        self._stopping = False
+
+    def spawn(self, number):
+        """Запуск дочернего процесса с порядковым номером number"""
+        pid = os.fork()
+        if pid:
+            self.children[pid] = number
+            logging.info('Worker %s started with pid %s', number, pid)
+            return pid
+        code = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            for signum in self.forward_signals:
+                signal.signal(signum, signal.SIG_DFL)
+            if self.init_worker:
+                self.init_worker()
+            self.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        except Exception:
+            logging.exception('Worker %s failed', number)
+            code = 1
+        finally:
+            self.server.server_close()
+            os._exit(code)
+
+    def stop(self, *args):
+        """Остановка всех дочерних процессов"""
+        self._stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def forward(self, signum, frame=None):
+        """Передача сигнала всем дочерним процессам"""
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        """Цикл наблюдения: перезапуск завершившихся процессов"""
+        signal.signal(signal.SIGTERM, self.stop)
+        for signum in self.forward_signals:
+            signal.signal(signum, self.forward)
+        for number in range(self.processes):
+            self.spawn(number)
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except KeyboardInterrupt:
+                self.stop()
+                continue
+            except ChildProcessError:
+                break
+            number = self.children.pop(pid, None)
+            if number is None or self._stopping:
+                continue
+            logging.info('Worker %s (pid %s) exited with status %s, restarting',
+                         number, pid, status)
+            time.sleep(self.restart_delay)
+            self.spawn(number)
+        self.server.server_close()
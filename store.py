@@ -1,16 +1,37 @@
 # -*- coding: utf-8 -*-
-from time import sleep
+from time import sleep, perf_counter
 from pathlib import Path
+import asyncio
 import logging
 import configparser
+import random
+import weakref
 import redis
+import redis.asyncio as aioredis
+from redis.asyncio.retry import Retry as AsyncRetry
+from backends import BACKENDS, MGET_CHUNK_SIZE, RedisBackend, make_pool, parse_nodes, \
+    pool_exhausted, record_error
+from cache import LRUCache
+from breaker import CircuitBreaker, time_left
+from custom_erros import StoreUnavailableError
+from hashring import HashRing, DEFAULT_VNODES
+from metrics import STORE_LATENCY, STORE_RETRIES, L1_CACHE_BYTES, L1_CACHE_ENTRIES, \
+    L1_CACHE_EVICTIONS, L1_CACHE_HITS, L1_CACHE_MISSES
+from timings import record
+from writebehind import WriteBehind, DEFAULT_MAXSIZE as DEFAULT_WRITE_BEHIND_SIZE
+from replicas import DEFAULT_MAX_LAG
 
 
-def init_config():
-    """Init configuration"""
+def read_config():
+    """Read settings.ini"""
     cp = configparser.ConfigParser()
     config_file = str(Path(__file__).parent.joinpath('settings.ini'))
     cp.read(config_file)
+    return cp
+
+
+def init_config(cp):
+    """Init configuration"""
     cp_section = cp['store']
     host = cp_section.get('HOST')
     port = int(cp_section.get('PORT'))
@@ -18,65 +39,509 @@ def init_config():
     return host, port, timeout
 
 
-def retry(count=3, interval=1):
+def init_backend_config(cp):
+    """Init store backend name, redis by default"""
+    backend = cp['store'].get('BACKEND', 'redis').strip().lower()
+    if backend not in BACKENDS:
+        raise ValueError(f'Unknown store backend {backend}')
+    return backend
+
+
+def init_nodes_config(cp, host, port):
+    """Init shard nodes, by default the single HOST:PORT node"""
+    nodes = cp['store'].get('NODES')
+    return parse_nodes(nodes) if nodes else [(host, port)]
+
+
+def init_pool_config(cp):
+    """Init redis connection pool configuration"""
+    cp_section = cp['store']
+    return {
+        'max_connections': cp_section.getint('MAX_CONNECTIONS', 50),
+        'pool_timeout': cp_section.getfloat('POOL_TIMEOUT', 1),
+        'connect_timeout': cp_section.getfloat('CONNECT_TIMEOUT', 1),
+        'keepalive': cp_section.getboolean('KEEPALIVE', True),
+        'health_check_interval': cp_section.getint('HEALTH_CHECK_INTERVAL', 30),
+        'prewarm': cp_section.getint('PREWARM', 0),
+    }
+
+
+def init_write_behind_config(cp):
+    """Init write-behind cache writes, queue size 0 - cache writes are synchronous"""
+    if not cp.has_section('cache') or not cp['cache'].getboolean('WRITE_BEHIND', False):
+        return 0
+    return cp['cache'].getint('WRITE_BEHIND_SIZE', DEFAULT_WRITE_BEHIND_SIZE)
+
+
+def init_stampede_config(cp):
+    """Init early refresh window and cross-process score lock ttl, 0 - disabled"""
+    if not cp.has_section('cache'):
+        return 0, 0
+    cp_section = cp['cache']
+    return cp_section.getfloat('EARLY_REFRESH', 0), cp_section.getfloat('SCORE_LOCK_TTL', 0)
+
+
+def init_breaker_config(cp):
+    """Init circuit breaker configuration"""
+    if not cp.has_section('breaker'):
+        return 5, 5
+    cp_section = cp['breaker']
+    return cp_section.getint('FAILURE_THRESHOLD', 5), cp_section.getfloat('RESET_TIMEOUT', 5)
+
+
+def init_cache_config(cp):
+    """Init in-process cache configuration"""
+    if not cp.has_section('cache'):
+        return 0, 0, None
+    cp_section = cp['cache']
+    size = cp_section.getint('L1_SIZE', 0)
+    ttl = cp_section.getint('L1_TTL', 300)
+    max_bytes = cp_section.getint('L1_MAX_BYTES', 0) or None
+    return size, ttl, max_bytes
+
+
+# ошибки соединения, после которых операцию имеет смысл повторить
+RETRY_ERRORS = (redis.ConnectionError, redis.TimeoutError)
+
+
+def pool_backpressure(breaker, error):
+    """Отказ без повторов и без ошибки в автомате: повтор снова ждал бы занятый пул"""
+    if breaker is not None:
+        breaker.release()
+    logging.info('Store connection pool exhausted')
+    raise StoreUnavailableError('Connection pool exhausted') from error
+
+
+def backoff_delay(attempt, count, backoff, max_backoff):
+    """Пауза перед следующей попыткой с экспоненциальным ростом и случайным разбросом
+
+    Возвращает None, если попытки или бюджет времени запроса исчерпаны.
+    """
+    if attempt >= count:
+        return None
+    delay = random.uniform(0, min(max_backoff, backoff * 2 ** (attempt - 1)))
+    left = time_left()
+    if left is not None and left <= delay:
+        return None
+    return delay
+
+
+def check_available(breaker):
+    """Быстрый отказ, если бюджет запроса исчерпан или автомат разомкнут
+
+    Бюджет проверяется первым: allow выдает единственную пробную операцию
+    полуоткрытого автомата, и она должна быть выполнена.
+    """
+    left = time_left()
+    if left is not None and left <= 0:
+        raise StoreUnavailableError('Request deadline exceeded')
+    if breaker is not None and not breaker.allow():
+        raise StoreUnavailableError('Circuit breaker is open')
+
+
+def retry(count=3, backoff=0.05, max_backoff=1):
 
     def my_decorator(func):
         def wrapper(*args, **kwargs):
+            breaker = getattr(args[0], 'breaker', None) if args else None
             attempt = 1
             while True:
+                check_available(breaker)
                 try:
-                    return func(*args, **kwargs)
-                except Exception as e:
+                    result = func(*args, **kwargs)
+                except RETRY_ERRORS as e:
+                    if pool_exhausted(e):
+                        pool_backpressure(breaker, e)
+                    if breaker is not None:
+                        breaker.record_failure()
                     logging.info('DB connection failed, attemp: %s', attempt)
+                    delay = backoff_delay(attempt, count, backoff, max_backoff)
+                    if delay is None:
+                        raise e
+                    STORE_RETRIES.inc(func.__name__)
                     attempt += 1
-                    if attempt > count:
+                    sleep(delay)
+                except Exception:
+                    if breaker is not None:
+                        breaker.release()
+                    raise
+                else:
+                    if breaker is not None:
+                        breaker.record_success()
+                    return result
+        return wrapper
+
+    return my_decorator
+
+
+def async_retry(count=3, backoff=0.05, max_backoff=1):
+    """retry для корутин, ожидание не блокирует цикл событий"""
+
+    def my_decorator(func):
+        async def wrapper(*args, **kwargs):
+            breaker = getattr(args[0], 'breaker', None) if args else None
+            attempt = 1
+            while True:
+                check_available(breaker)
+                try:
+                    result = await func(*args, **kwargs)
+                except RETRY_ERRORS as e:
+                    if pool_exhausted(e):
+                        pool_backpressure(breaker, e)
+                    if breaker is not None:
+                        breaker.record_failure()
+                    logging.info('DB connection failed, attemp: %s', attempt)
+                    delay = backoff_delay(attempt, count, backoff, max_backoff)
+                    if delay is None:
                         raise e
-                    sleep(interval)
+                    STORE_RETRIES.inc(func.__name__)
+                    attempt += 1
+                    await asyncio.sleep(delay)
+                except Exception:
+                    if breaker is not None:
+                        breaker.release()
+                    raise
+                else:
+                    if breaker is not None:
+                        breaker.record_success()
+                    return result
         return wrapper
 
     return my_decorator
 
 
-HOST, PORT, SOCKET_TIMEOUT = init_config()
+CONFIG = read_config()
+HOST, PORT, SOCKET_TIMEOUT = init_config(CONFIG)
+BACKEND = init_backend_config(CONFIG)
+L1_SIZE, L1_TTL, L1_MAX_BYTES = init_cache_config(CONFIG)
+WRITE_BEHIND_SIZE = init_write_behind_config(CONFIG)
+EARLY_REFRESH, SCORE_LOCK_TTL = init_stampede_config(CONFIG)
+POOL_OPTIONS = init_pool_config(CONFIG)
+NODES = init_nodes_config(CONFIG, HOST, PORT)
+REPLICAS = CONFIG['store'].get('REPLICAS', '')
+MAX_REPLICA_LAG = CONFIG['store'].getfloat('MAX_REPLICA_LAG', DEFAULT_MAX_LAG)
+FAILURE_THRESHOLD, RESET_TIMEOUT = init_breaker_config(CONFIG)
+# локальные кэши всех экземпляров Store для метрик L1_CACHE_*
+_l1_caches = weakref.WeakSet()
+
+
+def _l1_stat(name):
+    return lambda: sum(cache.stats()[name] for cache in list(_l1_caches))
+
+
+for _gauge, _stat in ((L1_CACHE_ENTRIES, 'size'), (L1_CACHE_BYTES, 'bytes'),
+                      (L1_CACHE_HITS, 'hits'), (L1_CACHE_MISSES, 'misses'),
+                      (L1_CACHE_EVICTIONS, 'evictions')):
+    _gauge.set_function(_l1_stat(_stat))
+
+INTERESTS = ["cars", "pets", "travel", "hi-tech", "sport", "music",
+             "books", "tv", "cinema", "geek", "otus"]
 
 
 class Store:
+    """Хранилище с повторами, автоматом отключения и локальным кэшем
+
+    Данные хранит реализация из BACKENDS, выбранная параметром BACKEND
+    в settings.ini или переданная явно: имя или готовый экземпляр.
+    Параметры узлов, реплик и пула соединений относятся к redis.
+    Экземпляр можно разделять между потоками.
+    """
 
-    def __init__(self, host=HOST, port=PORT, socket_timeout=SOCKET_TIMEOUT):
-        self._r = redis.Redis(host=host, port=port, socket_timeout=socket_timeout, decode_responses=True)
+    def __init__(self, host=None, port=None, socket_timeout=SOCKET_TIMEOUT,
+                 l1_size=L1_SIZE, l1_ttl=L1_TTL, l1_max_bytes=L1_MAX_BYTES, pool_options=None,
+                 breaker=None, nodes=None, vnodes=DEFAULT_VNODES, replicas=None,
+                 max_replica_lag=MAX_REPLICA_LAG, backend=None,
+                 write_behind_size=WRITE_BEHIND_SIZE):
+        self.pool_options = dict(POOL_OPTIONS, **(pool_options or {}))
+        backend = BACKEND if backend is None else backend
+        if backend == 'redis':
+            if host is not None or port is not None:
+                nodes = [(host or HOST, port or PORT)]
+                replicas = replicas or {}
+            backend = RedisBackend(nodes or NODES, REPLICAS if replicas is None else replicas,
+                                   socket_timeout, self.pool_options, vnodes, max_replica_lag,
+                                   {'failure_threshold': FAILURE_THRESHOLD,
+                                    'reset_timeout': RESET_TIMEOUT})
+        elif isinstance(backend, str):
+            if backend not in BACKENDS:
+                raise ValueError(f'Unknown store backend {backend}')
+            backend = BACKENDS[backend]()
+        self.backend = backend
+        # общий автомат хранилища; у redis свой автомат на узле, отказ узла не отключает остальные
+        if breaker is None and not getattr(backend, 'node_breakers', False):
+            breaker = CircuitBreaker(FAILURE_THRESHOLD, RESET_TIMEOUT)
+        self.breaker = breaker
+        # локальный кэш процесса перед хранилищем для cache_get, отключен при l1_size = 0
+        self.l1 = LRUCache(l1_size, l1_ttl, l1_max_bytes) if l1_size else None
+        if self.l1 is not None:
+            _l1_caches.add(self.l1)
+        # очередь отложенной записи cache_set, отключена при write_behind_size = 0
+        self.write_behind = WriteBehind(self._write_many, write_behind_size) \
+            if write_behind_size else None
+
+    @staticmethod
+    def _call(operation, func, *args):
+        """Вызов операции хранилища с учетом времени в метриках"""
+        start = perf_counter()
+        try:
+            return func(*args)
+        finally:
+            elapsed = perf_counter() - start
+            STORE_LATENCY.observe(elapsed, operation)
+            record('store.' + operation, elapsed)
 
     def ping(self):
-        return self._r.ping()
+        return self.backend.ping()
+
+    def prewarm(self, count=None):
+        """Открытие соединений с хранилищем заранее, возвращает число открытых"""
+        return self.backend.prewarm(count)
 
     @retry()
     def get(self, key):
-        return self._r.get(key)
+        return self._call('get', self.backend.get, key)
+
+    @retry()
+    def get_many(self, keys):
+        return self._call('get_many', self.backend.get_many, keys)
 
     @retry()
     def set(self, name, value, ex=None):
-        return self._r.set(name, value, ex)
+        return self._call('set', self.backend.set, name, value, ex)
 
-    def cache_get(self, key):
+    @retry()
+    def set_many(self, mapping, ex=None):
+        """Запись нескольких значений, по одному пайплайну на узел"""
+        return self._call('set_many', self.backend.set_many, mapping, ex)
+
+    def scan(self, match='*', count=1000):
+        """Ключи хранилища по шаблону, без повторов при ошибках соединения"""
+        return self.backend.scan(match, count)
+
+    def _l1_set(self, name, value, ex=None):
+        if self.l1 is not None:
+            # в локальном кэше значение хранится в том же виде, в каком его вернет хранилище
+            self.l1.set(name, value if isinstance(value, str) else repr(value), ex)
+
+    def _guarded(self, func, *args, default=None):
+        """Операция кэша без повторов, при недоступности хранилища возвращает default"""
+        try:
+            check_available(self.breaker)
+        except StoreUnavailableError as e:
+            logging.debug(e)
+            return default
         try:
-            logging.info('Getting value from cache')
-            return self._r.get(key)
+            result = func(*args)
         except Exception as e:
+            record_error(self.breaker, e)
             logging.info(e)
-            return None
+            return default
+        if self.breaker is not None:
+            self.breaker.record_success()
+        return result
+
+    def cache_get(self, key):
+        if self.l1 is not None:
+            value = self.l1.get(key)
+            if value is not None:
+                return value
+        logging.debug('Getting value from cache')
+        value = self._guarded(self._call, 'get', self.backend.get, key)
+        if value is not None:
+            self._l1_set(key, value)
+        return value
 
     def cache_set(self, name, value, ex=None):
+        self._l1_set(name, value, ex)
+        if self.write_behind is not None:
+            return self.write_behind.put(name, value, ex)
+        logging.debug('Writing value to cache')
+        return self._guarded(self._call, 'set', self.backend.set, name, value, ex)
+
+    def cache_get_many(self, keys):
+        values = [self.l1.get(key) for key in keys] if self.l1 is not None else [None] * len(keys)
+        missed = [i for i, value in enumerate(values) if value is None]
+        if not missed:
+            return values
+        logging.debug('Getting %s values from cache', len(missed))
+        found = self._guarded(self._call, 'get_many', self.backend.get_many,
+                             [keys[i] for i in missed])
+        if found is None:
+            return values
+        for i, value in zip(missed, found):
+            if value is not None:
+                values[i] = value
+                self._l1_set(keys[i], value)
+        return values
+
+    def cache_set_many(self, mapping, ex=None, write_behind=True):
+        """Запись нескольких значений в кэш, по одному пайплайну на узел
+
+        write_behind=False - запись сразу, минуя очередь отложенной записи.
+        """
+        for name, value in mapping.items():
+            self._l1_set(name, value, ex)
+        if write_behind and self.write_behind is not None:
+            return self.write_behind.put_many(mapping, ex)
+        return self._write_many(mapping, ex)
+
+    def _write_many(self, mapping, ex=None):
+        logging.debug('Writing %s values to cache', len(mapping))
+        return self._guarded(self._call, 'set_many', self.backend.set_many, mapping, ex)
+
+    def create_interests(self):
+        self.set_many({f'i:{_id}': interest for _id, interest in enumerate(INTERESTS, start=1)})
+
+    def try_lock(self, name, ttl):
+        """Короткая блокировка между процессами, истекает через ttl секунд
+
+        Возвращает True, если блокировка получена или хранилище недоступно:
+        запись в кэш в этом случае все равно не удастся.
+        """
+        return bool(self._guarded(self._call, 'set_nx', self.backend.set_nx, name, '1', ttl,
+                                  default=True))
+
+    def flush(self, timeout=None):
+        """Ожидание записи отложенных значений кэша"""
+        if self.write_behind is not None:
+            return self.write_behind.flush(timeout)
+        return True
+
+    def disconnect(self):
+        """Закрытие соединений, отложенные записи кэша перед этим отправляются"""
+        if self.write_behind is not None:
+            self.write_behind.close()
+        self.backend.disconnect()
+
+
+class AsyncStore:
+    """Асинхронное хранилище с тем же интерфейсом, что и Store
+
+    Для redis используется асинхронный клиент. Остальные реализации из
+    BACKENDS вызываются напрямую: они не обращаются к сети и не блокируют
+    цикл событий.
+    """
+
+    def __init__(self, host=None, port=None, socket_timeout=SOCKET_TIMEOUT, pool_options=None,
+                 breaker=None, nodes=None, vnodes=DEFAULT_VNODES, backend=None):
+        self.pool_options = dict(POOL_OPTIONS, **(pool_options or {}))
+        self.breaker = breaker or CircuitBreaker(FAILURE_THRESHOLD, RESET_TIMEOUT)
+        backend = BACKEND if backend is None else backend
+        # синхронная реализация хранилища, None - асинхронный redis клиент
+        self.backend = None
+        self._clients = {}
+        if backend == 'redis':
+            if host is not None or port is not None:
+                nodes = [(host or HOST, port or PORT)]
+            self._clients = {
+                f'{node_host}:{node_port}': aioredis.Redis(connection_pool=make_pool(
+                    aioredis.BlockingConnectionPool, AsyncRetry, node_host, node_port,
+                    socket_timeout, **self.pool_options))
+                for node_host, node_port in parse_nodes(nodes or NODES)}
+        elif isinstance(backend, str):
+            if backend not in BACKENDS:
+                raise ValueError(f'Unknown store backend {backend}')
+            self.backend = BACKENDS[backend]()
+        elif isinstance(backend, RedisBackend):
+            raise ValueError('Use backend="redis" for an asynchronous redis client')
+        else:
+            self.backend = backend
+        self.ring = HashRing(self._clients, vnodes=vnodes)
+
+    def _client(self, key):
+        return self._clients[self.ring.get_node(key)]
+
+    @staticmethod
+    async def _call(operation, coro_func, *args):
+        """Вызов операции хранилища с учетом времени в метриках"""
+        start = perf_counter()
         try:
-            logging.info('Writing value to cache')
-            return self._r.set(name, value, ex)
+            return await coro_func(*args)
+        finally:
+            elapsed = perf_counter() - start
+            STORE_LATENCY.observe(elapsed, operation)
+            record('store.' + operation, elapsed)
+
+    async def ping(self):
+        if self.backend is not None:
+            return self.backend.ping()
+        return all([await client.ping() for client in self._clients.values()])
+
+    async def _get(self, key):
+        if self.backend is not None:
+            return self.backend.get(key)
+        return await self._client(key).get(key)
+
+    async def _set(self, name, value, ex=None):
+        if self.backend is not None:
+            return self.backend.set(name, value, ex)
+        return await self._client(name).set(name, value, ex)
+
+    @async_retry()
+    async def get(self, key):
+        return await self._call('get', self._get, key)
+
+    @staticmethod
+    async def _mget_node(client, keys):
+        pipe = client.pipeline(transaction=False)
+        for i in range(0, len(keys), MGET_CHUNK_SIZE):
+            pipe.mget(keys[i:i + MGET_CHUNK_SIZE])
+        return [value for chunk in await pipe.execute() for value in chunk]
+
+    async def _mget(self, keys):
+        """Значения нескольких ключей, узлы опрашиваются параллельно"""
+        if not keys:
+            return []
+        if self.backend is not None:
+            return self.backend.get_many(keys)
+        groups = self.ring.split(keys)
+        results = await asyncio.gather(*[
+            self._mget_node(self._clients[node], [keys[i] for i in indexes])
+            for node, indexes in groups.items()])
+        values = [None] * len(keys)
+        for indexes, found in zip(groups.values(), results):
+            for i, value in zip(indexes, found):
+                values[i] = value
+        return values
+
+    @async_retry()
+    async def get_many(self, keys):
+        return await self._call('get_many', self._mget, keys)
+
+    @async_retry()
+    async def set(self, name, value, ex=None):
+        return await self._call('set', self._set, name, value, ex)
+
+    async def create_interests(self):
+        for _id, interest in enumerate(INTERESTS, start=1):
+            await self.set(f'i:{_id}', interest)
+
+    async def _guarded(self, coro_func, *args):
+        """Операция кэша без повторов, при недоступности хранилища возвращает None"""
+        try:
+            check_available(self.breaker)
+        except StoreUnavailableError as e:
+            logging.debug(e)
+            return None
+        try:
+            result = await coro_func(*args)
         except Exception as e:
+            record_error(self.breaker, e)
             logging.info(e)
+            return None
+        self.breaker.record_success()
+        return result
 
-    def create_interests(self):
-        interests = ["cars", "pets", "travel", "hi-tech", "sport", "music",
-                     "books", "tv", "cinema", "geek", "otus"]
-        for _id, interest in enumerate(interests, start=1):
-            self.set(f'i:{_id}', interest)
+    async def cache_get(self, key):
+        logging.debug('Getting value from cache')
+        return await self._guarded(self._call, 'get', self._get, key)
 
-    def disconnect(self):
-        self._r.connection_pool.disconnect()
+    async def cache_set(self, name, value, ex=None):
+        logging.debug('Writing value to cache')
+        return await self._guarded(self._call, 'set', self._set, name, value, ex)
 
+    async def disconnect(self):
+        if self.backend is not None:
+            self.backend.disconnect()
+        for client in self._clients.values():
+            await client.connection_pool.disconnect()
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+import os
+import pytest
+from api import MainHTTPHandler
+from store import Store
+
+
+@pytest.fixture(scope='session', autouse=True)
+def api_store():
+    """Хранилище сервера в памяти, STORE_BACKEND=redis запускает тесты с redis"""
+    store = Store(backend=os.environ.get('STORE_BACKEND', 'memory'))
+    store.create_interests()
+    MainHTTPHandler.store, previous = store, MainHTTPHandler.store
+    yield store
+    MainHTTPHandler.store = previous
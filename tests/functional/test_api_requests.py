@@ -5,9 +5,12 @@ from threading import Thread
 import datetime
 import hashlib
 import json
+import os
+import time
 import pytest
 import constants
 from api import MainHTTPHandler
+from profiler import PROFILER
 
 HOST = "localhost"
 PORT = 8080
@@ -137,3 +140,100 @@ class TestRequests:
         print(response)
         assert response.get("code") == constants.OK
         assert float(response.get("response").get('score')) > 0
+
+    def test_batch_request(self, client_connection):
+        batch = [
+            set_valid_auth({"account": "horns&hoofs", "login": "h&f", "method": "online_score",
+                            "arguments": {"phone": "79175002040", "email": "stupnikov@otus.ru"}}),
+            set_valid_auth({"account": "horns&hoofs", "login": "h&f", "method": "clients_interests",
+                            "arguments": {"client_ids": [1, 2]}}),
+            {"account": "horns&hoofs", "login": "h&f", "method": "online_score", "token": "",
+             "arguments": {}},
+        ]
+        response = do_request(client_connection, batch)
+        assert response.get("code") == constants.OK
+        assert [r.get("code") for r in response["response"]] == [constants.OK, constants.OK,
+                                                                  constants.FORBIDDEN]
+        assert len(response["response"][1]["response"]) == 2
+
+
+class TestMetrics:
+
+    def test_metrics(self, client_connection):
+        do_request(client_connection, set_valid_auth(
+            {"account": "horns&hoofs", "login": "h&f", "method": "clients_interests",
+             "arguments": {"client_ids": [1, 2]}}))
+        client_connection.request("GET", "/metrics")
+        r = client_connection.getresponse()
+        body = r.read().decode('utf-8')
+        assert r.status == 200
+        assert r.getheader('Content-Type').startswith('text/plain')
+        assert 'api_requests_total{method="clients_interests",code="200"}' in body
+        assert 'api_request_duration_seconds_bucket{method="clients_interests",le="+Inf"}' in body
+        assert 'store_operation_duration_seconds_count{operation="get_many"}' in body
+        assert 'clients_interests_batch_size_count' in body
+
+    def test_metrics_post(self, client_connection):
+        client_connection.request("POST", "/metrics", json.dumps({"method": "online_score"}))
+        r = client_connection.getresponse()
+        assert json.load(r).get("code") == constants.NOT_FOUND
+
+
+class TestTimings:
+
+    REQUEST = {"account": "horns&hoofs", "login": "h&f", "method": "clients_interests",
+               "arguments": {"client_ids": [1, 2]}}
+
+    def test_timing_header(self, client_connection, monkeypatch):
+        monkeypatch.setattr(MainHTTPHandler, 'timing_header', True)
+        client_connection.request("POST", "/method/", json.dumps(set_valid_auth(dict(self.REQUEST))))
+        r = client_connection.getresponse()
+        assert json.load(r).get("code") == constants.OK
+        phases = [item.split(';')[0] for item in r.getheader('Server-Timing').split(', ')]
+        for name in ('read', 'json', 'validate', 'auth', 'handler', 'store.get_many', 'serialize'):
+            assert name in phases
+
+    def test_slow_request(self, client_connection, monkeypatch, caplog):
+        monkeypatch.setattr(MainHTTPHandler, 'slow_request_threshold', 1e-9)
+        do_request(client_connection, set_valid_auth(dict(self.REQUEST)))
+        # строка лога пишется после отправки ответа
+        for _ in range(100):
+            slow = [record.getMessage() for record in caplog.records
+                    if record.getMessage().startswith('Slow request')]
+            if slow:
+                break
+            time.sleep(0.01)
+        assert slow
+        line = json.loads(slow[-1][len('Slow request '):])
+        assert line['request']['token'] == '***'
+        assert 'store.get_many' in line['timings']
+
+
+class TestProfile:
+
+    def test_profile_admin_only(self, client_connection):
+        request = {"account": "horns&hoofs", "login": "h&f", "method": "profile",
+                   "arguments": {"enabled": True}}
+        client_connection.request("POST", "/profile/", json.dumps(set_valid_auth(request)))
+        assert json.load(client_connection.getresponse()).get("code") == constants.FORBIDDEN
+
+    def test_profile_toggle(self, client_connection, tmp_path, monkeypatch):
+        monkeypatch.setattr(PROFILER, 'directory', str(tmp_path))
+        request = {"account": "horns&hoofs", "login": "admin", "method": "profile",
+                   "arguments": {"enabled": True, "rate": 1}}
+        client_connection.request("POST", "/profile/", json.dumps(set_valid_auth(request)))
+        response = json.load(client_connection.getresponse())
+        assert response["response"]["enabled"] is True
+        assert response["response"]["pid"] == os.getpid()
+        do_request(client_connection, set_valid_auth(dict(TestTimings.REQUEST)))
+        request["arguments"] = {"enabled": False}
+        client_connection.request("POST", "/profile/", json.dumps(set_valid_auth(request)))
+        response = json.load(client_connection.getresponse())
+        assert response["response"]["enabled"] is False
+        assert response["response"]["sampled"] >= 1
+        # профиль записывает сам профилируемый запрос после отправки ответа
+        for _ in range(100):
+            if list(tmp_path.iterdir()):
+                break
+            time.sleep(0.01)
+        assert len(list(tmp_path.iterdir())) == 1
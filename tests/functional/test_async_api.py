@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+from http.client import HTTPConnection
+from threading import Thread
+import asyncio
+import datetime
+import hashlib
+import json
+import os
+import pytest
+import constants
+from async_api import AsyncHTTPServer
+from store import AsyncStore
+
+HOST = "localhost"
+PORT = 8081
+
+
+@pytest.fixture(scope='module', autouse=True)
+def start_api():
+    loop = asyncio.new_event_loop()
+    store = AsyncStore(backend=os.environ.get('STORE_BACKEND', 'memory'))
+    loop.run_until_complete(store.create_interests())
+    server = loop.run_until_complete(
+        asyncio.start_server(AsyncHTTPServer(store).handle_connection, HOST, PORT))
+    t = Thread(target=loop.run_forever)
+    t.start()
+    yield
+    loop.call_soon_threadsafe(server.close)
+    loop.call_soon_threadsafe(loop.stop)
+    t.join()
+
+
+def do_request(req):
+    connection = HTTPConnection(HOST, PORT)
+    connection.request("POST", "/method/", json.dumps(req))
+    r = connection.getresponse()
+    response = json.load(r)
+    connection.close()
+    return response
+
+
+def set_valid_auth(request):
+    if request.get("login") == constants.ADMIN_LOGIN:
+        request["token"] = hashlib.sha512((datetime.datetime.now().strftime("%Y%m%d%H") +
+                                           constants.ADMIN_SALT).encode('utf-8')).hexdigest()
+    else:
+        msg = request.get("account", "") + request.get("login", "") + constants.SALT
+        request["token"] = hashlib.sha512(msg.encode('utf-8')).hexdigest()
+    return request
+
+
+class TestAsyncRequests:
+
+    def test_bad_auth(self):
+        req = {"account": "horns&hoofs", "login": "h&f", "method": "online_score", "token": "sdd",
+               "arguments": {}}
+        assert do_request(req).get('code') == constants.FORBIDDEN
+
+    @pytest.mark.parametrize("req", [
+        {"account": "horns&hoofs", "login": "h&f", "method": "online_score"},
+        {"account": "horns&hoofs", "login": "h&f", "method": "unknown", "token": "", "arguments": {}},
+        ], ids=lambda arg: str(arg))
+    def test_invalid_method_request(self, req):
+        assert do_request(req).get('code') == constants.INVALID_REQUEST
+
+    def test_invalid_score_request(self):
+        request = {"account": "horns&hoofs", "login": "h&f", "method": "online_score",
+                   "arguments": {"phone": "79175002040"}}
+        response = do_request(set_valid_auth(request))
+        assert response.get('code') == constants.INVALID_REQUEST
+
+    def test_ok_score_admin_request(self):
+        arguments = {"phone": "79175002040", "email": "stupnikov@otus.ru"}
+        request = {"account": "horns&hoofs", "login": "admin", "method": "online_score", "arguments": arguments}
+        response = do_request(set_valid_auth(request))
+        assert response.get("code") == constants.OK
+        assert response.get("response").get('score') == 42
+
+    def test_ok_score_request(self):
+        request = {"account": "horns&hoofs", "login": "h&f", "method": "online_score",
+                   "arguments": {"phone": "79175002040", "email": "stupnikov@otus.ru"}}
+        response = do_request(set_valid_auth(request))
+        assert response.get("code") == constants.OK
+        assert response.get("response") == {"score": 3.0}
+
+    def test_ok_interests_request(self):
+        request = {"account": "horns&hoofs", "login": "h&f", "method": "clients_interests",
+                   "arguments": {"client_ids": [1, 2]}}
+        response = do_request(set_valid_auth(request))
+        assert response.get("code") == constants.OK
+        assert response.get("response") == {"1": "cars", "2": "pets"}
+
+    def test_batch_not_supported(self):
+        arguments = {"phone": "79175002040", "email": "stupnikov@otus.ru"}
+        request = {"account": "horns&hoofs", "login": "admin", "method": "online_score", "arguments": arguments}
+        response = do_request([set_valid_auth(request)])
+        assert response.get('code') == constants.INVALID_REQUEST
+
+    def test_bad_json(self):
+        connection = HTTPConnection(HOST, PORT)
+        connection.request("POST", "/method/", "{")
+        assert json.load(connection.getresponse()).get('code') == constants.BAD_REQUEST
+        connection.close()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+from http.client import HTTPConnection
+from threading import Thread
+from time import monotonic
+import datetime
+import hashlib
+import json
+import pytest
+import constants
+from api import MainHTTPHandler
+from servers import make_server
+
+HOST = "localhost"
+PORT = 8082
+MAX_REQUESTS = 3
+WORKERS = 4
+
+
+class LimitedHandler(MainHTTPHandler):
+    timeout = 1
+    max_keepalive_requests = MAX_REQUESTS
+
+
+def serve(port, workers):
+    server = make_server((HOST, port), LimitedHandler, workers=workers)
+    t = Thread(target=server.serve_forever)
+    t.start()
+    return server, t
+
+
+def stop(server, t):
+    server.shutdown()
+    t.join()
+    server.server_close()
+
+
+@pytest.fixture(scope='module', autouse=True)
+def start_api():
+    server, t = serve(PORT, WORKERS)
+    yield
+    stop(server, t)
+
+
+@pytest.fixture
+def api_server(request):
+    server, t = serve(0, request.param)
+    yield server
+    stop(server, t)
+
+
+def admin_request():
+    token = hashlib.sha512((datetime.datetime.now().strftime("%Y%m%d%H") +
+                            constants.ADMIN_SALT).encode('utf-8')).hexdigest()
+    return {"account": "horns&hoofs", "login": "admin", "method": "online_score", "token": token,
+            "arguments": {"phone": "79175002040", "email": "stupnikov@otus.ru"}}
+
+
+def do_request(connection, body):
+    connection.request("POST", "/method/", body)
+    r = connection.getresponse()
+    return r, json.loads(r.read())
+
+
+class TestKeepAlive:
+
+    def test_connection_reused(self):
+        connection = HTTPConnection(HOST, PORT)
+        r, response = do_request(connection, json.dumps(admin_request()))
+        sock = connection.sock
+        assert r.version == 11
+        assert int(r.getheader('Content-Length')) > 0
+        assert response.get('code') == constants.OK
+        r, response = do_request(connection, json.dumps(admin_request()))
+        assert connection.sock is sock
+        assert response.get('code') == constants.OK
+        connection.close()
+
+    def test_requests_cap(self):
+        connection = HTTPConnection(HOST, PORT)
+        for _ in range(MAX_REQUESTS - 1):
+            r, _ = do_request(connection, json.dumps(admin_request()))
+            assert r.getheader('Connection') is None
+        r, _ = do_request(connection, json.dumps(admin_request()))
+        assert r.getheader('Connection') == 'close'
+        assert connection.sock is None
+        connection.close()
+
+    def test_bad_request_closes_connection(self):
+        connection = HTTPConnection(HOST, PORT)
+        r, response = do_request(connection, "{")
+        assert response.get('code') == constants.BAD_REQUEST
+        assert r.getheader('Connection') == 'close'
+        connection.close()
+
+    @pytest.mark.parametrize('api_server', [1], indirect=True)
+    def test_single_thread_closes_connection(self, api_server):
+        port = api_server.server_address[1]
+        idle = HTTPConnection(HOST, port)
+        r, _ = do_request(idle, json.dumps(admin_request()))
+        assert r.getheader('Connection') == 'close'
+        start = monotonic()
+        r, response = do_request(HTTPConnection(HOST, port), json.dumps(admin_request()))
+        assert response.get('code') == constants.OK
+        assert monotonic() - start < LimitedHandler.timeout / 2
+        idle.close()
+
+    @pytest.mark.parametrize('api_server', [2], indirect=True)
+    def test_idle_connections_leave_free_worker(self, api_server):
+        port = api_server.server_address[1]
+        idle = [HTTPConnection(HOST, port) for _ in range(2)]
+        for connection in idle:
+            do_request(connection, json.dumps(admin_request()))
+        start = monotonic()
+        r, response = do_request(HTTPConnection(HOST, port), json.dumps(admin_request()))
+        assert response.get('code') == constants.OK
+        assert monotonic() - start < LimitedHandler.timeout / 2
+        for connection in idle:
+            connection.close()
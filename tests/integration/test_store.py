@@ -3,7 +3,7 @@ import uuid
 from time import sleep
 from store import Store
 
-STORE = Store()
+STORE = Store(backend='redis')
 
 
 class TestStore:
@@ -33,8 +33,24 @@ class TestStore:
         assert STORE.set(name, value)
         assert STORE.get(name) == value
 
-
-
-
-
-
+    def test_get_many(self):
+        STORE.set('many:1', 'a')
+        STORE.set('many:2', 'b')
+        assert STORE.get_many(['many:1', 'many:2', 'many:none']) == ['a', 'b', None]
+        assert STORE.get_many([]) == []
+
+    def test_set_many_scan(self):
+        prefix = f'scan:{uuid.uuid4().hex}:'
+        assert STORE.set_many({prefix + str(i): str(i) for i in range(25)}, ex=60)
+        keys = set(STORE.scan(prefix + '*', count=10))
+        assert keys == {prefix + str(i) for i in range(25)}
+
+    def test_set_nx(self):
+        name = f'lock:{uuid.uuid4().hex}'
+        assert STORE.try_lock(name, 1)
+        assert not STORE.try_lock(name, 1)
+
+    def test_prewarm(self):
+        store = Store(pool_options={'max_connections': 4}, backend='redis')
+        assert store.prewarm(10) == 4
+        assert len(store.backend._client('name').connection_pool._connections) == 4
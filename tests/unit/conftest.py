@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+
+class DictStore:
+    """Хранилище на словаре с подсчетом обращений"""
+
+    def __init__(self, data=None):
+        self.data = dict(data or {})
+        self.calls = []
+        self.locked = set()
+
+    def get_many(self, keys):
+        self.calls.append(('get_many', keys))
+        return [self.data.get(key) for key in keys]
+
+    def cache_get(self, key):
+        self.calls.append(('cache_get', key))
+        return self.data.get(key)
+
+    def cache_set(self, key, value, ex=None):
+        self.calls.append(('cache_set', key))
+        self.data[key] = value
+        return True
+
+    def try_lock(self, name, ttl):
+        self.calls.append(('try_lock', name))
+        if name in self.locked:
+            return False
+        self.locked.add(name)
+        return True
+
+    def cache_get_many(self, keys):
+        self.calls.append(('cache_get_many', keys))
+        return [self.data.get(key) for key in keys]
+
+    def cache_set_many(self, mapping, ex=None, write_behind=True):
+        self.calls.append(('cache_set_many', mapping))
+        self.data.update(mapping)
+        return True
+
+
+@pytest.fixture
+def dict_store():
+    return DictStore()
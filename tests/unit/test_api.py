@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import datetime
+import hashlib
+import pytest
+import constants
+from api import method_handler, check_auth, get_user_digest, USER_DIGESTS
+from api_requests import MethodRequest
+
+
+def make_request(method, arguments, login="h&f"):
+    request = {"account": "horns&hoofs", "login": login, "method": method, "arguments": arguments}
+    if login == constants.ADMIN_LOGIN:
+        msg = datetime.datetime.now().strftime("%Y%m%d%H") + constants.ADMIN_SALT
+    else:
+        msg = request["account"] + login + constants.SALT
+    request["token"] = hashlib.sha512(msg.encode('utf-8')).hexdigest()
+    return request
+
+
+class TestBatch:
+
+    def test_mixed_batch(self, dict_store):
+        dict_store.data['i:1'] = 'cars'
+        batch = [
+            make_request("online_score", {"phone": "79175002040", "email": "stupnikov@otus.ru"}),
+            make_request("online_score", {"first_name": "a", "last_name": "b"}),
+            make_request("online_score", {"phone": "79175002040"}, login=constants.ADMIN_LOGIN),
+            make_request("clients_interests", {"client_ids": [1, 2]}),
+            make_request("clients_interests", {"client_ids": [2, 3]}),
+            make_request("online_score", {"phone": "79175002040"}),
+            dict(make_request("online_score", {}), token="bad"),
+            make_request("unknown", {}),
+            1,
+        ]
+        ctx = {}
+        response, code = method_handler({"body": batch}, ctx, dict_store)
+        assert code == constants.OK
+        assert ctx['batch_size'] == len(batch)
+        assert [r['code'] for r in response] == [200, 200, 422, 200, 200, 422, 403, 422, 422]
+        assert response[0]['response'] == {'score': 3.0}
+        assert response[1]['response'] == {'score': 0.5}
+        assert response[3]['response'] == {1: 'cars', 2: []}
+        assert response[4]['response'] == {2: [], 3: []}
+        assert [name for name, _ in dict_store.calls] == ['cache_get_many', 'cache_set_many', 'get_many']
+
+    def test_invalid_items(self, dict_store):
+        no_account = make_request("online_score", {"phone": "79175002040", "email": "a@b"})
+        del no_account['account']
+        batch = [
+            make_request("online_score", ""),
+            no_account,
+            make_request("online_score", {"phone": "79175002040", "email": "a@b"}),
+        ]
+        response, code = method_handler({"body": batch}, {}, dict_store)
+        assert code == constants.OK
+        assert [r['code'] for r in response] == [422, 422, 200]
+
+    def test_admin_batch(self, dict_store):
+        batch = [make_request("online_score", {"phone": "79175002040", "email": "a@b"},
+                              login=constants.ADMIN_LOGIN)]
+        response, code = method_handler({"body": batch}, {}, dict_store)
+        assert response == [{"response": {"score": 42}, "code": 200}]
+        assert dict_store.calls == []
+
+
+class TestCheckAuth:
+
+    @pytest.mark.parametrize("login", ["h&f", constants.ADMIN_LOGIN])
+    def test_ok(self, login):
+        req = MethodRequest()
+        req.validate(make_request("online_score", {}, login=login))
+        assert check_auth(req)
+        assert check_auth(req)
+
+    @pytest.mark.parametrize("token", ["", "bad", "плохой"])
+    def test_bad_token(self, token):
+        req = MethodRequest()
+        req.validate(dict(make_request("online_score", {}), token=token))
+        assert not check_auth(req)
+
+    def test_user_digest_memoized(self):
+        digest = get_user_digest("horns&hoofs", "memo")
+        assert USER_DIGESTS.get(("horns&hoofs", "memo")) == digest
+        assert get_user_digest("horns&hoofs", "memo") == digest
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+from datetime import timedelta
+from unittest import mock
+import pytest
+from backends import MemoryBackend
+
+
+@pytest.fixture
+def backend():
+    return MemoryBackend()
+
+
+class TestMemoryBackend:
+
+    def test_get_set(self, backend):
+        assert backend.ping()
+        assert backend.set('name', 'value')
+        assert backend.get('name') == 'value'
+        assert backend.get('none') is None
+
+    @pytest.mark.parametrize("value, expected", [(1, '1'), (2.5, '2.5'), (b'bytes', 'bytes'),
+                                                 ('строка', 'строка')])
+    def test_values_as_redis(self, backend, value, expected):
+        backend.set('name', value)
+        assert backend.get('name') == expected
+
+    @pytest.mark.parametrize("value", [None, True, [1], {'a': 1}])
+    def test_invalid_value(self, backend, value):
+        with pytest.raises(TypeError):
+            backend.set('name', value)
+
+    def test_get_many(self, backend):
+        assert backend.set_many({'a': 1, 'b': 2})
+        assert backend.get_many(['a', 'none', 'b']) == ['1', None, '2']
+        assert backend.get_many([]) == []
+
+    def test_int_keys(self, backend):
+        backend.set(1, 'value')
+        assert backend.get('1') == backend.get(1) == 'value'
+
+    def test_expire(self, backend):
+        with mock.patch('backends.monotonic', return_value=100):
+            backend.set('name', 'value', ex=2)
+            backend.set('delta', 'value', ex=timedelta(seconds=5))
+            backend.set('forever', 'value')
+        with mock.patch('backends.monotonic', return_value=103):
+            assert backend.get('name') is None
+            assert backend.get_many(['delta', 'forever']) == ['value', 'value']
+        assert len(backend) == 2
+
+    def test_purge(self):
+        backend = MemoryBackend(purge_interval=10)
+        with mock.patch('backends.monotonic', return_value=100):
+            backend._purged_at = 100
+            backend.set('name', 'value', ex=1)
+        with mock.patch('backends.monotonic', return_value=111):
+            backend.set('other', 'value')
+        assert len(backend) == 1
+
+    def test_set_nx(self, backend):
+        with mock.patch('backends.monotonic', return_value=100):
+            assert backend.set_nx('lock', '1', 2)
+            assert not backend.set_nx('lock', '2', 2)
+        with mock.patch('backends.monotonic', return_value=103):
+            assert backend.set_nx('lock', '3', 2)
+            assert backend.get('lock') == '3'
+
+    def test_scan(self, backend):
+        with mock.patch('backends.monotonic', return_value=100):
+            backend.set_many({'i:1': 'a', 'i:2': 'b', 'uid:1': 'c'})
+            backend.set('i:3', 'd', ex=1)
+        with mock.patch('backends.monotonic', return_value=102):
+            assert sorted(backend.scan('i:*')) == ['i:1', 'i:2']
+            assert len(list(backend.scan())) == 3
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import json
+import pytest
+from benchmarks.bench_load import compare, make_requests, parse_mix, percentile, summarize
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([5], 95) == 5
+    assert percentile([], 50) == 0
+
+
+def test_parse_mix():
+    assert parse_mix('user_score=3, interests=1') == {'user_score': 3, 'interests': 1}
+    with pytest.raises(ValueError):
+        parse_mix('unknown=1')
+
+
+def test_make_requests():
+    requests = make_requests(100, {'interests': 1}, (2, 2), seed=1)
+    assert requests == make_requests(100, {'interests': 1}, (2, 2), seed=1)
+    kind, body = requests[0]
+    assert kind == 'interests'
+    assert len(json.loads(body)['arguments']['client_ids']) == 2
+
+
+def test_compare():
+    baseline = summarize([('a', 0.010, True)] * 99 + [('a', 0.020, False)], 1.0)
+    assert compare(baseline, baseline) == []
+    slower = summarize([('a', 0.015, True)] * 100, 2.0)
+    regressions = compare(slower, baseline)
+    assert any(item.startswith('throughput_rps') for item in regressions)
+    assert any(item.startswith('latency_ms.p50') for item in regressions)
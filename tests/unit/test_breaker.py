@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+from time import sleep, monotonic
+import pytest
+import redis
+from breaker import CircuitBreaker, deadline, time_left, CLOSED, OPEN, HALF_OPEN
+from custom_erros import StoreUnavailableError
+from backends import POOL_EXHAUSTED
+from store import Store, retry
+
+
+class TestCircuitBreaker:
+
+    def test_opens_after_failures(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        breaker.record_failure()
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == OPEN
+        assert not breaker.allow()
+
+    def test_half_open_probe(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        sleep(0.06)
+        assert breaker.allow()
+        assert breaker.state == HALF_OPEN
+        assert not breaker.allow()
+        breaker.record_success()
+        assert breaker.state == CLOSED
+        assert breaker.allow()
+
+    def test_failed_probe_reopens(self):
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.05)
+        for _ in range(3):
+            breaker.record_failure()
+        sleep(0.06)
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == OPEN
+
+    def test_released_probe(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        sleep(0.06)
+        assert breaker.allow()
+        breaker.release()
+        assert breaker.state == HALF_OPEN
+        assert breaker.allow()
+
+
+class Flaky:
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+        self.breaker = CircuitBreaker(failure_threshold=100)
+
+    @retry(count=3, backoff=0.01)
+    def call(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise redis.ConnectionError('down')
+        return 'ok'
+
+
+class TestRetry:
+
+    def test_recovers(self):
+        flaky = Flaky(failures=2)
+        assert flaky.call() == 'ok'
+        assert flaky.calls == 3
+
+    def test_gives_up(self):
+        flaky = Flaky(failures=5)
+        with pytest.raises(redis.ConnectionError):
+            flaky.call()
+        assert flaky.calls == 3
+
+    def test_other_errors_not_retried(self):
+        class Broken(Flaky):
+            @retry(count=3, backoff=0.01)
+            def call(self):
+                self.calls += 1
+                raise KeyError('bug')
+        broken = Broken(failures=0)
+        with pytest.raises(KeyError):
+            broken.call()
+        assert broken.calls == 1
+
+    def test_other_errors_release_probe(self):
+        class Broken(Flaky):
+            @retry(count=3, backoff=0.01)
+            def call(self):
+                raise KeyError('bug')
+        broken = Broken(failures=0)
+        half_open(broken.breaker)
+        with pytest.raises(KeyError):
+            broken.call()
+        assert broken.breaker.allow()
+
+    def test_pool_exhausted_not_retried(self):
+        class Busy(Flaky):
+            @retry(count=3, backoff=0.01)
+            def call(self):
+                self.calls += 1
+                raise redis.ConnectionError(POOL_EXHAUSTED)
+        busy = Busy(failures=0)
+        with pytest.raises(StoreUnavailableError):
+            busy.call()
+        assert busy.calls == 1
+        assert busy.breaker.failures == 0
+
+    def test_deadline(self):
+        flaky = Flaky(failures=5)
+        with deadline(0.001):
+            sleep(0.002)
+            assert time_left() < 0
+            with pytest.raises(StoreUnavailableError):
+                flaky.call()
+        assert flaky.calls == 0
+        assert time_left() is None
+
+
+def half_open(breaker):
+    """Перевод автомата в полуоткрытое состояние до выдачи пробной операции"""
+    breaker.state, breaker.opened_at = OPEN, monotonic() - breaker.reset_timeout
+
+
+class TestStoreFailFast:
+
+    def test_open_breaker(self):
+        store = Store(port=1, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=60))
+        store.breaker.record_failure()
+        start = monotonic()
+        with pytest.raises(StoreUnavailableError):
+            store.get('i:1')
+        assert store.cache_get('uid:1') is None
+        assert store.cache_get_many(['uid:1']) == [None]
+        assert monotonic() - start < 0.1
+
+    def test_exhausted_deadline_keeps_probe(self):
+        store = Store(backend='memory', l1_size=0, write_behind_size=0)
+        half_open(store.breaker)
+        with deadline(0.001):
+            sleep(0.002)
+            assert store.cache_get('uid:1') is None
+            with pytest.raises(StoreUnavailableError):
+                store.get('i:1')
+        assert not store.breaker._probe
+        assert store.cache_set('uid:1', '1.5')
+        assert store.breaker.state == CLOSED
+
+    def test_unexpected_error_releases_probe(self):
+        store = Store(backend='memory', l1_size=0, write_behind_size=0)
+        half_open(store.breaker)
+        # список нельзя записать в хранилище: TypeError вместо ошибки соединения
+        assert store.cache_set('uid:1', [1]) is None
+        assert store.breaker.state == HALF_OPEN
+        with pytest.raises(TypeError):
+            store.set('uid:1', [1])
+        assert store.cache_set('uid:1', '1.5')
+        assert store.breaker.state == CLOSED
+
+    def test_pool_exhausted_keeps_breaker_closed(self, monkeypatch):
+        store = Store(backend='memory', l1_size=0, write_behind_size=0,
+                      breaker=CircuitBreaker(failure_threshold=2))
+
+        def busy(*args):
+            raise redis.ConnectionError(POOL_EXHAUSTED)
+        monkeypatch.setattr(store.backend, 'get', busy)
+        for _ in range(5):
+            assert store.cache_get('uid:1') is None
+            with pytest.raises(StoreUnavailableError):
+                store.get('i:1')
+        assert store.breaker.state == CLOSED
+        assert store.breaker.failures == 0
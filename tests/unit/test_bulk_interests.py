@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+from unittest import mock
+import pytest
+from bulk_interests import export, load, parse_interests
+from bulk_score import read_jsonl
+from scoring import get_interests, get_interests_many
+from store import Store
+
+
+@pytest.fixture
+def store():
+    return Store(backend='memory', l1_size=0, write_behind_size=0)
+
+
+def records(*items):
+    return read_jsonl(io.StringIO(''.join(
+        (item if isinstance(item, str) else json.dumps(item, ensure_ascii=False)) + '\n'
+        for item in items)))
+
+
+class TestParseInterests:
+
+    @pytest.mark.parametrize("record, expected", [
+        ({"client_id": 1, "interests": ["cars", "книги"]}, ('i:1', '["cars", "книги"]')),
+        ({"client_id": "2", "interests": "cars"}, ('i:2', 'cars')),
+    ])
+    def test_valid(self, record, expected):
+        assert parse_interests(json.dumps(record)) == expected
+
+    @pytest.mark.parametrize("record", ['[1]', '{"client_id": -1, "interests": []}',
+                                        '{"client_id": true, "interests": []}',
+                                        '{"client_id": 1, "interests": {"a": 1}}', 'x'])
+    def test_invalid(self, record):
+        with pytest.raises(ValueError):
+            parse_interests(record)
+
+
+class TestLoadExport:
+
+    def test_round_trip(self, store):
+        items = [{"client_id": i, "interests": ["cars", "pets"][:i % 3]} for i in range(1, 26)]
+        progress = load(store, records(*items, 'bad', {"client_id": 1.5, "interests": []}),
+                        batch_size=4, threads=3, progress_interval=0)
+        assert (progress.records, progress.errors) == (27, 2)
+        store.set('uid:1', '3.0')
+        output = io.StringIO()
+        assert export(store, output, batch_size=7, progress_interval=0).records == 25
+        exported = [json.loads(line) for line in output.getvalue().splitlines()]
+        assert sorted(exported, key=lambda item: item['client_id']) == items
+
+    def test_batches_pipelined(self, store):
+        with mock.patch.object(store.backend, 'set_many', wraps=store.backend.set_many) as set_many:
+            load(store, records(*({"client_id": i, "interests": "cars"} for i in range(10))),
+                 batch_size=4, ttl=60, threads=1, progress_interval=0)
+        assert [len(call.args[0]) for call in set_many.call_args_list] == [4, 4, 2]
+        assert all(call.args[1] == 60 for call in set_many.call_args_list)
+
+    def test_create_interests_single_write(self, store):
+        with mock.patch.object(store.backend, 'set_many', wraps=store.backend.set_many) as set_many:
+            store.create_interests()
+        assert set_many.call_count == 1
+        assert store.get('i:1') == 'cars'
+
+    def test_api_reads_loaded_lists(self, store):
+        load(store, records({"client_id": 1, "interests": ["cars", "книги"]},
+                            {"client_id": 2, "interests": "pets"}), threads=1, progress_interval=0)
+        assert get_interests_many(store, [1, 2, 3]) == {1: ['cars', 'книги'], 2: 'pets', 3: []}
+        assert get_interests(store, 1) == ['cars', 'книги']
+
+    def test_failed_write_counted(self, store):
+        with mock.patch.object(store.backend, 'set_many', return_value=False):
+            progress = load(store, records(*({"client_id": i, "interests": "cars"}
+                                             for i in range(5)), 'bad'),
+                            batch_size=3, threads=1, progress_interval=0)
+        assert (progress.records, progress.errors) == (6, 6)
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+from concurrent.futures import Future
+from bulk_score import chunked, ordered_map, read_csv, read_jsonl, run
+from scoring import calc_score
+
+VALID = {"phone": "79175002040", "email": "a@b.ru", "birthday": "01.01.2000", "gender": 1,
+         "first_name": "a", "last_name": "b"}
+LINES = [json.dumps(VALID), '', 'not json', json.dumps({"phone": "79175002040"}), '[1]',
+         json.dumps({"first_name": "a", "last_name": "b"})]
+
+
+def score_lines(lines, **kwargs):
+    output = io.StringIO()
+    progress = run(read_jsonl(io.StringIO('\n'.join(lines) + '\n')), output,
+                   store_options={'backend': 'memory'}, progress_interval=0, **kwargs)
+    return [json.loads(line) for line in output.getvalue().splitlines()], progress
+
+
+class TestReaders:
+
+    def test_jsonl_skips_empty_lines(self):
+        assert list(read_jsonl(io.StringIO('a\n\n  \nb\n'))) == [(1, 'a\n'), (4, 'b\n')]
+
+    def test_csv(self):
+        stream = io.StringIO('phone,email,gender,first_name\n79175002040,a@b.ru,1,\n,,x,a\n')
+        assert list(read_csv(stream)) == [
+            (2, {'phone': '79175002040', 'email': 'a@b.ru', 'gender': 1}),
+            (3, {'gender': 'x', 'first_name': 'a'}),
+        ]
+
+    def test_chunked(self):
+        assert list(chunked(range(5), 2)) == [[0, 1], [2, 3], [4]]
+
+
+class TestRun:
+
+    def test_results_in_input_order(self):
+        results, progress = score_lines(LINES, chunk_size=2)
+        assert [result['line'] for result in results] == [1, 3, 4, 5, 6]
+        assert results[0] == {'line': 1, 'score': calc_score(*VALID.values())}
+        assert results[1]['error'].startswith('Invalid JSON')
+        assert results[2]['error'].startswith('Fields validate error')
+        assert results[3] == {'line': 5, 'error': 'Record must be an object'}
+        assert results[4] == {'line': 6, 'score': 0.5}
+        assert (progress.records, progress.errors) == (5, 3)
+
+    def test_field_errors_reported(self):
+        results, _ = score_lines([json.dumps(dict(VALID, phone='123', gender=5))])
+        assert 'phone: PhoneField must contain 11 numbers' in results[0]['error']
+        assert 'gender: Wrong value for GenderField' in results[0]['error']
+
+    def test_process_pool(self):
+        lines = [json.dumps(dict(VALID, phone=str(79175002000 + i))) if i % 3 else 'x'
+                 for i in range(50)]
+        assert score_lines(lines, processes=2, chunk_size=7)[0] == \
+            score_lines(lines, chunk_size=50)[0]
+
+    def test_bounded_window(self):
+        submitted = []
+
+        class Executor:
+            def submit(self, func, item):
+                submitted.append(item)
+                future = Future()
+                future.set_result((item, len(submitted)))
+                return future
+
+        results = list(ordered_map(Executor(), None, range(10), 3))
+        # при выдаче результата в обработке не больше 3 элементов
+        assert [item for item, _ in results] == list(range(10))
+        assert all(count - item <= 3 for item, count in results)
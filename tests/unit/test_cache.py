@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+from time import sleep
+from cache import LRUCache
+from metrics import L1_CACHE_EVICTIONS, L1_CACHE_HITS, L1_CACHE_MISSES, REGISTRY
+from store import Store
+
+
+class TestLRUCache:
+
+    def test_get_set(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        assert cache.get('a') == 1
+        assert cache.get('b') is None
+        assert cache.stats()['hits'] == 1
+        assert cache.stats()['misses'] == 1
+
+    def test_lru_eviction(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        assert cache.stats()['evictions'] == 1
+
+    def test_ttl(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set('a', 1, ttl=0.1)
+        sleep(0.15)
+        assert cache.get('a') is None
+        assert len(cache) == 0
+
+    def test_memory_cap(self):
+        cache = LRUCache(maxsize=1000, ttl=60, max_bytes=1000)
+        for i in range(100):
+            cache.set(str(i), 'x' * 50)
+        assert cache.nbytes <= 1000
+        assert cache.stats()['evictions'] > 0
+
+
+class TestStoreL1:
+
+    def test_cache_served_from_l1(self):
+        store = Store(port=1, socket_timeout=0.1, l1_size=10)
+        store._l1_set('uid:1', 3.0, 60)
+        assert store.cache_get('uid:1') == '3.0'
+        assert store.cache_get_many(['uid:1']) == ['3.0']
+        assert store.l1.stats()['hits'] == 2
+
+    def test_disabled(self):
+        assert Store(l1_size=0).l1 is None
+
+
+def test_stats_in_metrics():
+    store = Store(backend='memory', l1_size=1, write_behind_size=0)
+    before = {gauge.name: gauge.func() for gauge in (L1_CACHE_HITS, L1_CACHE_MISSES,
+                                                     L1_CACHE_EVICTIONS)}
+    store.cache_set('uid:1', '1.5')
+    store.cache_set('uid:2', '2.5')
+    assert store.cache_get('uid:2') == '2.5'
+    assert store.l1.get('uid:1') is None
+    assert L1_CACHE_HITS.func() - before['store_l1_cache_hits'] == 1
+    assert L1_CACHE_MISSES.func() - before['store_l1_cache_misses'] == 1
+    assert L1_CACHE_EVICTIONS.func() - before['store_l1_cache_evictions'] == 1
+    assert 'store_l1_cache_hits ' in REGISTRY.expose()
@@ -1,6 +1,7 @@
 import datetime
 import pytest
 from api_requests import *
+from fields import parse_date
 
 
 class TestEmailField:
@@ -73,3 +74,24 @@ class TestPhoneField:
     def test_invalid_phone(self, value):
         with pytest.raises(ValueError):
             assert PhoneField().validate(value)
+
+
+class TestParseDate:
+
+    @pytest.mark.parametrize("value, expected", [
+        ('12.01.1990', datetime.date(1990, 1, 12)),
+        ('1.2.2000', datetime.date(2000, 2, 1)),
+    ], ids=lambda arg: str(arg))
+    def test_ok_date(self, value, expected):
+        assert parse_date(value) == expected
+
+    @pytest.mark.parametrize("value", ('31.02.2000', '1990.12.01', 'aa.bb.cccc', ''),
+                             ids=lambda arg: str(arg))
+    def test_invalid_date(self, value):
+        with pytest.raises(ValueError):
+            parse_date(value)
+
+    def test_request_carries_date(self):
+        request = ClientsInterestsRequest()
+        request.validate({'client_ids': [1], 'date': '20.07.2017'})
+        assert request.date == datetime.date(2017, 7, 20)
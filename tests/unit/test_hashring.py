@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from collections import Counter
+import pytest
+from hashring import HashRing
+
+KEYS = [f'i:{i}' for i in range(10000)]
+
+
+class TestHashRing:
+
+    def test_single_node(self):
+        ring = HashRing(['a'])
+        assert {ring.get_node(key) for key in KEYS[:100]} == {'a'}
+
+    def test_empty(self):
+        with pytest.raises(LookupError):
+            HashRing().get_node('key')
+
+    def test_balance(self):
+        ring = HashRing(['a', 'b', 'c', 'd'])
+        counts = Counter(ring.get_node(key) for key in KEYS)
+        assert set(counts) == {'a', 'b', 'c', 'd'}
+        assert min(counts.values()) > len(KEYS) / 4 * 0.7
+
+    def test_minimal_remapping(self):
+        ring = HashRing(['a', 'b', 'c'])
+        before = {key: ring.get_node(key) for key in KEYS}
+        ring.add_node('d')
+        moved = [key for key in KEYS if ring.get_node(key) != before[key]]
+        assert all(ring.get_node(key) == 'd' for key in moved)
+        assert len(moved) < len(KEYS) / 4 * 1.3
+
+    def test_remove_node(self):
+        ring = HashRing(['a', 'b'])
+        ring.remove_node('b')
+        assert {ring.get_node(key) for key in KEYS[:100]} == {'a'}
+
+    def test_split(self):
+        ring = HashRing(['a', 'b'])
+        groups = ring.split(KEYS[:50])
+        assert sorted(i for indexes in groups.values() for i in indexes) == list(range(50))
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import queue
+import logger
+from logger import RequestLine, DroppingQueueHandler, log_request_line
+
+
+class TestRequestLine:
+
+    def test_structured_line(self):
+        line = RequestLine({"request_id": "1", "code": 200}, {"login": "a", "token": "secret"},
+                           {"score": 3.0})
+        assert json.loads(str(line)) == {"request_id": "1", "code": 200,
+                                         "request": {"login": "a", "token": "***"},
+                                         "response": {"score": 3.0}}
+
+    def test_sampled_out(self, caplog, monkeypatch):
+        monkeypatch.setattr(logger, 'payload_sample_rate', 0)
+        with caplog.at_level(logging.INFO):
+            log_request_line({"request_id": "1"}, {"login": "a"}, {"score": 3.0})
+        assert json.loads(caplog.records[-1].getMessage()) == {"request_id": "1"}
+
+
+class TestDroppingQueueHandler:
+
+    def test_drop_when_full(self):
+        handler = DroppingQueueHandler(queue.Queue(1))
+        record = logging.LogRecord('test', logging.INFO, __file__, 1, 'msg %s', ('a',), None)
+        handler.handle(record)
+        handler.handle(record)
+        assert handler.dropped == 1
+        assert handler.queue.get_nowait().getMessage() == 'msg a'
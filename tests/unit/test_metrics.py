@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import threading
+from metrics import Counter, Histogram, Registry
+
+
+def test_counter():
+    registry = Registry()
+    counter = Counter('requests_total', 'Requests', ('method', 'code'), registry=registry)
+    counter.inc('online_score', '200')
+    counter.inc('online_score', '200', amount=2)
+    counter.inc('clients_interests', '403')
+    assert counter.values() == {('online_score', '200'): 3, ('clients_interests', '403'): 1}
+    assert registry.expose().splitlines() == [
+        '# HELP requests_total Requests',
+        '# TYPE requests_total counter',
+        'requests_total{method="clients_interests",code="403"} 1',
+        'requests_total{method="online_score",code="200"} 3',
+    ]
+
+
+def test_counter_threads():
+    counter = Counter('threads_total', 'Increments', registry=None)
+
+    def work():
+        for _ in range(1000):
+            counter.inc()
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert counter.values() == {(): 8000}
+
+
+def test_histogram():
+    registry = Registry()
+    histogram = Histogram('size', 'Sizes', buckets=(1, 5), registry=registry)
+    for value in (1, 3, 5, 10):
+        histogram.observe(value)
+    assert list(histogram.samples()) == [
+        'size_bucket{le="1"} 1',
+        'size_bucket{le="5"} 3',
+        'size_bucket{le="+Inf"} 4',
+        'size_sum 19',
+        'size_count 4',
+    ]
+
+
+def test_label_escaping():
+    counter = Counter('escaped_total', 'Escaped', ('path',), registry=None)
+    counter.inc('a"b\\c\nd')
+    assert list(counter.samples()) == ['escaped_total{path="a\\"b\\\\c\\nd"} 1']
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+import os
+import pstats
+from profiler import SamplingProfiler
+
+
+def work(n):
+    return sum(range(n))
+
+
+def test_disabled(tmp_path):
+    profiler = SamplingProfiler(str(tmp_path), rate=1)
+    assert profiler.call(work, 10) == 45
+    assert profiler.sampled == 0
+
+
+def test_sampling_rate(tmp_path):
+    profiler = SamplingProfiler(str(tmp_path), rate=3)
+    profiler.configure(enabled=True)
+    for _ in range(9):
+        assert profiler.call(work, 10) == 45
+    assert profiler.sampled == 3
+
+
+def test_dump_on_disable(tmp_path):
+    profiler = SamplingProfiler(str(tmp_path), rate=1)
+    profiler.configure(enabled=True)
+    profiler.call(work, 1000)
+    profiler.configure(enabled=False)
+    files = os.listdir(tmp_path)
+    assert len(files) == 1
+    stats = pstats.Stats(str(tmp_path / files[0]))
+    assert any(func[2] == 'work' for func in stats.stats)
+
+
+def test_rotation(tmp_path):
+    profiler = SamplingProfiler(str(tmp_path), rate=1, interval=0, keep=2)
+    profiler.configure(enabled=True)
+    for _ in range(4):
+        profiler.call(work, 10)
+    assert len(os.listdir(tmp_path)) == 2
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+from time import monotonic, sleep
+import pytest
+import redis
+from replicas import ReplicaSet
+
+
+class FakeClient:
+
+    def __init__(self, name, fail=False, replicas=()):
+        self.name = name
+        self.fail = fail
+        self.replication = {'role': 'master', 'connected_slaves': len(replicas)}
+        for i, (replica, state, lag) in enumerate(replicas):
+            host, _, port = replica.rpartition(':')
+            self.replication[f'slave{i}'] = {'ip': host, 'port': int(port), 'state': state,
+                                             'offset': 100, 'lag': lag}
+        self.info_calls = 0
+
+    def get(self, key):
+        if self.fail:
+            raise redis.ConnectionError('down')
+        return self.name
+
+    def info(self, section):
+        self.info_calls += 1
+        if self.fail:
+            raise redis.ConnectionError('down')
+        return self.replication
+
+
+@pytest.fixture
+def make_set():
+    shards = []
+
+    def make(*replicas, primary=None):
+        links = [(client.name, 'online', 0) for client in replicas]
+        shard = ReplicaSet('primary', primary or FakeClient('primary', replicas=links),
+                           [(client.name, client) for client in replicas], max_lag=5,
+                           check_interval=60)
+        shards.append(shard)
+        return shard
+    yield make
+    for shard in shards:
+        shard.close()
+
+
+class TestReplicaSet:
+
+    def test_reads_go_to_replicas(self, make_set):
+        shard = make_set(FakeClient('r1:6381'), FakeClient('r2:6382'))
+        assert shard.read(lambda client: client.get('k')) in ('r1:6381', 'r2:6382')
+        assert shard.write(lambda client: client.get('k')) == 'primary'
+
+    def test_least_outstanding(self, make_set):
+        shard = make_set(FakeClient('r1:6381'), FakeClient('r2:6382'))
+        busy = shard.pick()
+        assert shard.pick() is not busy
+
+    def test_failed_replica_falls_back_to_primary(self, make_set):
+        shard = make_set(FakeClient('r1:6381', fail=True))
+        assert shard.read(lambda client: client.get('k')) == 'primary'
+        assert shard.pick() is None
+
+    def test_lagging_replica_excluded(self, make_set):
+        replicas = [FakeClient('r1:6381'), FakeClient('r2:6382'), FakeClient('r3:6383')]
+        primary = FakeClient('primary', replicas=[('r1:6381', 'online', 60),
+                                                  ('r2:6382', 'wait_bgsave', 0)])
+        shard = make_set(*replicas, primary=primary)
+        shard.check()
+        assert shard.read(lambda client: client.get('k')) == 'primary'
+
+    def test_idle_primary_keeps_replicas(self, make_set):
+        # без записей lag остается малым: реплика подтверждает смещение каждую секунду
+        shard = make_set(FakeClient('r1:6381'))
+        shard.check()
+        assert shard.read(lambda client: client.get('k')) == 'r1:6381'
+
+    def test_primary_unavailable_keeps_replicas(self, make_set):
+        shard = make_set(FakeClient('r1:6381'), primary=FakeClient('primary', fail=True))
+        shard.check()
+        assert shard.read(lambda client: client.get('k')) == 'r1:6381'
+
+    def test_checks_in_background(self, make_set):
+        shard = make_set(FakeClient('r1:6381'))
+        shard.pick()
+        checker = shard._checker
+        assert checker is not None and checker.daemon
+        until = monotonic() + 1
+        while not shard.primary.info_calls and monotonic() < until:
+            sleep(0.01)
+        shard.close()
+        assert not checker.is_alive()
+        assert shard.primary.info_calls == 1
+
+    def test_no_replicas(self, make_set):
+        shard = make_set()
+        assert shard.read(lambda client: client.get('k')) == 'primary'
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+import datetime
+import time
+from unittest import mock
+import pytest
+from scoring import (calc_score, calc_scores, decode_score, encode_score, get_interests_many,
+                     get_score, get_score_key, get_score_keys, get_score_many, score_batch,
+                     should_refresh)
+from .conftest import DictStore
+
+
+class TestGetInterestsMany:
+
+    def test_single_round_trip(self, dict_store):
+        dict_store.data.update({'i:1': 'cars', 'i:2': 'pets'})
+        assert get_interests_many(dict_store, [1, 2, 3]) == {1: 'cars', 2: 'pets', 3: []}
+        assert len(dict_store.calls) == 1
+
+    def test_duplicates(self, dict_store):
+        dict_store.data.update({'i:1': 'cars'})
+        assert get_interests_many(dict_store, [1, 1, 2, 1]) == {1: 'cars', 2: []}
+        assert dict_store.calls == [('get_many', ['i:1', 'i:2'])]
+
+
+class TestGetScoreMany:
+
+    def test_misses_written_once(self, dict_store):
+        cached = get_score_key('79175002040', None, None, None)
+        dict_store.data[cached] = 10
+        arguments = [
+            ('79175002040', None, None, None, None, None),
+            ('79175002041', 'a@b', '01.01.2000', 1, 'a', 'b'),
+        ]
+        assert get_score_many(dict_store, arguments) == [10, 5.0]
+        assert [name for name, _ in dict_store.calls] == ['cache_get_many', 'cache_set_many']
+        assert len(dict_store.calls[1][1]) == 1
+
+
+class TestGetScoreKey:
+
+    def test_date_and_string_match(self):
+        assert get_score_key('79175002040', '01.01.2000', 'a', 'b') == \
+            get_score_key('79175002040', datetime.date(2000, 1, 1), 'a', 'b')
+
+
+class TestCachedScore:
+
+    def test_encode_decode(self):
+        with mock.patch('scoring.time.time', return_value=1000):
+            value = encode_score(4.5, 60)
+        assert value == '4.5|1060'
+        assert decode_score(value) == (4.5, 1060)
+        assert decode_score(10) == (10, None)
+        assert decode_score('3.0') == (3.0, None)
+        assert decode_score(None) == (0, None)
+        assert decode_score('bad|value') == (0, None)
+
+    def test_should_refresh(self):
+        with mock.patch('scoring.time.time', return_value=1000):
+            assert not should_refresh(None, 300)
+            assert not should_refresh(1100, 0)
+            assert should_refresh(999, 300)
+            with mock.patch('scoring.random.random', return_value=0.5):
+                # 300 * ln(2) ~ 208 секунд
+                assert should_refresh(1200, 300)
+                assert not should_refresh(1250, 300)
+
+    def test_cached_score_returned(self, dict_store, monkeypatch):
+        monkeypatch.setattr('scoring.EARLY_REFRESH', 0)
+        key = get_score_key('79175002040', None, None, None)
+        dict_store.data[key] = encode_score(7.0)
+        assert get_score(dict_store, '79175002040', None) == 7.0
+        assert [name for name, _ in dict_store.calls] == ['cache_get']
+
+    def test_miss_written_encoded(self, dict_store, monkeypatch):
+        monkeypatch.setattr('scoring.SCORE_LOCK_TTL', 0)
+        assert get_score(dict_store, '79175002040', 'a@b') == 3.0
+        key = get_score_key('79175002040', None, None, None)
+        assert decode_score(dict_store.data[key])[0] == 3.0
+        assert [name for name, _ in dict_store.calls] == ['cache_get', 'cache_set']
+
+    def test_early_refresh(self, dict_store, monkeypatch):
+        monkeypatch.setattr('scoring.EARLY_REFRESH', 300)
+        key = get_score_key('79175002040', None, None, None)
+        dict_store.data[key] = '7.0|%d' % (time.time() + 1)
+        with mock.patch('scoring.random.random', return_value=0.5):
+            assert get_score(dict_store, '79175002040', 'a@b') == 3.0
+            assert get_score_many(dict_store, [('79175002040', 'a@b', None, None, None,
+                                                None)]) == [3.0]
+
+    def test_lock_held_by_other_process(self, dict_store, monkeypatch):
+        monkeypatch.setattr('scoring.SCORE_LOCK_TTL', 5)
+        monkeypatch.setattr('scoring.SCORE_LOCK_WAIT', 0.01)
+        key = get_score_key('79175002040', None, None, None)
+        dict_store.locked.add('lock:' + key)
+        # победитель не записал значение за время ожидания: скоринг вычисляется без записи
+        assert get_score(dict_store, '79175002040', 'a@b') == 3.0
+        assert key not in dict_store.data
+
+    def test_lock_loser_waits_for_winner(self, dict_store, monkeypatch):
+        monkeypatch.setattr('scoring.SCORE_LOCK_TTL', 5)
+        key = get_score_key('79175002040', None, None, None)
+        dict_store.locked.add('lock:' + key)
+        values = iter([None, None, encode_score(4.5)])
+        monkeypatch.setattr(dict_store, 'cache_get', lambda name: next(values))
+        with mock.patch('scoring.calc_score') as calc:
+            assert get_score(dict_store, '79175002040', 'a@b') == 4.5
+        calc.assert_not_called()
+
+    def test_lock_loser_keeps_cached_on_refresh(self, dict_store, monkeypatch):
+        monkeypatch.setattr('scoring.SCORE_LOCK_TTL', 5)
+        monkeypatch.setattr('scoring.EARLY_REFRESH', 300)
+        key = get_score_key('79175002040', None, None, None)
+        dict_store.data[key] = '7.0|%d' % (time.time() + 1)
+        dict_store.locked.add('lock:' + key)
+        with mock.patch('scoring.calc_score') as calc:
+            assert get_score(dict_store, '79175002040', 'a@b') == 7.0
+        calc.assert_not_called()
+        assert [name for name, _ in dict_store.calls] == ['cache_get', 'try_lock']
+
+ROWS = [
+    ('79175002040', 'a@b', '01.01.2000', 1, 'a', 'b'),
+    ('79175002040', None, None, None, None, None),
+    (79175002041, '', datetime.date(2000, 1, 2), 0, 'a', ''),
+    ('', 'a@b', '02.01.2000', None, None, 'b'),
+    (None, None, None, None, None, None),
+    ('79175002040', 'a@b', '01.01.2000', 1, 'a', 'b'),
+    ('79175002040', 'a@b', None, None, None, None),
+    ('79175002042', 'a@b', '', 1, None, None),
+]
+
+
+class TestScoreBatch:
+
+    def columns(self, rows):
+        return [list(column) for column in zip(*rows)]
+
+    def test_same_as_get_score(self, dict_store, monkeypatch):
+        monkeypatch.setattr('scoring.EARLY_REFRESH', 0)
+        sequential = DictStore()
+        expected = [get_score(sequential, *row) for row in ROWS]
+        # строка с ключом, уже записанным выше, получает значение из кэша
+        assert expected[-2] == 1.5
+        assert score_batch(dict_store, *self.columns(ROWS)) == expected
+        assert calc_scores(*self.columns(ROWS)) == [calc_score(*row) for row in ROWS]
+        assert get_score_keys(*[column for i, column in enumerate(self.columns(ROWS))
+                                if i in (0, 2, 4, 5)]) == \
+            [get_score_key(row[0], row[2], row[4], row[5]) for row in ROWS]
+
+    def test_single_round_trip(self, dict_store):
+        score_batch(dict_store, *self.columns(ROWS), write_behind=False)
+        assert [name for name, _ in dict_store.calls] == ['cache_get_many', 'cache_set_many']
+        # повторяющаяся строка записывается один раз
+        assert len(dict_store.calls[1][1]) == len(ROWS) - 2
+        dict_store.calls.clear()
+        assert score_batch(dict_store, *self.columns(ROWS)) == \
+            score_batch(DictStore(), *self.columns(ROWS))
+        assert [name for name, _ in dict_store.calls] == ['cache_get_many', 'cache_set_many']
+        # без заполненных полей скоринг 0 не кэшируется, как и в get_score
+        assert len(dict_store.calls[1][1]) == 1
+
+    def test_missing_columns(self, dict_store):
+        assert score_batch(dict_store, ['79175002040', ''], ['a@b', 'a@b']) == [3.0, 1.5]
+
+    def test_numpy_columns(self, dict_store, monkeypatch):
+        monkeypatch.setattr('scoring.EARLY_REFRESH', 0)
+        np = pytest.importorskip('numpy')
+        columns = self.columns(ROWS)
+        arrays = [np.array(['79175002040', '', '7'], dtype=str), np.array(['a', '', ''], dtype=str),
+                  np.array(['01.01.2000', '01.01.2000', ''], dtype=str),
+                  np.array([1, None, 0], dtype=object), np.array(['a', 'b', ''], dtype=str),
+                  np.array(['b', 'b', 'b'], dtype=str)]
+        rows = [tuple(str(value) if isinstance(value, np.str_) else value for value in row)
+                for row in zip(*arrays)]
+        assert calc_scores(*arrays) == [calc_score(*row) for row in rows]
+        assert calc_scores(*columns) == [calc_score(*row) for row in ROWS]
+        sequential = DictStore()
+        assert score_batch(dict_store, *arrays) == [get_score(sequential, *row) for row in rows]
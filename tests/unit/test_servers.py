@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+from http.client import HTTPConnection
+from http.server import BaseHTTPRequestHandler
+from threading import Thread
+from time import sleep, monotonic
+import os
+import pytest
+import signal
+from unittest import mock
+from servers import ThreadPoolHTTPServer, PreforkSupervisor
+
+HOST = "localhost"
+DELAY = 0.3
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        sleep(DELAY)
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    srv = ThreadPoolHTTPServer((HOST, 0), SlowHandler, workers=4, backlog=8)
+    t = Thread(target=srv.serve_forever)
+    t.start()
+    yield srv
+    srv.shutdown()
+    t.join()
+    srv.server_close()
+
+
+def get(port, results):
+    connection = HTTPConnection(HOST, port)
+    connection.request("GET", "/")
+    results.append(connection.getresponse().read())
+    connection.close()
+
+
+class TestThreadPoolHTTPServer:
+
+    def test_concurrent_requests(self, server):
+        results = []
+        threads = [Thread(target=get, args=(server.server_address[1], results)) for _ in range(4)]
+        start = monotonic()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert results == [b'ok'] * 4
+        assert monotonic() - start < DELAY * 3
+
+    def test_backlog(self, server):
+        assert server.request_queue_size == 8
+
+
+@pytest.mark.skipif(not hasattr(signal, 'SIGUSR2'), reason='POSIX signals only')
+def test_prefork_forwards_signals():
+    supervisor = PreforkSupervisor(None, 2)
+    supervisor.children = {101: 0, 102: 1}
+    with mock.patch('servers.os.kill') as kill:
+        supervisor.forward(signal.SIGUSR2)
+    assert kill.call_args_list == [mock.call(101, signal.SIGUSR2), mock.call(102, signal.SIGUSR2)]
+
+
+
+@pytest.fixture
+def prefork():
+    """Супервизор с подмененными signal.signal и os.kill"""
+    supervisor = PreforkSupervisor(mock.Mock(), 2)
+    supervisor.restart_delay = 0
+    with mock.patch('servers.signal.signal') as set_handler, \
+            mock.patch('servers.os.kill') as kill:
+        yield supervisor, set_handler, kill
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='POSIX only')
+class TestPreforkSupervisor:
+
+    def test_restarts_dead_worker(self, prefork):
+        supervisor, _, _ = prefork
+        children = []
+
+        def wait():
+            children.append(dict(supervisor.children))
+            if len(children) == 1:
+                return 101, 256
+            if len(children) == 2:
+                supervisor.stop()
+                return 102, 0
+            return 103, 0
+        with mock.patch('servers.os.fork', side_effect=[101, 102, 103]), \
+                mock.patch('servers.os.wait', side_effect=wait):
+            supervisor.run()
+        assert children == [{101: 0, 102: 1}, {102: 1, 103: 0}, {103: 0}]
+        supervisor.server.server_close.assert_called_once_with()
+
+    def test_stop_terminates_children_without_restart(self, prefork):
+        supervisor, set_handler, kill = prefork
+        waits = iter([KeyboardInterrupt(), (101, 15), (102, 15)])
+
+        def wait():
+            result = next(waits)
+            if isinstance(result, BaseException):
+                raise result
+            return result
+        with mock.patch('servers.os.fork', side_effect=[101, 102]) as fork, \
+                mock.patch('servers.os.wait', side_effect=wait):
+            supervisor.run()
+        assert fork.call_count == 2
+        assert kill.call_args_list == [mock.call(101, signal.SIGTERM),
+                                       mock.call(102, signal.SIGTERM)]
+        assert supervisor.children == {}
+        assert mock.call(signal.SIGTERM, supervisor.stop) in set_handler.call_args_list
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+import pytest
+from singleflight import SingleFlight
+
+
+class TestSingleFlight:
+
+    def test_concurrent_calls_coalesced(self):
+        flights = SingleFlight()
+        started, release = threading.Event(), threading.Event()
+        calls, results = [], []
+
+        def compute(value):
+            calls.append(value)
+            started.set()
+            release.wait(1)
+            return value * 2
+
+        def call():
+            results.append(flights.do('key', compute, 21))
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait(1)
+        waiters = [threading.Thread(target=call) for _ in range(5)]
+        for thread in waiters:
+            thread.start()
+        # ожидающие потоки должны дойти до do, пока выполняется первый вызов
+        time.sleep(0.05)
+        release.set()
+        for thread in [leader] + waiters:
+            thread.join(1)
+        assert results == [42] * 6
+        assert calls == [21]
+        assert len(flights) == 0
+
+    def test_sequential_calls_not_cached(self):
+        flights = SingleFlight()
+        assert flights.do('key', lambda: 1) == 1
+        assert flights.do('key', lambda: 2) == 2
+
+    def test_error_shared(self):
+        flights = SingleFlight()
+        started, release = threading.Event(), threading.Event()
+        errors = []
+
+        def fail():
+            started.set()
+            release.wait(1)
+            raise ValueError('failed')
+
+        def call():
+            try:
+                flights.do('key', fail)
+            except ValueError as e:
+                errors.append(e)
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait(1)
+        waiter = threading.Thread(target=call)
+        waiter.start()
+        release.set()
+        leader.join(1)
+        waiter.join(1)
+        assert len(errors) == 2
+        assert len(flights) == 0
+        with pytest.raises(ZeroDivisionError):
+            flights.do('key', lambda: 1 / 0)
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import pytest
+import redis
+from backends import MemoryBackend, RedisBackend, parse_replicas
+from breaker import CLOSED, OPEN
+from custom_erros import StoreUnavailableError
+from store import AsyncStore, Store, POOL_OPTIONS, FAILURE_THRESHOLD
+
+
+class FakeNode:
+    """Первичный узел в памяти, fail=True - узел недоступен"""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.data = {}
+
+    def get(self, key):
+        if self.fail:
+            raise redis.ConnectionError('down')
+        return self.data.get(key)
+
+    def set(self, name, value, ex=None, **kwargs):
+        if self.fail:
+            raise redis.ConnectionError('down')
+        self.data[name] = value
+        return True
+
+
+class TestConnectionPool:
+
+    def test_blocking_pool_from_settings(self):
+        pool = Store(backend='redis').backend._client('key').connection_pool
+        assert isinstance(pool, redis.BlockingConnectionPool)
+        assert pool.max_connections == POOL_OPTIONS['max_connections']
+
+    def test_pool_options_override(self):
+        store = Store(pool_options={'max_connections': 3, 'pool_timeout': 0.5}, backend='redis')
+        pool = store.backend._client('key').connection_pool
+        assert pool.max_connections == 3
+        assert pool.timeout == 0.5
+        assert pool.connection_kwargs['socket_keepalive'] == POOL_OPTIONS['keepalive']
+
+
+class TestSharding:
+
+    def test_nodes(self):
+        store = Store(backend='redis', nodes='localhost:6379, localhost:6380')
+        assert sorted(store.backend._shards) == ['localhost:6379', 'localhost:6380']
+        assert store.backend.ring.get_node('i:1') == store.backend.ring.get_node('i:1')
+
+    def test_host_port_override(self):
+        store = Store(backend='redis', host='localhost', port=6390,
+                      nodes=['localhost:6379', 'localhost:6380'])
+        assert list(store.backend._shards) == ['localhost:6390']
+
+    def test_add_node(self):
+        store = Store(backend='redis', nodes=['localhost:6379'])
+        store.backend.add_node('localhost', 6380)
+        assert len(store.backend.ring.nodes) == 2
+        assert store.backend._executor is not None
+
+    def test_add_node_replaces_executor(self):
+        store = Store(backend='redis', nodes='localhost:6379, localhost:6380',
+                      pool_options={'max_connections': 4})
+        executor = store.backend._executor
+        assert executor._max_workers == 8
+        store.backend.add_node('localhost', 6380)
+        assert store.backend._executor is executor
+        store.backend.add_node('localhost', 6381)
+        assert store.backend._executor._max_workers == 12
+        assert executor._shutdown
+        assert Store(backend='redis', nodes=['localhost:6379']).backend._executor is None
+
+    def test_failed_node_isolated(self):
+        store = Store(backend='redis', nodes='localhost:6379, localhost:6380', l1_size=0,
+                      write_behind_size=0)
+        backend = store.backend
+        assert store.breaker is None
+        down, up = backend._shards['localhost:6379'], backend._shards['localhost:6380']
+        down.primary, up.primary = FakeNode(fail=True), FakeNode()
+        keys = [f'i:{i}' for i in range(100)]
+        down_key = next(key for key in keys if backend.ring.get_node(key) == down.name)
+        up_key = next(key for key in keys if backend.ring.get_node(key) == up.name)
+        for _ in range(FAILURE_THRESHOLD):
+            assert store.cache_get(down_key) is None
+        assert down.breaker.state == OPEN
+        with pytest.raises(StoreUnavailableError):
+            store.get(down_key)
+        assert store.set(up_key, '1')
+        assert store.get(up_key) == '1'
+        assert store.cache_get(up_key) == '1'
+        assert up.breaker.state == CLOSED
+
+
+class TestReplicas:
+
+    def test_parse_replicas(self):
+        nodes = [('localhost', 6379)]
+        assert parse_replicas('localhost:6381, localhost:6382', nodes) == {
+            'localhost:6379': [('localhost', 6381), ('localhost', 6382)]}
+        assert parse_replicas('r:1@a:1,r:2@b:2', [('a', 1), ('b', 2)]) == {
+            'a:1': [('r', 1)], 'b:2': [('r', 2)]}
+        with pytest.raises(ValueError):
+            parse_replicas('r:1', [('a', 1), ('b', 2)])
+
+    def test_store_replicas(self):
+        store = Store(backend='redis', nodes=['localhost:6379'], replicas='localhost:6381')
+        shard = store.backend._shard('key')
+        assert [replica.name for replica in shard.replicas] == ['localhost:6381']
+        assert len(store.backend._all_clients()) == 2
+
+
+class TestBackends:
+
+    def test_backend_from_name(self):
+        assert isinstance(Store(backend='redis').backend, RedisBackend)
+        assert isinstance(Store(backend='memory').backend, MemoryBackend)
+        with pytest.raises(ValueError):
+            Store(backend='unknown')
+
+    def test_backend_instance(self):
+        backend = MemoryBackend()
+        store = Store(backend=backend, l1_size=0)
+        assert store.backend is backend
+        assert store.set('key', 1)
+        assert store.get('key') == '1'
+        assert store.cache_get_many(['key', 'none']) == ['1', None]
+
+
+class TestAsyncStore:
+
+    def test_memory_backend(self):
+        store = AsyncStore(backend='memory')
+        assert isinstance(store.backend, MemoryBackend)
+
+        async def scenario():
+            await store.create_interests()
+            assert await store.get('i:1') == 'cars'
+            assert await store.get_many(['i:2', 'i:0']) == ['pets', None]
+            assert await store.cache_set('uid:1', '1.5', 60)
+            assert await store.cache_get('uid:1') == '1.5'
+            assert await store.ping()
+            await store.disconnect()
+        asyncio.run(scenario())
+
+    def test_backend_validation(self):
+        with pytest.raises(ValueError):
+            AsyncStore(backend='unknown')
+        with pytest.raises(ValueError):
+            AsyncStore(backend=Store(backend='redis').backend)
+        assert AsyncStore(backend='redis').backend is None
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from unittest import mock
+from timings import Phase, finish_timings, record, server_timing, start_timings
+
+
+def test_phases():
+    timings = start_timings()
+    with mock.patch('timings.perf_counter', side_effect=[1.0, 1.5, 2.0, 2.25]):
+        with Phase('validate'):
+            pass
+        with Phase('validate'):
+            pass
+    record('store.get', 0.002)
+    assert timings == {'validate': 0.75, 'store.get': 0.002}
+    assert finish_timings(timings) == {'validate': 750.0, 'store.get': 2.0}
+    assert server_timing(timings) == 'validate;dur=750.000, store.get;dur=2.000'
+
+
+def test_new_request_resets_timings():
+    first = start_timings()
+    record('auth', 1)
+    second = start_timings()
+    record('auth', 2)
+    assert first == {'auth': 1}
+    assert second == {'auth': 2}
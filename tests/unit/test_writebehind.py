@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import gc
+import threading
+import time
+import weakref
+from backends import MemoryBackend
+from store import Store
+from writebehind import WriteBehind
+
+
+class Recorder:
+    """write_many с записью вызовов, может ждать разрешения на запись"""
+
+    def __init__(self, result=True):
+        self.calls = []
+        self.result = result
+        self.allowed = threading.Event()
+        self.allowed.set()
+
+    def __call__(self, mapping, ex=None):
+        self.allowed.wait()
+        self.calls.append((dict(mapping), ex))
+        return self.result
+
+
+def wait_taken(queue):
+    """Ожидание, пока фоновый поток заберет записи из очереди"""
+    for _ in range(100):
+        if not len(queue):
+            return
+        time.sleep(0.01)
+
+
+class TestWriteBehind:
+
+    def test_write(self):
+        recorder = Recorder()
+        queue = WriteBehind(recorder)
+        assert queue.put('a', 1, 60)
+        assert queue.flush(1)
+        assert recorder.calls == [({'a': 1}, 60)]
+        assert queue.stats() == {'depth': 0, 'written': 1, 'failed': 0, 'dropped': 0}
+
+    def test_coalescing_and_batches(self):
+        recorder = Recorder()
+        recorder.allowed.clear()
+        queue = WriteBehind(recorder, batch_size=2)
+        queue.put('first', 0)
+        wait_taken(queue)
+        # фоновый поток занят первой записью, остальные копятся в очереди
+        queue.put_many({'a': 1, 'b': 2}, 60)
+        queue.put('a', 3, 60)
+        queue.put('c', 4, 60)
+        queue.put('d', 5)
+        recorder.allowed.set()
+        assert queue.flush(1)
+        assert recorder.calls[0] == ({'first': 0}, None)
+        assert sorted(recorder.calls[1:], key=str) == sorted(
+            [({'a': 3, 'b': 2}, 60), ({'c': 4}, 60), ({'d': 5}, None)], key=str)
+
+    def test_drop_when_full(self):
+        recorder = Recorder()
+        recorder.allowed.clear()
+        queue = WriteBehind(recorder, maxsize=2)
+        queue.put('first', 0)
+        wait_taken(queue)
+        assert queue.put_many({'a': 1, 'b': 2})
+        assert queue.put('a', 3)
+        assert not queue.put('c', 4)
+        recorder.allowed.set()
+        assert queue.flush(1)
+        assert queue.stats()['dropped'] == 1
+        assert {'c': 4} not in [mapping for mapping, _ in recorder.calls]
+
+    def test_failed_writes(self):
+        queue = WriteBehind(Recorder(result=None))
+        queue.put('a', 1)
+        assert queue.flush(1)
+        assert queue.stats()['failed'] == 1
+
+    def test_close(self):
+        recorder = Recorder()
+        queue = WriteBehind(recorder)
+        recorder.allowed.clear()
+        queue.put('a', 1)
+        thread = queue._thread
+        recorder.allowed.set()
+        queue.put('b', 2)
+        assert queue.close(1)
+        assert not thread.is_alive()
+        # накопленные записи отправлены до остановки
+        assert sum(len(mapping) for mapping, _ in recorder.calls) == 2
+        queue.put('c', 3)
+        assert queue.flush(1)
+        assert queue.stats()['written'] == 3
+        assert queue.close(1)
+
+
+class TestStoreWriteBehind:
+
+    def test_cache_set(self):
+        store = Store(backend=MemoryBackend(), l1_size=0, write_behind_size=10)
+        assert store.cache_set('key', 1.5, 60)
+        assert store.cache_set_many({'a': 1, 'b': 2}, 60)
+        assert store.flush(1)
+        assert store.get_many(['key', 'a', 'b']) == ['1.5', '1', '2']
+
+    def test_synchronous_mode(self):
+        store = Store(backend=MemoryBackend(), l1_size=0, write_behind_size=0)
+        assert store.write_behind is None
+        assert store.cache_set('key', 1)
+        assert store.get('key') == '1'
+
+    def test_disconnect_releases_store(self):
+        store = Store(backend=MemoryBackend(), l1_size=0, write_behind_size=10)
+        store.cache_set('key', 1)
+        store.disconnect()
+        assert store.get('key') == '1'
+        ref = weakref.ref(store)
+        del store
+        gc.collect()
+        assert ref() is None
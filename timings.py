@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+from contextvars import ContextVar
+from time import perf_counter
+from metrics import PHASE_LATENCY
+
+# время фаз текущего запроса в секундах, None вне запроса
+_timings = ContextVar('timings', default=None)
+
+
+def start_timings():
+    """Начало учета фаз нового запроса в текущем потоке или задаче asyncio"""
+    timings = {}
+    _timings.set(timings)
+    return timings
+
+
+def record(name, seconds):
+    """Добавление времени к фазе текущего запроса, повторные вызовы суммируются"""
+    timings = _timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0) + seconds
+
+
+class Phase:
+    """Учет времени блока кода как фазы запроса: with Phase('validate'): ..."""
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.name, perf_counter() - self.start)
+
+
+def finish_timings(timings):
+    """Учет фаз в метриках, время фаз в мс для контекста запроса"""
+    for name, seconds in timings.items():
+        PHASE_LATENCY.observe(seconds, name)
+    return {name: round(seconds * 1000, 3) for name, seconds in timings.items()}
+
+
+def server_timing(timings):
+    """Значение заголовка Server-Timing, время в мс"""
+    return ', '.join(f'{name};dur={seconds * 1000:.3f}' for name, seconds in timings.items())
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import threading
+import weakref
+from metrics import WRITE_BEHIND_DEPTH, WRITE_BEHIND_DROPPED
+
+# максимальное число ключей, ожидающих записи
+DEFAULT_MAXSIZE = 10000
+# максимальное число ключей в одной пакетной записи
+DEFAULT_BATCH_SIZE = 500
+
+_queues = weakref.WeakSet()
+WRITE_BEHIND_DEPTH.set_function(lambda: sum(len(queue) for queue in list(_queues)))
+
+
+class WriteBehind:
+    """Отложенная запись в кэш из фонового потока
+
+    put не ждет хранилище: запись попадает в очередь, повторные записи
+    одного ключа до отправки объединяются. Фоновый поток забирает все
+    накопленные записи и передает их write_many(mapping, ex) пачками
+    не больше batch_size ключей. При переполнении очереди новые ключи
+    отбрасываются - кэш будет заполнен при следующем промахе.
+    """
+
+    def __init__(self, write_many, maxsize=DEFAULT_MAXSIZE, batch_size=DEFAULT_BATCH_SIZE):
+        self.write_many = write_many
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+        self._pending = {}
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+        self._stopping = False
+        _queues.add(self)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _ensure_worker(self):
+        """Запуск фонового потока, в том числе заново после fork и close"""
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            self._pid = os.getpid()
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='store-write-behind',
+                                            daemon=True)
+            self._thread.start()
+
+    def put(self, name, value, ex=None):
+        return self.put_many({name: value}, ex)
+
+    def put_many(self, mapping, ex=None):
+        """Постановка записей в очередь, возвращает False, если часть записей отброшена"""
+        dropped = 0
+        with self._cond:
+            self._ensure_worker()
+            for name, value in mapping.items():
+                if name not in self._pending and len(self._pending) >= self.maxsize:
+                    dropped += 1
+                    continue
+                self._pending[name] = (value, ex)
+            self.dropped += dropped
+            # кроме фонового потока условие могут ждать вызовы flush
+            self._cond.notify_all()
+        if dropped:
+            WRITE_BEHIND_DROPPED.inc(amount=dropped)
+            logging.debug('Write-behind queue is full, %s writes dropped', dropped)
+        return not dropped
+
+    def _take(self):
+        """Все накопленные записи, сгруппированные по времени жизни, None после close"""
+        with self._cond:
+            while not self._pending:
+                if self._stopping:
+                    return None
+                self._cond.wait()
+            pending, self._pending = self._pending, {}
+            self._in_flight = len(pending)
+        groups = {}
+        for name, (value, ex) in pending.items():
+            groups.setdefault(ex, {})[name] = value
+        return groups
+
+    def _run(self):
+        while True:
+            groups = self._take()
+            if groups is None:
+                return
+            for ex, mapping in groups.items():
+                names = list(mapping)
+                for i in range(0, len(names), self.batch_size):
+                    batch = {name: mapping[name] for name in names[i:i + self.batch_size]}
+                    try:
+                        ok = self.write_many(batch, ex)
+                    except Exception as e:
+                        logging.info('Write-behind failed: %s', e)
+                        ok = False
+                    if ok:
+                        self.written += len(batch)
+                    else:
+                        self.failed += len(batch)
+            with self._cond:
+                self._in_flight = 0
+                self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """Ожидание отправки всех записей, возвращает False по истечении timeout"""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and not self._in_flight,
+                                       timeout)
+
+    def close(self, timeout=None):
+        """Запись накопленного и остановка фонового потока
+
+        Поток ссылается на очередь и через write_many на Store, без остановки
+        они не освобождаются. Следующий put запустит поток заново.
+        Возвращает False, если поток не завершился за timeout.
+        """
+        with self._cond:
+            thread = self._thread if self._pid == os.getpid() else None
+            if thread is None:
+                self._thread = None
+                return True
+            self._stopping = True
+            self._cond.notify_all()
+        thread.join(timeout)
+        if thread.is_alive():
+            return False
+        with self._cond:
+            if self._thread is thread:
+                self._thread = None
+        return True
+
+    def stats(self):
+        """Длина очереди и счетчики записанных, неудачных и отброшенных записей"""
+        return {
+            'depth': len(self._pending),
+            'written': self.written,
+            'failed': self.failed,
+            'dropped': self.dropped,
+        }